@@ -0,0 +1,120 @@
+"""
+Measure what response compression buys on the real API responses.
+
+Fetches each GET scenario of endpoints.py uncompressed through the Django
+test client, then compresses the body with every available encoding at a
+range of levels and reports, per scenario and setting: compressed size,
+bytes saved, CPU time per response and that time as a share of the request's
+own server time. The levels configured in COMPRESSION_LEVELS are marked
+with '*'.
+
+Seed the database first (see endpoints.py). Usage (from backend/):
+    python benchmarks/compression.py
+    python benchmarks/compression.py --only orders.list.manager --json compression.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+
+from endpoints import SCENARIOS, build_context  # also sets up Django
+
+from django.conf import settings  # noqa: E402
+from django.test import Client  # noqa: E402
+
+from core.compression import FASTEST, available_encodings, compress  # noqa: E402
+
+LEVELS = {
+    'gzip': (1, 6, 9),
+    'br': (0, 4, 6, 11),
+    'zstd': (1, 3, 9, 19),
+}
+
+
+def fetch(client, path, iterations):
+    """Uncompressed body and median server time of `path`"""
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.get(path, HTTP_ACCEPT_ENCODING='identity')
+        timings.append(time.perf_counter() - started)
+    if response.status_code >= 400 or response.has_header('Content-Encoding'):
+        return None, None
+    body = b''.join(response.streaming_content) if response.streaming else response.content
+    return body, statistics.median(timings)
+
+
+def cpu_time(encoding, body, level, repeat):
+    started = time.process_time()
+    for _ in range(repeat):
+        size = len(compress(encoding, body, level))
+    return size, (time.process_time() - started) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--prefix', default='load', help='seed_scale --prefix of the seeded users')
+    parser.add_argument('--iterations', type=int, default=5, help='Requests per scenario for the server time')
+    parser.add_argument('--repeat', type=int, default=20, help='Compressions per measurement')
+    parser.add_argument('--only', nargs='+', help='Run only these scenarios')
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    context = build_context(args.prefix, 0)
+    clients = {}
+    for role, user in context['users'].items():
+        clients[role] = Client()
+        clients[role].force_login(user)
+
+    encodings = [encoding for encoding in settings.COMPRESSION_ENCODINGS if encoding in available_encodings()]
+    missing = sorted(set(LEVELS) - available_encodings())
+    if missing:
+        print(f"Not installed, skipped: {', '.join(missing)}")
+
+    results = {}
+    print(f"{'scenario':<24}{'encoding':>10}{'bytes':>10}{'saved':>8}{'cpu ms':>9}{'of req':>8}")
+    for scenario in SCENARIOS:
+        if scenario.method != 'GET' or (args.only and scenario.name not in args.only):
+            continue
+        path, _ = scenario.request_args(context)
+        body, server_time = fetch(clients[scenario.role], path, args.iterations)
+        if body is None:
+            print(f'{scenario.name:<24} skipped (error or already encoded)')
+            continue
+        rows = []
+        print(f"{scenario.name:<24}{'identity':>10}{len(body):>10}{'':>8}{'':>9}{'':>8}")
+        for encoding in encodings:
+            configured = settings.COMPRESSION_LEVELS[encoding]
+            if len(body) > settings.COMPRESSION_FAST_ABOVE:
+                configured = FASTEST[encoding]
+            for level in sorted(set(LEVELS[encoding]) | {configured}):
+                size, seconds = cpu_time(encoding, body, level, args.repeat)
+                row = {
+                    'encoding': encoding,
+                    'level': level,
+                    'configured': level == configured,
+                    'bytes': size,
+                    'saved_ratio': round(1 - size / len(body), 4) if body else 0,
+                    'cpu_ms': round(seconds * 1000, 3),
+                    'share_of_request': round(seconds / server_time, 4) if server_time else 0,
+                }
+                rows.append(row)
+                label = f"{encoding}-{level}{'*' if row['configured'] else ''}"
+                print(f"{'':<24}{label:>10}{size:>10}{row['saved_ratio']:>8.1%}{row['cpu_ms']:>9.3f}"
+                      f"{row['share_of_request']:>8.1%}")
+        results[scenario.name] = {
+            'bytes': len(body),
+            'server_ms': round(server_time * 1000, 2),
+            'compressed': rows,
+        }
+
+    if args.json_path:
+        with open(args.json_path, 'w') as handle:
+            json.dump({'levels': settings.COMPRESSION_LEVELS, 'scenarios': results}, handle, indent=2)
+            handle.write('\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
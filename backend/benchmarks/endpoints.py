@@ -0,0 +1,404 @@
+"""
+Benchmark the main API endpoints and gate against stored baselines.
+
+Each scenario is timed through the Django test client (`--mode client`,
+which also records SQL query counts and peak Python allocations per request)
+or over HTTP against a real server (`--mode server`), in --rounds separate
+rounds; every latency statistic reported is the median over the rounds.
+Results are compared with baselines/<mode>.json; the run fails if any
+scenario's best latency (the median of its fastest round) or allocations
+grow by more than --threshold (and --min-delta-ms), or its query count
+grows at all. Noise on a shared machine only ever slows rounds down, so the
+fastest round is the stable figure; tail latencies (p95/p99) are reported
+but not gated, they move more than any useful threshold between identical
+runs.
+
+Seed the database first so numbers are comparable between runs:
+    python src/manage.py seed_scale --customers 500 --orders 5000 --products 200
+
+Usage (from backend/):
+    python benchmarks/endpoints.py --mode client
+    python benchmarks/endpoints.py --mode server                 # starts runserver
+    python benchmarks/endpoints.py --mode server --base-url http://127.0.0.1:8000
+    python benchmarks/endpoints.py --mode client --save-baseline # after an intended change
+
+Client mode rolls back the writes of every scenario run, so each one sees
+the seeded data. Server mode cannot: it adds cart items,
+creates orders and accepts pending orders in the seeded data.
+
+Rate limiting is switched off (THROTTLE_ENABLED=False) for client mode and
+the runserver it starts; start a server given with --base-url the same way.
+"""
+import argparse
+import http.cookiejar
+import itertools
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = BACKEND_DIR / 'src'
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+
+sys.path.insert(0, str(SRC_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
+# Benchmarks send far more requests per user than the rate limits allow;
+# also passed on to the runserver started in server mode
+os.environ.setdefault('THROTTLE_ENABLED', 'False')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.db import connection, transaction  # noqa: E402
+from django.test import Client  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from orders.models import Order  # noqa: E402
+from products.models import Product  # noqa: E402
+from users.models import CustomUser  # noqa: E402
+
+
+class Scenario:
+    def __init__(self, name, role, method, path, body=None):
+        self.name = name
+        self.role = role
+        self.method = method
+        self.path = path  # str or callable(context) -> str
+        self.body = body  # None or callable(context) -> dict
+
+    def request_args(self, context):
+        path = self.path(context) if callable(self.path) else self.path
+        body = self.body(context) if self.body else None
+        return path, body
+
+
+SCENARIOS = [
+    Scenario('products.list', 'CUSTOMER', 'GET', '/api/products/'),
+    Scenario('products.search', 'CUSTOMER', 'GET', '/api/products/?search=Fungicide'),
+    Scenario('products.stats', 'MANAGER', 'GET', '/api/products/stats/'),
+    Scenario('cart.view', 'CUSTOMER', 'GET', '/api/shopping-cart/'),
+    Scenario('cart.add_item', 'CUSTOMER', 'POST', '/api/shopping-cart/add_item/',
+             lambda ctx: {'product_id': next(ctx['products']), 'quantity': 1}),
+    Scenario('cart.update_cart', 'CUSTOMER', 'POST', '/api/shopping-cart/update_cart/',
+             lambda ctx: {'items': [{'product_id': next(ctx['products']), 'quantity': 2} for _ in range(5)]}),
+    Scenario('orders.create', 'CUSTOMER', 'POST', '/api/orders/',
+             lambda ctx: {
+                 'shipping_address': 'Benchmark Road',
+                 'items': [{'product_id': next(ctx['products']), 'quantity': 3} for _ in range(3)],
+             }),
+    Scenario('orders.list.customer', 'CUSTOMER', 'GET', '/api/orders/'),
+    Scenario('orders.list.employee', 'EMPLOYEE', 'GET', '/api/orders/'),
+    Scenario('orders.list.manager', 'MANAGER', 'GET', '/api/orders/?status=pending'),
+    Scenario('orders.accept', 'MANAGER', 'POST', lambda ctx: f"/api/orders/{next(ctx['pending'])}/accept/"),
+    Scenario('users.list', 'MANAGER', 'GET', '/api/users/'),
+    Scenario('users.customers', 'EMPLOYEE', 'GET', '/api/users/get_customers/'),
+    Scenario('users.stats', 'MANAGER', 'GET', '/api/users/stats/'),
+    Scenario('admin.users', 'MANAGER', 'GET', '/api/admin/manage/'),
+]
+
+
+def build_context(prefix, requests_per_scenario):
+    users = {}
+    for role in ('CUSTOMER', 'EMPLOYEE', 'MANAGER'):
+        user = CustomUser.objects.filter(username__startswith=f'{prefix}_{role.lower()}_').order_by('username').first()
+        if user is None:
+            sys.exit(f'No {role} with prefix "{prefix}_"; run manage.py seed_scale first')
+        users[role] = user
+
+    product_ids = list(Product.objects.filter(is_active=True, stock__gt=100).order_by('id').values_list('id', flat=True))
+    # orders.accept needs a fresh pending order per request
+    pending = list(Order.objects.filter(status='pending').order_by('id').values_list('id', flat=True)[:requests_per_scenario])
+    if not product_ids or len(pending) < requests_per_scenario:
+        sys.exit('Not enough seeded products or pending orders; seed a larger data set')
+    return {
+        'users': users,
+        'products': itertools.cycle(product_ids),
+        'pending': iter(pending),
+    }
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def combine(rounds):
+    """One result from several rounds of a scenario: median of every statistic"""
+    combined = {'requests': sum(row['requests'] for row in rounds), 'errors': sum(row['errors'] for row in rounds)}
+    for key in ('mean_ms', 'p50_ms', 'p95_ms', 'p99_ms'):
+        combined[key] = round(statistics.median(row[key] for row in rounds), 2)
+    combined['best_ms'] = min(row['p50_ms'] for row in rounds)
+    for key in ('queries', 'alloc_kb'):
+        values = [row[key] for row in rounds if row[key] is not None]
+        combined[key] = max(values) if key == 'queries' and values else (
+            round(statistics.median(values), 1) if values else None)
+    return combined
+
+
+def summarize(latencies, errors, queries=None, alloc_kb=None):
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries': queries,
+        'alloc_kb': alloc_kb,
+    }
+
+
+class TestClientRunner:
+    def __init__(self, context):
+        self.context = context
+        self.clients = {}
+        for role, user in context['users'].items():
+            client = Client()
+            client.force_login(user)
+            self.clients[role] = client
+
+    def send(self, scenario):
+        path, body = scenario.request_args(self.context)
+        client = self.clients[scenario.role]
+        if scenario.method == 'GET':
+            response = client.get(path)
+        else:
+            response = client.generic(scenario.method, path, json.dumps(body or {}), content_type='application/json')
+        return response.status_code
+
+    def run(self, scenario, iterations, warmup):
+        for _ in range(warmup):
+            self.send(scenario)
+
+        latencies, errors = [], 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            status = self.send(scenario)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= 400
+
+        # Profile one extra request separately so tracing does not skew timings
+        tracemalloc.start()
+        with CaptureQueriesContext(connection) as captured:
+            self.send(scenario)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return summarize(latencies, errors, len(captured.captured_queries), round(peak / 1024, 1))
+
+
+class ServerRunner:
+    def __init__(self, context, base_url, password):
+        self.context = context
+        self.base_url = base_url.rstrip('/')
+        self.sessions = {role: self.login(user.username, password) for role, user in context['users'].items()}
+
+    def login(self, username, password):
+        jar = http.cookiejar.CookieJar()
+        opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+        opener.open(f'{self.base_url}/api/auth/csrf/').read()
+        session = (opener, jar)
+        status = self.request(session, 'POST', '/api/auth/login/', {'username': username, 'password': password})
+        if status != 200:
+            sys.exit(f'Login failed for {username} (HTTP {status})')
+        return session
+
+    def request(self, session, method, path, body=None):
+        opener, jar = session
+        csrf = next((cookie.value for cookie in jar if cookie.name == settings.CSRF_COOKIE_NAME), '')
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=json.dumps(body).encode() if body is not None else None,
+            method=method,
+            headers={'Content-Type': 'application/json', 'X-CSRFToken': csrf, 'Referer': self.base_url + '/'},
+        )
+        try:
+            with opener.open(request) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code
+
+    def send(self, scenario):
+        path, body = scenario.request_args(self.context)
+        if scenario.method != 'GET' and body is None:
+            body = {}
+        return self.request(self.sessions[scenario.role], scenario.method, path, body)
+
+    def run(self, scenario, iterations, warmup):
+        for _ in range(warmup):
+            self.send(scenario)
+        latencies, errors = [], 0
+        for _ in range(iterations):
+            start = time.perf_counter()
+            status = self.send(scenario)
+            latencies.append(time.perf_counter() - start)
+            errors += status >= 400
+        return summarize(latencies, errors)
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_runserver():
+    port = free_port()
+    process = subprocess.Popen(
+        [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload'],
+        cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    sys.exit('runserver did not start')
+
+
+@contextmanager
+def rolled_back():
+    """Undo one scenario's writes so every round and scenario starts from the seeded data"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def run_rounds(runner, scenarios, args, isolate=nullcontext):
+    """Run all scenarios --rounds times, interleaved so slow spells hit every scenario alike"""
+    rounds = {scenario.name: [] for scenario in scenarios}
+    for _ in range(args.rounds):
+        for scenario in scenarios:
+            with isolate():
+                rounds[scenario.name].append(runner.run(scenario, args.iterations, args.warmup))
+    return {name: combine(rows) for name, rows in rounds.items()}
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Return a list of regression messages against the baseline"""
+    failures = []
+    for name, result in results.items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        base_ms = base.get('best_ms', base['p50_ms'])
+        allowed_ms = max(base_ms * (1 + threshold), base_ms + min_delta_ms)
+        if result['best_ms'] > allowed_ms:
+            failures.append(f"{name}: best round median {result['best_ms']}ms > baseline {base_ms}ms")
+        if result['queries'] is not None and base.get('queries') is not None and result['queries'] > base['queries']:
+            failures.append(f"{name}: {result['queries']} queries > baseline {base['queries']}")
+        if result['alloc_kb'] is not None and base.get('alloc_kb') is not None \
+                and result['alloc_kb'] > base['alloc_kb'] * (1 + threshold):
+            failures.append(f"{name}: {result['alloc_kb']}KB allocated > baseline {base['alloc_kb']}KB")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--mode', choices=['client', 'server'], default='client')
+    parser.add_argument('--base-url', help='Server mode: benchmark this server instead of starting runserver')
+    parser.add_argument('--prefix', default='load', help='seed_scale --prefix of the seeded users')
+    parser.add_argument('--password', default='loadtest123', help='seed_scale --password (server mode login)')
+    parser.add_argument('--iterations', type=int, default=30)
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--rounds', type=int, default=3, help='Rounds per scenario; statistics are medians over rounds')
+    parser.add_argument('--only', nargs='+', help='Run only these scenarios')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed relative regression (0.25 = 25%%)')
+    parser.add_argument('--min-delta-ms', type=float, default=2.0, help='Ignore latency changes smaller than this')
+    parser.add_argument('--baseline', help='Baseline file (default: baselines/<mode>.json)')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results as the new baseline')
+    parser.add_argument('--json', dest='json_path', help='Also write the results to this file')
+    args = parser.parse_args()
+
+    scenarios = [scenario for scenario in SCENARIOS if not args.only or scenario.name in args.only]
+    dataset = {
+        'users': CustomUser.objects.count(),
+        'products': Product.objects.count(),
+        'orders': Order.objects.count(),
+    }
+    context = build_context(args.prefix, (args.iterations + args.warmup + 1) * args.rounds)
+    baseline_path = Path(args.baseline) if args.baseline else BASELINE_DIR / f'{args.mode}.json'
+
+    results = {}
+    process = None
+    if args.mode == 'client':
+        # Keep the seeded data unchanged between runs
+        with transaction.atomic():
+            runner = TestClientRunner(context)
+            results = run_rounds(runner, scenarios, args, isolate=rolled_back)
+            transaction.set_rollback(True)
+    else:
+        base_url = args.base_url
+        if not base_url:
+            process, base_url = start_runserver()
+        try:
+            runner = ServerRunner(context, base_url, args.password)
+            results = run_rounds(runner, scenarios, args)
+        finally:
+            if process:
+                process.terminate()
+                process.wait()
+
+    print(f"{'scenario':<24}{'err':>5}{'mean':>9}{'p50':>9}{'best':>9}{'p95':>9}{'p99':>9}{'queries':>9}{'alloc KB':>10}")
+    for name, row in results.items():
+        print(f"{name:<24}{row['errors']:>5}{row['mean_ms']:>9}{row['p50_ms']:>9}{row['best_ms']:>9}"
+              f"{row['p95_ms']:>9}{row['p99_ms']:>9}"
+              f"{row['queries'] if row['queries'] is not None else '-':>9}"
+              f"{row['alloc_kb'] if row['alloc_kb'] is not None else '-':>10}")
+
+    report = {
+        'mode': args.mode,
+        'dataset': dataset,
+        'iterations': args.iterations,
+        'rounds': args.rounds,
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'scenarios': results,
+    }
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2) + '\n')
+
+    errors = [name for name, row in results.items() if row['errors']]
+    if errors:
+        print(f"Requests failed in: {', '.join(errors)}")
+
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(exist_ok=True)
+        baseline_path.write_text(json.dumps(report, indent=2) + '\n')
+        print(f'Baseline written to {baseline_path}')
+        return 1 if errors else 0
+
+    if not baseline_path.exists():
+        print(f'No baseline at {baseline_path}; run with --save-baseline to create one')
+        return 1 if errors else 0
+
+    baseline = json.loads(baseline_path.read_text())
+    if baseline.get('dataset') and baseline['dataset'] != dataset:
+        print(f"WARNING baseline was recorded on {baseline['dataset']}, this run is on {dataset}")
+    failures = compare(results, baseline, args.threshold, args.min_delta_ms)
+    for failure in failures:
+        print(f'REGRESSION {failure}')
+    if not failures:
+        print(f'No regressions against {baseline_path.name}')
+    return 1 if failures or errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
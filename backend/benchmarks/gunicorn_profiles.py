@@ -0,0 +1,194 @@
+"""
+Load-test the gunicorn worker profiles defined in gunicorn_config.py.
+
+Each profile is started on its own port, warmed up, and then driven with a
+fixed number of requests at a fixed concurrency so runs are comparable.
+
+Usage (from backend/):
+    python benchmarks/gunicorn_profiles.py --profiles sync gthread \
+        --path /api/products/ --requests 2000 --concurrency 32
+"""
+import argparse
+import http.client
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = BACKEND_DIR / 'src'
+CONFIG = BACKEND_DIR / 'gunicorn_config.py'
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=1):
+                return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def start_server(profile, port, workers=None, threads=None):
+    env = os.environ.copy()
+    env.update({
+        'GUNICORN_PROFILE': profile,
+        'GUNICORN_BIND': f'127.0.0.1:{port}',
+        'GUNICORN_ACCESSLOG': '-' if env.get('BENCH_ACCESSLOG') else '/dev/null',
+        'GUNICORN_ERRORLOG': '-',
+        'GUNICORN_LOGLEVEL': 'warning',
+    })
+    env.setdefault('THROTTLE_ENABLED', 'False')  # measure the workers, not the rate limits
+    if workers:
+        env['GUNICORN_WORKERS'] = str(workers)
+    if threads:
+        env['GUNICORN_THREADS'] = str(threads)
+    return subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', str(CONFIG), 'core.wsgi:application'],
+        cwd=SRC_DIR,
+        env=env,
+        start_new_session=True,
+    )
+
+
+def stop_server(process):
+    try:
+        os.killpg(process.pid, signal.SIGTERM)
+        process.wait(timeout=15)
+    except (ProcessLookupError, subprocess.TimeoutExpired):
+        os.killpg(process.pid, signal.SIGKILL)
+
+
+class Worker:
+    """One keep-alive client connection, used by a single load thread."""
+
+    def __init__(self, port):
+        self.port = port
+        self.conn = None
+
+    def request(self, path):
+        if self.conn is None:
+            self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+        start = time.perf_counter()
+        try:
+            self.conn.request('GET', path)
+            response = self.conn.getresponse()
+            response.read()
+            status = response.status
+            if response.getheader('Connection', '').lower() == 'close':
+                self.conn.close()
+                self.conn = None
+        except (OSError, http.client.HTTPException):
+            self.conn.close()
+            self.conn = None
+            status = 0
+        return time.perf_counter() - start, status
+
+
+def drive(port, paths, total, concurrency):
+    local = threading.local()
+    results = []
+    lock = threading.Lock()
+
+    def one(index):
+        if not hasattr(local, 'worker'):
+            local.worker = Worker(port)
+        elapsed, status = local.worker.request(paths[index % len(paths)])
+        with lock:
+            results.append((elapsed, status))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    wall = time.perf_counter() - started
+    return wall, results
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def summarize(profile, wall, results):
+    latencies = sorted(elapsed for elapsed, _ in results)
+    errors = sum(1 for _, status in results if status == 0 or status >= 500)
+    return {
+        'profile': profile,
+        'requests': len(results),
+        'errors': errors,
+        'throughput_rps': round(len(results) / wall, 1) if wall else 0.0,
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=['sync', 'gthread'],
+                        choices=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--path', action='append', dest='paths',
+                        help='Request path, may be repeated (default: /api/products/)')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--warmup', type=int, default=50)
+    parser.add_argument('--workers', type=int, help='Override GUNICORN_WORKERS for every profile')
+    parser.add_argument('--threads', type=int, help='Override GUNICORN_THREADS for the gthread profile')
+    parser.add_argument('--json', dest='json_path', help='Write the results to this file')
+    args = parser.parse_args()
+    paths = args.paths or ['/api/products/']
+
+    report = []
+    for profile in args.profiles:
+        if profile == 'gevent':
+            try:
+                import gevent  # noqa: F401
+            except ImportError:
+                print('Skipping gevent profile: gevent is not installed')
+                continue
+        port = free_port()
+        process = start_server(profile, port, workers=args.workers, threads=args.threads)
+        try:
+            if not wait_until_ready(port):
+                print(f'{profile}: server did not start')
+                continue
+            drive(port, paths, args.warmup, min(args.concurrency, args.warmup or 1))
+            wall, results = drive(port, paths, args.requests, args.concurrency)
+            report.append(summarize(profile, wall, results))
+        finally:
+            stop_server(process)
+
+    header = f"{'profile':<10}{'req':>8}{'err':>6}{'rps':>10}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+    print(header)
+    for row in report:
+        print(f"{row['profile']:<10}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>10}"
+              f"{row['mean_ms']:>10}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps({
+            'paths': paths,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'results': report,
+        }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,436 @@
+"""
+Drive the API with concurrent virtual users replaying realistic role flows.
+
+Each virtual user loops for --duration seconds, picking a weighted scenario:
+
+  browse     anonymous catalogue browsing (list, search, product detail)
+  customer   customer adds to cart, reviews it and places an order
+  employee   employee lists assigned customers and orders for one of them
+  manager    manager reviews pending orders, accepts/rejects one, checks stats
+  postman    replays the requests in postman_collection.json as a manager
+
+Logins follow the frontend: GET the CSRF cookie, POST credentials, then send
+the session cookie and X-CSRFToken on every unsafe request. Accounts are the
+ones created by `manage.py seed_scale` (same --prefix and --password).
+
+Reports throughput, error rates and a latency histogram per request type.
+Start the server under test with THROTTLE_ENABLED=False (or rates above the
+load you generate), otherwise most requests are answered 429.
+
+Usage (from backend/):
+    python benchmarks/load.py --base-url http://127.0.0.1:8000 --concurrency 50 --duration 60
+    python benchmarks/load.py --mix browse=6,customer=3,employee=1 --json load.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import statistics
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit
+
+COLLECTION = Path(__file__).resolve().parent.parent.parent / 'postman_collection.json'
+HISTOGRAM_BUCKETS_MS = [5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000]
+DEFAULT_MIX = 'browse=5,customer=3,employee=1,manager=1,postman=0'
+SEARCH_TERMS = ['Herbicide', 'Insecticide', 'Fungicide', 'Fertilizer', 'neem', 'organic']
+
+
+class HttpError(Exception):
+    pass
+
+
+class Connection:
+    """Minimal HTTP/1.1 keep-alive client on asyncio streams"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except OSError:
+                pass
+        self.reader = self.writer = None
+
+    async def request(self, method, path, headers, body=b''):
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f'{method} {path} HTTP/1.1', f'Host: {self.host}:{self.port}', f'Content-Length: {len(body)}']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body)
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise HttpError('connection closed by server')
+        status = int(status_line.split()[1])
+        response_headers = []
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').rstrip('\r\n')
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            response_headers.append((name.strip().lower(), value.strip()))
+        header_map = dict(response_headers)
+
+        if header_map.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            payload = b''.join(chunks)
+        elif 'content-length' in header_map:
+            payload = await self.reader.readexactly(int(header_map['content-length']))
+        else:
+            payload = await self.reader.read()
+            await self.close()
+        if header_map.get('connection', '').lower() == 'close':
+            await self.close()
+        return status, response_headers, payload
+
+
+class Session:
+    """One browser: a connection plus cookies, optionally logged in"""
+
+    def __init__(self, runner):
+        self.runner = runner
+        self.connection = Connection(runner.host, runner.port)
+        self.cookies = {}
+
+    async def send(self, label, method, path, data=None, expect=(200, 201)):
+        body = json.dumps(data).encode() if data is not None else b''
+        headers = {'Accept': 'application/json', 'Referer': self.runner.base_url + '/'}
+        if data is not None:
+            headers['Content-Type'] = 'application/json'
+        if 'csrftoken' in self.cookies and method not in ('GET', 'HEAD'):
+            headers['X-CSRFToken'] = self.cookies['csrftoken']
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+
+        start = time.perf_counter()
+        try:
+            status, response_headers, payload = await self.connection.request(method, path, headers, body)
+        except (OSError, HttpError, asyncio.IncompleteReadError, ValueError) as exc:
+            await self.connection.close()
+            self.runner.record(label, time.perf_counter() - start, f'error:{type(exc).__name__}')
+            return None
+        self.runner.record(label, time.perf_counter() - start, status if status not in expect else None)
+
+        for name, value in response_headers:
+            if name == 'set-cookie':
+                cookie, _, _ = value.partition(';')
+                cookie_name, _, cookie_value = cookie.partition('=')
+                self.cookies[cookie_name.strip()] = cookie_value.strip()
+        if status not in expect:
+            return None
+        try:
+            return json.loads(payload) if payload else {}
+        except ValueError:
+            return {}
+
+    async def login(self, username, password):
+        await self.send('GET /api/auth/csrf/', 'GET', '/api/auth/csrf/')
+        result = await self.send('POST /api/auth/login/', 'POST', '/api/auth/login/',
+                                 {'username': username, 'password': password})
+        return result is not None
+
+    async def close(self):
+        await self.connection.close()
+
+
+def results_of(data):
+    """List endpoints return either a plain list or a paginated {'results': [...]}"""
+    if isinstance(data, dict):
+        return data.get('results', [])
+    return data or []
+
+
+class VirtualUser:
+    def __init__(self, runner, index):
+        self.runner = runner
+        self.index = index
+        self.rng = random.Random(runner.args.seed + index)
+        self.sessions = {}
+
+    def account(self, role):
+        count = getattr(self.runner.args, f'{role.lower()}s')
+        return f'{self.runner.args.prefix}_{role.lower()}_{self.index % count:07d}'
+
+    async def session(self, role=None):
+        if role not in self.sessions:
+            session = Session(self.runner)
+            if role and not await session.login(self.account(role), self.runner.args.password):
+                await session.close()
+                return None
+            self.sessions[role] = session
+        return self.sessions[role]
+
+    async def close(self):
+        for session in self.sessions.values():
+            await session.close()
+
+    async def pick_products(self, session, count):
+        products = results_of(await session.send('GET /api/products/', 'GET', '/api/products/'))
+        in_stock = [product for product in products if product.get('stock', 0) > 10]
+        return self.rng.sample(in_stock, min(count, len(in_stock)))
+
+    async def browse(self):
+        session = await self.session()
+        products = results_of(await session.send('GET /api/products/', 'GET', '/api/products/'))
+        term = self.rng.choice(SEARCH_TERMS)
+        await session.send('GET /api/products/?search=', 'GET', f'/api/products/?search={term}')
+        for product in self.rng.sample(products, min(2, len(products))):
+            await session.send('GET /api/products/{id}/', 'GET', f"/api/products/{product['id']}/")
+
+    async def customer(self):
+        session = await self.session('CUSTOMER')
+        if session is None:
+            return
+        products = await self.pick_products(session, self.rng.randint(1, 4))
+        for product in products:
+            await session.send('POST /api/shopping-cart/add_item/', 'POST', '/api/shopping-cart/add_item/',
+                               {'product_id': product['id'], 'quantity': self.rng.randint(1, 3)})
+        cart = await session.send('GET /api/shopping-cart/', 'GET', '/api/shopping-cart/')
+        items = [
+            {'product_id': item['product']['id'], 'quantity': item['quantity']}
+            for item in (cart or {}).get('items', [])
+        ]
+        if items:
+            await session.send('POST /api/orders/', 'POST', '/api/orders/',
+                               {'shipping_address': 'Load Test Road', 'items': items})
+            await session.send('POST /api/shopping-cart/clear/', 'POST', '/api/shopping-cart/clear/')
+        await session.send('GET /api/orders/', 'GET', '/api/orders/')
+
+    async def employee(self):
+        session = await self.session('EMPLOYEE')
+        if session is None:
+            return
+        customers = await session.send('GET /api/users/get_customers/', 'GET', '/api/users/get_customers/')
+        products = await self.pick_products(session, self.rng.randint(1, 3))
+        if customers and products:
+            customer = self.rng.choice(customers)
+            await session.send('POST /api/orders/ (for customer)', 'POST', '/api/orders/', {
+                'user_id': customer['id'],
+                'shipping_address': customer.get('address') or 'Load Test Road',
+                'items': [{'product_id': product['id'], 'quantity': self.rng.randint(1, 5)} for product in products],
+                'location_state': 'Telangana',
+                'location_display_name': 'Hyderabad, Telangana, India',
+                'location_latitude': round(self.rng.uniform(17.2, 17.6), 6),
+                'location_longitude': round(self.rng.uniform(78.3, 78.7), 6),
+            })
+        await session.send('GET /api/orders/', 'GET', '/api/orders/')
+
+    async def manager(self):
+        session = await self.session('MANAGER')
+        if session is None:
+            return
+        pending = results_of(await session.send('GET /api/orders/?status=pending', 'GET', '/api/orders/?status=pending'))
+        if pending:
+            order = self.rng.choice(pending[:20])
+            decision = 'accept' if self.rng.random() < 0.8 else 'reject'
+            # 409 means another manager got there first, which is expected under load
+            await session.send(f'POST /api/orders/{{id}}/{decision}/', 'POST', f"/api/orders/{order['id']}/{decision}/",
+                               expect=(200, 409))
+        await session.send('GET /api/users/stats/', 'GET', '/api/users/stats/')
+
+    async def postman(self):
+        session = await self.session('MANAGER')
+        if session is None:
+            return
+        for method, path, _ in self.runner.collection:
+            if path.startswith('/api/auth/'):
+                continue  # already logged in
+            await session.send(f'{method} {path}', method, path)
+
+    async def run(self, deadline):
+        scenarios, weights = zip(*self.runner.mix.items())
+        while time.monotonic() < deadline:
+            scenario = self.rng.choices(scenarios, weights)[0]
+            started = time.perf_counter()
+            await getattr(self, scenario)()
+            self.runner.scenarios[scenario].append(time.perf_counter() - started)
+            if self.runner.args.think_ms:
+                await asyncio.sleep(self.rng.expovariate(1000 / self.runner.args.think_ms))
+        await self.close()
+
+
+def load_collection(path):
+    """(method, path, body) of every request in a Postman collection, in order"""
+    requests = []
+
+    def walk(items):
+        for item in items:
+            if 'item' in item:
+                walk(item['item'])
+                continue
+            request = item['request']
+            url = request['url']['raw'] if isinstance(request['url'], dict) else request['url']
+            url = re.sub(r'\{\{[^}]+\}\}', '', url)
+            parts = urlsplit(url if '://' in url else 'http://host' + url)
+            path = parts.path + (f'?{parts.query}' if parts.query else '')
+            requests.append((request['method'], path, (request.get('body') or {}).get('raw')))
+
+    walk(json.loads(Path(path).read_text())['item'])
+    return requests
+
+
+class Runner:
+    def __init__(self, args):
+        self.args = args
+        parts = urlsplit(args.base_url)
+        self.base_url = args.base_url.rstrip('/')
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.mix = {name: weight for name, weight in parse_mix(args.mix).items() if weight > 0}
+        self.collection = load_collection(args.collection) if self.mix.get('postman') else []
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(lambda: defaultdict(int))
+        self.scenarios = defaultdict(list)
+
+    def record(self, label, elapsed, error):
+        self.latencies[label].append(elapsed)
+        if error is not None:
+            self.errors[label][str(error)] += 1
+
+    async def run(self):
+        deadline = time.monotonic() + self.args.duration
+        users = [VirtualUser(self, index) for index in range(self.args.concurrency)]
+        ramp = self.args.ramp_up / max(1, len(users))
+
+        async def start(user, delay):
+            await asyncio.sleep(delay)
+            await user.run(deadline)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(start(user, index * ramp) for index, user in enumerate(users)))
+        return time.perf_counter() - started
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in ('browse', 'customer', 'employee', 'manager', 'postman'):
+            raise argparse.ArgumentTypeError(f'Unknown scenario "{name}"')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(fraction * (len(values) - 1))))]
+
+
+def histogram(latencies):
+    counts = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+    for latency in latencies:
+        ms = latency * 1000
+        index = next((i for i, bound in enumerate(HISTOGRAM_BUCKETS_MS) if ms <= bound), len(HISTOGRAM_BUCKETS_MS))
+        counts[index] += 1
+    labels = [f'<={bound}ms' for bound in HISTOGRAM_BUCKETS_MS] + [f'>{HISTOGRAM_BUCKETS_MS[-1]}ms']
+    return dict(zip(labels, counts))
+
+
+def build_report(runner, wall):
+    endpoints = {}
+    for label, latencies in sorted(runner.latencies.items()):
+        errors = sum(runner.errors[label].values())
+        endpoints[label] = {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': round(errors / len(latencies), 4),
+            'error_kinds': dict(runner.errors[label]),
+            'rps': round(len(latencies) / wall, 2),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'histogram': histogram(latencies),
+        }
+    total = sum(row['requests'] for row in endpoints.values())
+    errors = sum(row['errors'] for row in endpoints.values())
+    return {
+        'base_url': runner.base_url,
+        'concurrency': runner.args.concurrency,
+        'duration_s': round(wall, 2),
+        'mix': runner.mix,
+        'requests': total,
+        'errors': errors,
+        'error_rate': round(errors / total, 4) if total else 0,
+        'throughput_rps': round(total / wall, 2),
+        'scenarios': {
+            name: {'completed': len(times), 'mean_ms': round(statistics.fmean(times) * 1000, 2)}
+            for name, times in runner.scenarios.items()
+        },
+        'endpoints': endpoints,
+    }
+
+
+def print_report(report):
+    print(f"{report['requests']} requests in {report['duration_s']}s at concurrency {report['concurrency']}: "
+          f"{report['throughput_rps']} req/s, {report['error_rate'] * 100:.2f}% errors")
+    for name, row in report['scenarios'].items():
+        print(f"  scenario {name:<10}{row['completed']:>8} runs, mean {row['mean_ms']}ms")
+    print()
+    print(f"{'request':<42}{'count':>8}{'err%':>7}{'rps':>8}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for label, row in report['endpoints'].items():
+        print(f"{label[:41]:<42}{row['requests']:>8}{row['error_rate'] * 100:>7.1f}{row['rps']:>8}"
+              f"{row['p50_ms']:>9}{row['p95_ms']:>9}{row['p99_ms']:>9}")
+        if row['error_kinds']:
+            print(f"{'':<4}errors: {row['error_kinds']}")
+    throttled = sum(row['error_kinds'].get('429', 0) for row in report['endpoints'].values())
+    if throttled:
+        print(f"WARNING {throttled} requests were rate limited (429); start the server with THROTTLE_ENABLED=False")
+    print()
+    print('Latency histogram (all requests)')
+    combined = defaultdict(int)
+    for row in report['endpoints'].values():
+        for bucket, count in row['histogram'].items():
+            combined[bucket] += count
+    peak = max(combined.values() or [1])
+    for bucket, count in combined.items():
+        print(f"  {bucket:>10} {count:>8} {'#' * int(40 * count / peak) if peak else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+    parser.add_argument('--concurrency', type=int, default=20, help='Number of virtual users')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--ramp-up', type=float, default=5, help='Seconds over which virtual users start')
+    parser.add_argument('--think-ms', type=float, default=0, help='Mean pause between scenarios per user')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help=f'Scenario weights (default: {DEFAULT_MIX})')
+    parser.add_argument('--collection', default=str(COLLECTION), help='Postman collection for the postman scenario')
+    parser.add_argument('--prefix', default='load', help='seed_scale --prefix of the seeded accounts')
+    parser.add_argument('--password', default='loadtest123', help='seed_scale --password')
+    parser.add_argument('--customers', type=int, default=5000, help='Seeded customer accounts to spread users over')
+    parser.add_argument('--employees', type=int, default=50)
+    parser.add_argument('--managers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--json', dest='json_path', help='Write the report to this file')
+    args = parser.parse_args()
+    if urlsplit(args.base_url).scheme != 'http':
+        parser.error('Only plain http:// targets are supported; benchmark behind the TLS terminator')
+
+    runner = Runner(args)
+    wall = asyncio.run(runner.run())
+    report = build_report(runner, wall)
+    print_report(report)
+    if args.json_path:
+        Path(args.json_path).write_text(json.dumps(report, indent=2) + '\n')
+    return 1 if report['requests'] == 0 else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
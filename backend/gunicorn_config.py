@@ -1,7 +1,58 @@
-bind = "127.0.0.1:8000"
-workers = 3
-timeout = 120
-accesslog = "/var/log/gunicorn/access.log"
-errorlog = "/var/log/gunicorn/error.log"
+import multiprocessing
+import os
+
+# Worker profiles:
+#   sync    - one request per worker process (CPU-bound endpoints)
+#   gthread - a pool of threads per worker, so slow I/O (exports, S3, DB)
+#             does not pin a whole process
+#   gevent  - cooperative green threads, requires `pip install gevent`
+#   uvicorn - ASGI workers for core.asgi:application, required for the
+#             /api/events/ stream (the gunicorn-events service in
+#             scripts/setup_ec2.sh)
+PROFILE = os.environ.get('GUNICORN_PROFILE', 'sync')
+CPU_COUNT = multiprocessing.cpu_count()
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+
+if PROFILE == 'gthread':
+    worker_class = 'gthread'
+    workers = int(os.environ.get('GUNICORN_WORKERS', CPU_COUNT + 1))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+elif PROFILE == 'gevent':
+    worker_class = 'gevent'
+    workers = int(os.environ.get('GUNICORN_WORKERS', CPU_COUNT + 1))
+    worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 100))
+elif PROFILE == 'uvicorn':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.environ.get('GUNICORN_WORKERS', CPU_COUNT + 1))
+else:
+    worker_class = 'sync'
+    workers = int(os.environ.get('GUNICORN_WORKERS', CPU_COUNT * 2 + 1))
+
+# Import Django once in the master so workers share the code pages copy-on-write
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True') == 'True'
+
+# Recycle workers periodically to cap memory growth; jitter avoids all
+# workers restarting at the same moment
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# Use "-" to log to stdout/stderr
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '/var/log/gunicorn/access.log')
+errorlog = os.environ.get('GUNICORN_ERRORLOG', '/var/log/gunicorn/error.log')
+loglevel = os.environ.get('GUNICORN_LOGLEVEL', 'info')
 capture_output = True
-enable_stdio_inheritance = True 
\ No newline at end of file
+enable_stdio_inheritance = True
+
+
+def on_starting(server):
+    # Per-worker metric files from a previous run would be summed into this one
+    metrics_dir = os.environ.get('METRICS_DIR')
+    if metrics_dir and os.path.isdir(metrics_dir):
+        for name in os.listdir(metrics_dir):
+            if name.startswith('metrics-'):
+                os.remove(os.path.join(metrics_dir, name))
@@ -0,0 +1,182 @@
+"""
+Batch endpoint: several API calls in one round trip.
+
+POST /api/batch/
+    {
+        "parallel": true,
+        "requests": [
+            {"id": "stats", "method": "GET", "path": "/api/products/stats/"},
+            {"id": "pending", "method": "GET", "path": "/api/orders/?status=pending"},
+            {"id": "accept", "method": "POST", "path": "/api/orders/12/accept/", "headers": {"If-Match": "\\"3\\""}}
+        ]
+    }
+
+returns {"responses": [{"id", "status", "headers", "body"}, ...]} in request
+order. Sub-requests are resolved and dispatched to their views directly, as
+the already authenticated user and with the session of the batch request:
+no extra session load, authentication or CSRF check (the batch request
+itself passed those). Each sub-request is still rate limited on its own
+route class and recorded in the metrics under its own route, like the same
+request sent alone. Replica reads are pinned to the primary for the whole
+batch when the client is pinned or the batch contains a write.
+
+Without "parallel" sub-requests run one after another on this request's
+database connection. With "parallel" and only GET/HEAD sub-requests they
+run on up to BATCH_MAX_WORKERS threads, each with its own connection.
+Streaming responses (the event stream, media files) cannot be batched.
+"""
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.exception import response_for_exception
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from core.metrics import MetricsMiddleware
+from core.throttling import ThrottleMiddleware
+
+SAFE_METHODS = ('GET', 'HEAD')
+ALLOWED_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+RETURNED_HEADERS = ('Content-Type', 'ETag', 'Location', 'Retry-After', 'Idempotent-Replayed')
+NOT_BATCHABLE = ('/api/batch/', '/api/events/', '/media/')
+# Headers of the batch request that must not leak into sub-requests
+DROPPED_META_PREFIXES = ('CONTENT_', 'HTTP_IF_', 'HTTP_IDEMPOTENCY_KEY', 'HTTP_RANGE')
+
+
+def error(item, status_code, detail):
+    return {'id': item.get('id'), 'status': status_code, 'headers': {}, 'body': {'detail': detail}}
+
+
+def build_subrequest(request, item):
+    """A WSGIRequest for `item` carrying the batch request's user and session"""
+    url = urlsplit(item['path'])
+    payload = json.dumps(item['body']).encode() if item.get('body') is not None else b''
+    environ = {key: value for key, value in request.META.items() if not key.startswith(DROPPED_META_PREFIXES)}
+    environ.update({
+        'REQUEST_METHOD': item['method'],
+        'PATH_INFO': url.path,
+        'QUERY_STRING': url.query,
+        'CONTENT_TYPE': 'application/json',
+        'CONTENT_LENGTH': str(len(payload)),
+        'wsgi.input': BytesIO(payload),
+    })
+    for name, value in (item.get('headers') or {}).items():
+        environ['HTTP_' + name.upper().replace('-', '_')] = str(value)
+
+    subrequest = WSGIRequest(environ)
+    subrequest.user = request.user
+    subrequest.session = request._request.session
+    subrequest._dont_enforce_csrf_checks = True
+    subrequest.request_id = getattr(request._request, 'request_id', None)
+    subrequest.pin_primary = getattr(request._request, 'pin_primary', False)
+    return subrequest
+
+
+def dispatch(subrequest):
+    match = subrequest.resolver_match
+    try:
+        response = match.func(subrequest, *match.args, **match.kwargs)
+        if hasattr(response, 'render') and not response.is_rendered:
+            response.render()
+    except Exception as exc:
+        response = response_for_exception(subrequest, exc)
+    return response
+
+
+def subrequest_handler():
+    """The view call wrapped in the request middleware that also applies to sub-requests"""
+    handler = dispatch
+    if 'core.throttling.ThrottleMiddleware' in settings.MIDDLEWARE:
+        handler = ThrottleMiddleware(handler)
+    if 'core.metrics.MetricsMiddleware' in settings.MIDDLEWARE:
+        handler = MetricsMiddleware(handler)
+    return handler
+
+
+def execute(request, item):
+    path = urlsplit(item['path']).path
+    try:
+        match = resolve(path)
+    except Resolver404:
+        return error(item, status.HTTP_404_NOT_FOUND, 'Not found.')
+
+    subrequest = build_subrequest(request, item)
+    subrequest.resolver_match = match
+    response = subrequest_handler()(subrequest)
+    if response.streaming:
+        response.close()  # releases open files of FileResponse
+        return error(item, status.HTTP_400_BAD_REQUEST, 'Streaming responses cannot be batched.')
+
+    content_type = response.get('Content-Type', '')
+    if not response.content:
+        body = None
+    elif content_type.startswith('application/json'):
+        body = json.loads(response.content)
+    else:
+        body = response.content.decode(response.charset or 'utf-8', errors='replace')
+    return {
+        'id': item.get('id'),
+        'status': response.status_code,
+        'headers': {name: response[name] for name in RETURNED_HEADERS if response.has_header(name)},
+        'body': body,
+    }
+
+
+def execute_in_thread(context, request, item):
+    try:
+        return context.run(execute, request, item)
+    finally:
+        # Worker threads open their own connections; do not leave them behind
+        connections.close_all()
+
+
+def validate(items):
+    if not isinstance(items, list) or not items:
+        return 'Expected a non-empty list of requests'
+    if len(items) > settings.BATCH_MAX_REQUESTS:
+        return f'At most {settings.BATCH_MAX_REQUESTS} requests per batch'
+    for item in items:
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str) or not item['path'].startswith('/'):
+            return 'Every request needs an absolute "path"'
+        item['method'] = str(item.get('method', 'GET')).upper()
+        if item['method'] not in ALLOWED_METHODS:
+            return f'Unsupported method {item["method"]}'
+        if item['path'].startswith(NOT_BATCHABLE):
+            return f'{item["path"]} cannot be batched'
+    return None
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def batch_view(request):
+    """Run several API requests and return all responses (see module docstring)"""
+    items = request.data.get('requests')
+    problem = validate(items)
+    if problem:
+        return Response({'detail': problem}, status=status.HTTP_400_BAD_REQUEST)
+
+    read_only = all(item['method'] in SAFE_METHODS for item in items)
+    if not read_only:
+        # Reads after a write in this batch must see it
+        request._request.pin_primary = True
+    parallel = request.data.get('parallel') and read_only
+    if parallel and len(items) > 1:
+        workers = min(settings.BATCH_MAX_WORKERS, len(items))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch') as pool:
+            futures = [
+                pool.submit(execute_in_thread, contextvars.copy_context(), request, item)
+                for item in items
+            ]
+            responses = [future.result() for future in futures]
+    else:
+        responses = [execute(request, item) for item in items]
+    return Response({'responses': responses})
@@ -0,0 +1,91 @@
+"""
+System check: logging calls must not do database work eagerly.
+
+Arguments to logger.debug(...) and friends are evaluated before the logger
+decides whether the level is enabled, so `logger.debug(f"{qs.count()}")`
+runs a query on every call even with DEBUG logging off. This check parses
+the project's modules and reports logging calls whose arguments call a
+queryset method, read `.query` or iterate with a comprehension. Pass
+expensive values to core.log.log_event as callables instead, or guard the
+call with `logger.isEnabledFor(...)`.
+
+Run in CI with `python manage.py check --fail-level WARNING`.
+"""
+import ast
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOG_METHODS = {'debug', 'info', 'warning', 'warn', 'error', 'exception', 'critical', 'log', 'log_event'}
+QUERY_METHODS = {
+    # get() and values() are left out: dicts have them too
+    'all', 'filter', 'exclude', 'count', 'exists', 'first', 'last', 'aggregate', 'annotate',
+    'values_list', 'in_bulk', 'iterator', 'select_related', 'prefetch_related', 'order_by',
+}
+COMPREHENSIONS = (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)
+
+
+def is_logging_call(node):
+    func = node.func
+    if isinstance(func, ast.Name):
+        return func.id == 'log_event'
+    if not isinstance(func, ast.Attribute) or func.attr not in LOG_METHODS:
+        return False
+    receiver = func.value
+    name = receiver.id if isinstance(receiver, ast.Name) else getattr(receiver, 'attr', '')
+    return name in ('logging', 'log') or name.endswith('logger')
+
+
+def eager_work(node):
+    """Describe the first database-looking expression evaluated eagerly in `node`, if any"""
+    if isinstance(node, ast.Lambda):
+        return None  # evaluated lazily by log_event
+    if isinstance(node, COMPREHENSIONS):
+        return 'a comprehension'
+    if isinstance(node, ast.Attribute) and node.attr == 'query':
+        return '.query'
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr in QUERY_METHODS:
+        return f'.{node.func.attr}()'
+    for child in ast.iter_child_nodes(node):
+        found = eager_work(child)
+        if found:
+            return found
+    return None
+
+
+def project_modules():
+    base = Path(settings.BASE_DIR).resolve()
+    for app_config in apps.get_app_configs():
+        path = Path(app_config.path).resolve()
+        if base not in path.parents:
+            continue
+        for module in sorted(path.rglob('*.py')):
+            if 'migrations' not in module.parts:
+                yield module
+
+
+@register('logging')
+def check_eager_logging(app_configs, **kwargs):
+    errors = []
+    for module in project_modules():
+        try:
+            tree = ast.parse(module.read_text(), filename=str(module))
+        except (OSError, SyntaxError):
+            continue
+        for node in ast.walk(tree):
+            if not isinstance(node, ast.Call) or not is_logging_call(node):
+                continue
+            arguments = node.args + [keyword.value for keyword in node.keywords]
+            for argument in arguments:
+                found = eager_work(argument)
+                if found:
+                    errors.append(Warning(
+                        f'Logging call evaluates {found} eagerly ({module.name}:{node.lineno})',
+                        hint='Pass the value to core.log.log_event as a callable or guard with logger.isEnabledFor().',
+                        obj=str(module.relative_to(settings.BASE_DIR)),
+                        id='core.W001',
+                    ))
+                    break
+    return errors
@@ -0,0 +1,185 @@
+"""
+Response compression.
+
+CompressionMiddleware negotiates brotli, zstd or gzip from Accept-Encoding
+(server preference COMPRESSION_ENCODINGS among what the client accepts) and
+compresses text-like responses: JSON, HTML, CSS, JS, XML, SVG and plain
+text. It leaves alone bodies under COMPRESSION_MIN_SIZE, images and other
+binary media, responses that already carry a Content-Encoding, file
+responses (they keep sendfile), server-sent event streams (compressors
+buffer) and responses marked Cache-Control: no-transform. CSRF tokens in
+bodies are masked per request by Django, which defeats BREACH-style guessing.
+
+CPU is bounded by the per-encoding levels in COMPRESSION_LEVELS; bodies over
+COMPRESSION_FAST_ABOVE bytes use the fastest level instead. Streaming
+responses are compressed chunk by chunk and flushed after every chunk.
+
+brotli and zstd need the `brotli` and `zstandard` packages; without them
+only gzip is offered.
+"""
+import zlib
+
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml',
+                      'application/problem+json', 'image/svg+xml')
+FASTEST = {'br': 0, 'gzip': 1, 'zstd': 1}
+
+
+def available_encodings():
+    encodings = {'gzip'}
+    if brotli is not None:
+        encodings.add('br')
+    if zstandard is not None:
+        encodings.add('zstd')
+    return encodings
+
+
+def accepted_encodings(header):
+    """Encodings the client accepts (q > 0) from an Accept-Encoding header"""
+    accepted = set()
+    wildcard = False
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        coding = coding.strip().lower()
+        quality = 1.0
+        params = params.strip().replace(' ', '')
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding == '*':
+            wildcard = quality > 0
+        elif coding and quality > 0:
+            accepted.add(coding)
+    return accepted, wildcard
+
+
+def choose_encoding(header):
+    if not header:
+        return None
+    accepted, wildcard = accepted_encodings(header)
+    available = available_encodings()
+    for encoding in settings.COMPRESSION_ENCODINGS:
+        if encoding in available and (encoding in accepted or wildcard):
+            return encoding
+    return None
+
+
+class Compressor:
+    """Incremental compressor with the same interface for every encoding."""
+
+    def __init__(self, encoding, level):
+        self.encoding = encoding
+        if encoding == 'br':
+            self._compressor = brotli.Compressor(quality=level)
+        elif encoding == 'zstd':
+            self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data):
+        if self.encoding == 'br':
+            return self._compressor.process(data)
+        return self._compressor.compress(data)
+
+    def flush(self):
+        if self.encoding == 'br':
+            return self._compressor.flush()
+        if self.encoding == 'zstd':
+            return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        if self.encoding == 'br':
+            return self._compressor.finish()
+        return self._compressor.flush()
+
+
+def compress(encoding, data, level):
+    compressor = Compressor(encoding, level)
+    return compressor.compress(data) + compressor.finish()
+
+
+def is_compressible(response):
+    if response.has_header('Content-Encoding') or response.status_code in (204, 206, 304):
+        return False
+    if getattr(response, 'file_to_stream', None) is not None:
+        return False
+    if 'no-transform' in response.get('Cache-Control', ''):
+        return False
+    content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+    if content_type == 'text/event-stream':
+        return False
+    return content_type.startswith(COMPRESSIBLE_TYPES)
+
+
+class CompressionMiddleware:
+    """Compress responses with the best encoding the client accepts (see module docstring)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if not is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.headers.get('Accept-Encoding', ''))
+        if encoding is None:
+            return response
+        level = settings.COMPRESSION_LEVELS[encoding]
+
+        if response.streaming:
+            compressor = Compressor(encoding, level)
+            if response.is_async:
+                response.streaming_content = self._compress_async(response.streaming_content, compressor)
+            else:
+                response.streaming_content = self._compress_stream(response.streaming_content, compressor)
+            del response.headers['Content-Length']
+        else:
+            body = response.content
+            if len(body) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            if len(body) > settings.COMPRESSION_FAST_ABOVE:
+                level = FASTEST[encoding]
+            compressed = compress(encoding, body, level)
+            if len(compressed) >= len(body):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+
+        # The representation changed, so a strong ETag no longer matches it
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = encoding
+        return response
+
+    @staticmethod
+    def _compress_stream(chunks, compressor):
+        for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
+
+    @staticmethod
+    async def _compress_async(chunks, compressor):
+        async for chunk in chunks:
+            data = compressor.compress(chunk) + compressor.flush()
+            if data:
+                yield data
+        yield compressor.finish()
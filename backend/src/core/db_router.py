@@ -0,0 +1,111 @@
+"""
+Read-replica routing.
+
+Reads go to the primary (`default`) unless a view explicitly opts in via
+ReplicaReadMixin (or the `read_from_replica` context manager). Clients that
+have just written are pinned to the primary for REPLICA_PIN_SECONDS so they
+always read their own writes, and an unreachable replica falls back to the
+primary. Replica health is probed at most once per REPLICA_HEALTH_SECONDS
+per process, not on every request.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DatabaseError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+PIN_COOKIE = 'primary_pin'
+
+_read_alias = ContextVar('read_alias', default=None)
+_replica_down_until = {}
+_replica_healthy_until = {}
+
+
+def get_replica_alias():
+    """Return the replica alias if one is configured and reachable, else None."""
+    alias = getattr(settings, 'REPLICA_DATABASE_ALIAS', 'replica')
+    if alias not in settings.DATABASES:
+        return None
+    now = time.monotonic()
+    if _replica_down_until.get(alias, 0) > now:
+        return None
+    if _replica_healthy_until.get(alias, 0) > now:
+        return alias
+    try:
+        connections[alias].ensure_connection()
+    except DatabaseError:
+        retry_after = getattr(settings, 'REPLICA_RETRY_SECONDS', 30)
+        logger.warning("Replica %s unreachable, reading from primary for %ss", alias, retry_after)
+        _replica_down_until[alias] = now + retry_after
+        _replica_healthy_until.pop(alias, None)
+        return None
+    _replica_healthy_until[alias] = now + getattr(settings, 'REPLICA_HEALTH_SECONDS', 5)
+    return alias
+
+
+@contextmanager
+def read_from_replica(request=None):
+    """Route reads inside the block to the replica, unless the client is pinned."""
+    alias = None
+    if request is None or not getattr(request, 'pin_primary', False):
+        alias = get_replica_alias()
+    token = _read_alias.set(alias)
+    try:
+        yield alias
+    finally:
+        _read_alias.reset(token)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+
+class ReplicaPinningMiddleware:
+    """Pin clients to the primary for a short window after any write."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.pin_primary = PIN_COOKIE in request.COOKIES
+        response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                PIN_COOKIE, '1',
+                max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                httponly=True,
+                samesite=settings.SESSION_COOKIE_SAMESITE,
+            )
+        return response
+
+
+class ReplicaReadMixin:
+    """
+    Serve the listed viewset actions from the replica on safe methods.
+    """
+    replica_actions = ()
+
+    def initial(self, request, *args, **kwargs):
+        self._replica_token = None
+        super().initial(request, *args, **kwargs)
+        if self.action in self.replica_actions and request.method in SAFE_METHODS \
+                and not getattr(request, 'pin_primary', False):
+            self._replica_token = _read_alias.set(get_replica_alias())
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, '_replica_token', None) is not None:
+            _read_alias.reset(self._replica_token)
+            self._replica_token = None
+        return super().finalize_response(request, response, *args, **kwargs)
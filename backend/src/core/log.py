@@ -0,0 +1,170 @@
+"""
+Structured, non-blocking logging.
+
+- RequestIdMiddleware gives every request an id (the X-Request-ID header set
+  by nginx, or a fresh one), exposes it to log records through
+  RequestIdFilter and echoes it in the response.
+- log_event() emits a named event with keyword fields only when the level is
+  enabled; fields passed as callables are evaluated only then, so expensive
+  values (counts, serialised objects) cost nothing when the level is off.
+- QueuedStreamHandler puts records on a bounded in-memory queue. A
+  QueueListener thread formats and writes them, so a slow disk or pipe never
+  blocks a request; when the queue is full records are dropped and counted.
+
+The LOGGING setting wires these together (see core/settings.py), and the
+check in core/checks.py rejects logging calls that do database work eagerly.
+"""
+import contextvars
+import json
+import logging
+import os
+import queue
+import re
+import sys
+import threading
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9._-]{1,64}$')
+
+request_id = contextvars.ContextVar('request_id', default='-')
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+RESERVED_ATTRS = frozenset(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+
+def log_event(logger, level, event, **fields):
+    """
+    Log `event` with structured fields if `level` is enabled for `logger`.
+    Callable field values are called only when the event is emitted:
+
+        log_event(logger, logging.DEBUG, 'users.listed', count=queryset.count)
+    """
+    if not logger.isEnabledFor(level):
+        return
+    fields = {name: value() if callable(value) else value for name, value in fields.items()}
+    logger.log(level, event, extra={'fields': fields}, stacklevel=2)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record):
+        # django.request logs error responses after the middleware has returned
+        request = getattr(record, 'request', None)
+        record.request_id = getattr(request, 'request_id', None) or request_id.get()
+        return True
+
+
+class RequestIdMiddleware:
+    """Tag the request (and every record logged while handling it) with an id."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        incoming = request.headers.get(REQUEST_ID_HEADER, '')
+        value = incoming if REQUEST_ID_PATTERN.match(incoming) else uuid.uuid4().hex
+        request.request_id = value
+        token = request_id.set(value)
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id.reset(token)
+        response[REQUEST_ID_HEADER] = value
+        return response
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message, request id and fields."""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', '-'),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            entry.update(fields)
+        for name, value in vars(record).items():
+            if name not in RESERVED_ATTRS and name not in ('fields', 'request_id') and name not in entry:
+                entry[name] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Human readable lines for development, with structured fields appended."""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s [%(request_id)s] %(message)s')
+
+    def format(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = '-'
+        line = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f'{name}={value!r}' for name, value in fields.items())
+        return line
+
+
+class QueuedStreamHandler(QueueHandler):
+    """
+    Hand records to a background listener that writes them to a stream.
+
+    The listener thread is (re)started lazily in each process, because
+    threads do not survive the fork from a preloaded gunicorn master.
+    """
+
+    def __init__(self, stream=None, output='json', queue_size=10000):
+        super().__init__(queue.Queue(queue_size))
+        target = logging.StreamHandler(stream or sys.stderr)
+        target.setFormatter(JsonFormatter() if output == 'json' else TextFormatter())
+        self.target = target
+        self.dropped = 0
+        self._listener = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                # A listener inherited through fork has no thread; start a fresh one
+                self.queue = queue.Queue(self.queue.maxsize)
+                self._listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+                self._listener.start()
+                self._pid = os.getpid()
+
+    def prepare(self, record):
+        # Keep structured attributes intact; only resolve the message and
+        # traceback text so the record can be formatted on another thread
+        record.message = record.getMessage()
+        if record.exc_info:
+            record.exc_text = self.target.formatter.formatException(record.exc_info)
+            record.exc_info = None
+        record.msg = record.message
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        self._ensure_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+        super().close()
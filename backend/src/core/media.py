@@ -0,0 +1,173 @@
+"""
+Media storage and delivery.
+
+Uploaded files are stored under content-hashed names
+(products/shoe.3f2a9c01b7de.jpg), so a name never points at different bytes
+and responses for it can be cached for a year as immutable. With MEDIA_BUCKET
+set the files live in S3-compatible storage instead (core/s3.py) and are
+served from there.
+
+In production nginx serves /media/ itself (scripts/nginx.conf) and these
+requests never reach Django. When a request does reach media_view, the file
+is handed off according to MEDIA_DELIVERY:
+
+- 'accel':    X-Accel-Redirect to MEDIA_ACCEL_PREFIX, an internal nginx
+              location; nginx sends the bytes and handles Range.
+- 'sendfile': X-Sendfile with the absolute path (Apache mod_xsendfile,
+              lighttpd).
+- 'django':   FileResponse, which gunicorn sends with sendfile(2); single
+              byte ranges are answered with 206 Partial Content.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+HASH_LENGTH = 12
+HASHED_NAME = re.compile(rf'\.[0-9a-f]{{{HASH_LENGTH}}}\.[A-Za-z0-9]+$')
+RANGE_HEADER = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class HashedNameMixin:
+    """Insert a hash of the content into every saved file name."""
+
+    def _save(self, name, content):
+        if not HASHED_NAME.search(name):
+            digest = hashlib.sha256()
+            for chunk in content.chunks():
+                digest.update(chunk)
+            content.seek(0)
+            root, ext = os.path.splitext(name)
+            name = f'{root}.{digest.hexdigest()[:HASH_LENGTH]}{ext}'
+        return super()._save(name, content)
+
+
+class HashedFileSystemStorage(HashedNameMixin, FileSystemStorage):
+    pass
+
+
+def cache_control(path):
+    return IMMUTABLE if HASHED_NAME.search(path) else f'public, max-age={settings.MEDIA_CACHE_SECONDS}'
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single satisfiable byte range, None to send the whole file"""
+    match = RANGE_HEADER.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        length = int(last)
+        if length == 0:
+            raise ValueError('Unsatisfiable range')
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError('Unsatisfiable range')
+    return start, end
+
+
+class RangeFile:
+    """File object limited to `length` bytes from the current position."""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return etag in (tag.strip() for tag in if_none_match.split(','))
+    since = request.headers.get('If-Modified-Since')
+    if since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+@require_safe
+def media_view(request, path):
+    try:
+        fullpath = Path(safe_join(settings.MEDIA_ROOT, path))
+    except SuspiciousFileOperation:
+        raise Http404('Not found')
+    try:
+        stat = fullpath.stat()
+    except OSError:
+        raise Http404('Not found')
+    if not fullpath.is_file():
+        raise Http404('Not found')
+
+    headers = {
+        'Cache-Control': cache_control(path),
+        'ETag': f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        'Last-Modified': http_date(stat.st_mtime),
+    }
+    if not_modified(request, headers['ETag'], stat.st_mtime):
+        response = HttpResponseNotModified()
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    delivery = settings.MEDIA_DELIVERY
+    if delivery in ('accel', 'sendfile'):
+        # The front server sends the file; it also owns Range handling
+        response = HttpResponse(content_type=mimetypes.guess_type(fullpath.name)[0] or 'application/octet-stream')
+        if delivery == 'accel':
+            response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + path
+        else:
+            response['X-Sendfile'] = str(fullpath)
+        for name, value in headers.items():
+            response[name] = value
+        return response
+
+    try:
+        byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        return response
+    if byte_range and request.headers.get('If-Range', headers['ETag']) != headers['ETag']:
+        byte_range = None
+
+    file = fullpath.open('rb')
+    if byte_range is None:
+        # A real file object lets gunicorn's file_wrapper use sendfile(2)
+        response = FileResponse(file)
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = FileResponse(RangeFile(file, end - start + 1), status=206)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response['Content-Type'] = mimetypes.guess_type(fullpath.name)[0] or 'application/octet-stream'
+    response['Accept-Ranges'] = 'bytes'
+    for name, value in headers.items():
+        response[name] = value
+    return response
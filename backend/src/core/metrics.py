@@ -0,0 +1,316 @@
+"""
+Prometheus-style metrics.
+
+A small in-process registry of counters and histograms rendered in the
+Prometheus text exposition format at /metrics. MetricsMiddleware records
+per-route request counts and latency plus the number and total time of the
+database queries each request ran (via connection.execute_wrapper); code
+elsewhere increments cache and business counters defined here.
+
+Each gunicorn worker has its own registry. With METRICS_DIR set, every
+worker periodically writes its values to a file in that directory and the
+scrape endpoint sums all files, so counters survive worker restarts and the
+scrape sees every worker no matter which one serves it. Files of workers
+that have exited (max_requests recycling, restarts) are folded into one
+metrics-retired.json on scrape, so the directory does not grow with every
+recycled worker.
+
+/metrics requires `Authorization: Bearer <METRICS_TOKEN>`; without a token
+it is only served with DEBUG on. nginx does not expose it publicly either.
+"""
+import fcntl
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+UNMATCHED_ROUTE = '<unmatched>'
+
+
+class Metric:
+    type = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}')
+        return tuple(str(label) for label in labels)
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self.registry.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self.registry.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                # Per-bucket counts (the last one is +Inf), sum, count
+                entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.metrics = {}
+        self._flushed_at = 0.0
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self.metrics[metric.name] = metric
+        return metric
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                name: [
+                    [list(key), [list(value[0]), value[1], value[2]] if isinstance(value, list) else value]
+                    for key, value in metric.values.items()
+                ]
+                for name, metric in self.metrics.items()
+            }
+
+    def flush(self, force=False):
+        """Write this process's values to METRICS_DIR (rate limited unless forced)"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory or (not force and time.monotonic() - self._flushed_at < settings.METRICS_FLUSH_SECONDS):
+            return
+        self._flushed_at = time.monotonic()
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        path = Path(directory) / f'metrics-{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps(self.snapshot()))
+        os.replace(temporary, path)
+
+    def collect(self):
+        """Values of every metric, summed over all worker files when METRICS_DIR is set"""
+        directory = getattr(settings, 'METRICS_DIR', None)
+        if not directory:
+            return {name: {tuple(key): value for key, value in values} for name, values in self.snapshot().items()}
+
+        self.flush(force=True)
+        retire_exited_workers(Path(directory))
+        merged = {name: {} for name in self.metrics}
+        for path in Path(directory).glob('metrics-*.json'):
+            snapshot = read_snapshot(path)
+            if snapshot is not None:
+                merge_snapshot(merged, snapshot, only_known=True)
+        return merged
+
+    def render(self):
+        lines = []
+        values = self.collect()
+        for name, metric in self.metrics.items():
+            lines.append(f'# HELP {name} {metric.documentation}')
+            lines.append(f'# TYPE {name} {metric.type}')
+            for key, value in sorted(values.get(name, {}).items()):
+                labels = list(zip(metric.labelnames, key))
+                if metric.type == 'counter':
+                    lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip([*metric.buckets, '+Inf'], counts):
+                    cumulative += bucket_count
+                    le = bound if bound == '+Inf' else format_value(bound)
+                    lines.append(f'{name}_bucket{format_labels(labels + [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{format_labels(labels)} {format_value(total)}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def read_snapshot(path):
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def merge_snapshot(merged, snapshot, only_known=False):
+    """Add a snapshot ({name: [[key, value], ...]}) into merged ({name: {key: value}})"""
+    for name, values in snapshot.items():
+        if name not in merged:
+            if only_known:
+                continue
+            merged[name] = {}
+        target = merged[name]
+        for key, value in values:
+            key = tuple(key)
+            if key not in target:
+                target[key] = value
+            elif isinstance(value, list):
+                current = target[key]
+                current[0] = [a + b for a, b in zip(current[0], value[0])]
+                current[1] += value[1]
+                current[2] += value[2]
+            else:
+                target[key] += value
+
+
+def worker_pid(path):
+    pid = path.stem.partition('-')[2]
+    return int(pid) if pid.isdigit() else None
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def retire_exited_workers(directory):
+    """Fold the files of exited workers into metrics-retired.json and delete them"""
+    exited = [
+        path for path in directory.glob('metrics-*.json')
+        if worker_pid(path) is not None and not is_running(worker_pid(path))
+    ]
+    if not exited:
+        return
+    with open(directory / 'retire.lock', 'w') as lock:
+        # Concurrent scrapes must not fold the same file twice
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        retired_path = directory / 'metrics-retired.json'
+        retired = {}
+        merge_snapshot(retired, read_snapshot(retired_path) or {})
+        folded = []
+        for path in exited:
+            snapshot = read_snapshot(path)
+            if snapshot is not None:
+                merge_snapshot(retired, snapshot)
+                folded.append(path)
+        if not folded:
+            return
+        temporary = retired_path.with_suffix('.tmp')
+        temporary.write_text(json.dumps({
+            name: [[list(key), value] for key, value in values.items()] for name, values in retired.items()
+        }))
+        os.replace(temporary, retired_path)
+        for path in folded:
+            path.unlink(missing_ok=True)
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter(
+    'http_requests_total', 'HTTP requests by route, method and status code', ['route', 'method', 'status'])
+HTTP_LATENCY = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time to produce the response', ['route', 'method'])
+DB_QUERIES = REGISTRY.histogram(
+    'db_queries_per_request', 'SQL queries run per request', ['route'], buckets=QUERY_COUNT_BUCKETS)
+DB_TIME = REGISTRY.histogram(
+    'db_time_per_request_seconds', 'Time spent in SQL queries per request', ['route'])
+CACHE_REQUESTS = REGISTRY.counter(
+    'cache_requests_total', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result'])
+ORDERS_CREATED = REGISTRY.counter(
+    'orders_created_total', 'Orders created, by the role of the creator', ['created_by_role'])
+ORDER_TRANSITIONS = REGISTRY.counter(
+    'order_transitions_total', 'Order status changes, by new status', ['status'])
+CART_MUTATIONS = REGISTRY.counter(
+    'cart_mutations_total', 'Cart mutation requests, by write mode', ['write_mode'])
+THROTTLED_REQUESTS = REGISTRY.counter(
+    'throttled_requests_total', 'Requests rejected with 429, by route class and scope', ['route_class', 'scope'])
+
+
+class QueryTimer:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    """Record latency, status and database usage per route."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timer))
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        route = match.view_name if match else UNMATCHED_ROUTE
+        HTTP_REQUESTS.inc(route, request.method, response.status_code)
+        HTTP_LATENCY.observe(elapsed, route, request.method)
+        DB_QUERIES.observe(timer.count, route)
+        DB_TIME.observe(timer.seconds, route)
+        REGISTRY.flush()
+        return response
+
+
+def metrics_view(request):
+    """Scrape endpoint. Requires `Authorization: Bearer <METRICS_TOKEN>`; open without a token only in DEBUG."""
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if token:
+        if request.headers.get('Authorization') != f'Bearer {token}':
+            return HttpResponse('Forbidden\n', status=403, content_type='text/plain')
+    elif not settings.DEBUG:
+        return HttpResponse('Forbidden: set METRICS_TOKEN\n', status=403, content_type='text/plain')
+    return HttpResponse(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
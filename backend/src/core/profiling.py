@@ -0,0 +1,314 @@
+"""
+Opt-in sampling profiler for live requests.
+
+ProfilingMiddleware marks a fraction of requests (PROFILING_SAMPLE_RATE), or
+any request carrying a valid signed X-Profile-Token header, as profiled. A
+single background thread wakes every PROFILING_INTERVAL_MS, snapshots the
+stacks of the threads serving profiled requests and counts them per view as
+collapsed stacks ("module:function;module:function count"), the input format
+of flamegraph.pl, speedscope and similar tools.
+
+Overhead is bounded by the sampling interval, PROFILING_MAX_CONCURRENT and
+PROFILING_MAX_STACKS, and measured: the sampler's own CPU time is reported
+next to the wall time of the requests it profiled.
+
+With several worker processes, set PROFILING_DIR to a directory shared by
+the workers; each process writes its aggregate there and the endpoint
+merges them. A reset writes a new generation marker to the directory: every
+worker drops its samples when it sees the marker change on its next flush,
+and files from older generations are left out of the merge. Without
+PROFILING_DIR samples, and resets, are per process.
+"""
+import json
+import logging
+import os
+import random
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+from django.conf import settings
+from django.core import signing
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.response import Response
+
+from users.admin_views import IsManagerPermission
+
+logger = logging.getLogger(__name__)
+
+TOKEN_HEADER = 'X-Profile-Token'
+TOKEN_SALT = 'core.profiling'
+TRUNCATED = '[truncated]'
+GENERATION_FILE = 'generation'
+
+
+def collapse(frame, max_depth):
+    """Render a frame's call stack root-first as a collapsed-stack line"""
+    names = []
+    while frame is not None and len(names) < max_depth:
+        code = frame.f_code
+        names.append(f"{frame.f_globals.get('__name__', '?')}:{getattr(code, 'co_qualname', code.co_name)}")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def read_generation(directory):
+    """The id of the current collection period in PROFILING_DIR ('' before the first reset)"""
+    try:
+        return (directory / GENERATION_FILE).read_text()
+    except OSError:
+        return ''
+
+
+class StackSampler:
+    def __init__(self):
+        self.interval = settings.PROFILING_INTERVAL_MS / 1000
+        self.max_depth = settings.PROFILING_MAX_DEPTH
+        self.max_stacks = settings.PROFILING_MAX_STACKS
+        self.lock = threading.Lock()
+        self.active = {}  # thread id -> {'view', 'stacks'} of requests being profiled
+        self.reset()
+        self._thread = None
+        self._pid = None
+        self._flushed_at = time.monotonic()
+        self.generation = read_generation(Path(settings.PROFILING_DIR)) if settings.PROFILING_DIR else ''
+
+    def reset(self):
+        with self.lock:
+            self.stacks = defaultdict(Counter)
+            self.requests = Counter()
+            self.samples = 0
+            self.wall_seconds = 0.0
+            self.sampler_seconds = 0.0
+
+    def ensure_running(self):
+        # Threads do not survive a fork, so each worker process starts its own
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            with self.lock:
+                if self._pid != os.getpid() or not self._thread.is_alive():
+                    self._pid = os.getpid()
+                    self._thread = threading.Thread(target=self.run, name='profiling-sampler', daemon=True)
+                    self._thread.start()
+
+    def begin(self, state):
+        """Register the current thread; returns False if too many requests are already profiled"""
+        with self.lock:
+            if len(self.active) >= settings.PROFILING_MAX_CONCURRENT:
+                return False
+            self.active[threading.get_ident()] = state
+        self.ensure_running()
+        return True
+
+    def end(self, elapsed):
+        with self.lock:
+            state = self.active.pop(threading.get_ident(), None)
+            if state is not None:
+                # Samples taken before the view was resolved still belong to it
+                counter = self.stacks[state['view']]
+                for stack, count in state['stacks'].items():
+                    if stack not in counter and len(counter) >= self.max_stacks:
+                        stack = TRUNCATED
+                    counter[stack] += count
+                self.requests[state['view']] += 1
+                self.wall_seconds += elapsed
+        if settings.PROFILING_DIR and time.monotonic() - self._flushed_at > settings.PROFILING_FLUSH_SECONDS:
+            self.flush()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            started = time.thread_time()
+            with self.lock:
+                active = list(self.active.items())
+            if active:
+                frames = sys._current_frames()
+                collected = []
+                for thread_id, state in active:
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        collected.append((state, collapse(frame, self.max_depth)))
+                del frames
+                with self.lock:
+                    for state, stack in collected:
+                        state['stacks'][stack] += 1
+                    self.samples += len(collected)
+            with self.lock:
+                self.sampler_seconds += time.thread_time() - started
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'pid': os.getpid(),
+                'samples': self.samples,
+                'wall_seconds': self.wall_seconds,
+                'sampler_seconds': self.sampler_seconds,
+                'requests': dict(self.requests),
+                'stacks': {view: dict(counter) for view, counter in self.stacks.items()},
+            }
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        generation = read_generation(directory)
+        if generation != self.generation:
+            # Another worker reset the profiles since this one last flushed
+            self.reset()
+            self.generation = generation
+        path = directory / f'profile-{os.getpid()}.json'
+        temporary = path.with_suffix('.tmp')
+        temporary.write_text(json.dumps({**self.snapshot(), 'generation': generation}))
+        os.replace(temporary, path)
+
+    def start_generation(self):
+        """Reset every worker's samples: drop local ones and move the shared directory on"""
+        self.reset()
+        if not settings.PROFILING_DIR:
+            return
+        directory = Path(settings.PROFILING_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        self.generation = secrets.token_hex(8)
+        temporary = directory / f'{GENERATION_FILE}.tmp'
+        temporary.write_text(self.generation)
+        os.replace(temporary, directory / GENERATION_FILE)
+        for path in directory.glob('profile-*.json'):
+            path.unlink(missing_ok=True)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = StackSampler()
+    return _sampler
+
+
+def has_valid_token(request):
+    token = request.headers.get(TOKEN_HEADER)
+    if not token:
+        return False
+    try:
+        signing.TimestampSigner(salt=TOKEN_SALT).unsign(token, max_age=settings.PROFILING_TOKEN_MAX_AGE)
+    except signing.BadSignature:
+        return False
+    return True
+
+
+def view_name(view_func):
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{view_func.__qualname__}'
+    return f'{view_class.__module__}.{view_class.__name__}'
+
+
+class ProfilingMiddleware:
+    """Sample the stacks of a fraction of requests (see module docstring)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+
+    def __call__(self, request):
+        if not (random.random() < self.sample_rate or has_valid_token(request)):
+            return self.get_response(request)
+
+        request._profiling = {'view': f'{request.method} (unresolved)', 'stacks': Counter()}
+        sampler = get_sampler()
+        if not sampler.begin(request._profiling):
+            return self.get_response(request)
+        started = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            sampler.end(time.perf_counter() - started)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        state = getattr(request, '_profiling', None)
+        if state is not None:
+            name = view_name(view_func)
+            actions = getattr(view_func, 'actions', None)
+            if actions:
+                # DRF viewsets: one entry per action, e.g. OrderViewSet.list
+                name = f"{name}.{actions.get(request.method.lower(), request.method.lower())}"
+            state['view'] = name
+
+
+def merged_snapshot():
+    sampler = get_sampler()
+    if not settings.PROFILING_DIR:
+        return sampler.snapshot()
+    sampler.flush()
+    merged = {'processes': 0, 'samples': 0, 'wall_seconds': 0.0, 'sampler_seconds': 0.0,
+              'requests': Counter(), 'stacks': defaultdict(Counter)}
+    for path in Path(settings.PROFILING_DIR).glob('profile-*.json'):
+        try:
+            snapshot = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if snapshot.get('generation', '') != sampler.generation:
+            continue  # written before the last reset
+        merged['processes'] += 1
+        for key in ('samples', 'wall_seconds', 'sampler_seconds'):
+            merged[key] += snapshot[key]
+        merged['requests'].update(snapshot['requests'])
+        for view, stacks in snapshot['stacks'].items():
+            merged['stacks'][view].update(stacks)
+    return merged
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsManagerPermission])
+def profiles_view(request):
+    """
+    GET: views with profiled requests, sample counts and the sampler overhead.
+    DELETE: discard collected samples, in every worker when PROFILING_DIR is set.
+    """
+    if request.method == 'DELETE':
+        get_sampler().start_generation()
+        return Response(status=204)
+
+    snapshot = merged_snapshot()
+    wall = snapshot['wall_seconds']
+    return Response({
+        'enabled': settings.PROFILING_ENABLED,
+        'sample_rate': settings.PROFILING_SAMPLE_RATE,
+        'interval_ms': settings.PROFILING_INTERVAL_MS,
+        'samples': snapshot['samples'],
+        'profiled_seconds': round(wall, 3),
+        'sampler_cpu_seconds': round(snapshot['sampler_seconds'], 3),
+        'overhead_ratio': round(snapshot['sampler_seconds'] / wall, 4) if wall else 0,
+        'views': [
+            {'view': view, 'requests': snapshot['requests'].get(view, 0), 'samples': sum(stacks.values())}
+            for view, stacks in sorted(snapshot['stacks'].items(), key=lambda item: -sum(item[1].values()))
+        ],
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsManagerPermission])
+def profile_stacks_view(request, view):
+    """Collapsed stacks for one view, ready for flamegraph.pl or speedscope"""
+    stacks = merged_snapshot()['stacks'].get(view)
+    if not stacks:
+        return Response({'detail': 'No samples for this view'}, status=404)
+    lines = [f'{stack} {count}' for stack, count in sorted(stacks.items(), key=lambda item: -item[1])]
+    response = HttpResponse('\n'.join(lines) + '\n', content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="{view}.collapsed"'
+    return response
+
+
+@api_view(['POST'])
+@permission_classes([IsManagerPermission])
+def profile_token_view(request):
+    """Issue a token that forces profiling of requests sending it as X-Profile-Token"""
+    token = signing.TimestampSigner(salt=TOKEN_SALT).sign(str(request.user.pk))
+    return Response({'header': TOKEN_HEADER, 'token': token, 'expires_in': settings.PROFILING_TOKEN_MAX_AGE})
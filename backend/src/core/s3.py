@@ -0,0 +1,22 @@
+"""
+S3-compatible media storage, used when MEDIA_BUCKET is set.
+
+Works against AWS S3 or any S3 API (MinIO, moto server) given
+MEDIA_S3_ENDPOINT_URL. Only imported when configured, so boto3 and
+django-storages are needed only in that mode.
+"""
+import posixpath
+
+from storages.backends.s3 import S3Storage
+
+from core.media import HashedNameMixin
+
+
+class HashedS3Storage(HashedNameMixin, S3Storage):
+    def key_for(self, name):
+        """Object key of a storage name (names are relative to `location`)"""
+        return posixpath.join(self.location, name) if self.location else name
+
+    @property
+    def client(self):
+        return self.connection.meta.client
@@ -1,5 +1,8 @@
+import importlib.util
 import os
 import dj_database_url
+from corsheaders.defaults import default_headers
+from django.core.exceptions import ImproperlyConfigured
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -33,9 +36,14 @@ INSTALLED_APPS = [
     'products',
     'orders',
     'shopping_cart',
+    'idempotency',
+    'sync',
+    'realtime',
+    'core',
 ]
 
 MIDDLEWARE = [
+    'core.log.RequestIdMiddleware',
     'corsheaders.middleware.CorsMiddleware',  # Must be as high as possible
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -43,6 +51,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.throttling.ThrottleMiddleware',
+    'core.db_router.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,6 +85,10 @@ if DEBUG:
             'NAME': BASE_DIR / 'db.sqlite3',
         }
     }
+elif os.environ.get('DATABASE_URL'):
+    DATABASES = {
+        'default': dj_database_url.parse(os.environ['DATABASE_URL']),
+    }
 else:
     DATABASES = {
         'default': {
@@ -87,6 +101,40 @@ else:
         }
     }
 
+# Connection reuse: keep connections open between requests (seconds, 0 closes
+# after every request) and ping them before reuse so a dropped connection
+# does not surface as a request error
+DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0 if DEBUG else 60))
+DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
+
+# Connection pooling (Django 5.1+ with psycopg 3, `psycopg[pool]` in requirements.txt).
+# A pool replaces persistent connections, so CONN_MAX_AGE must be 0.
+if os.environ.get('DB_POOL', 'False') == 'True' and DATABASES['default']['ENGINE'] == 'django.db.backends.postgresql':
+    if importlib.util.find_spec('psycopg_pool') is None:
+        raise ImproperlyConfigured('DB_POOL=True requires psycopg 3 with its pool: pip install "psycopg[binary,pool]"')
+    DATABASES['default']['CONN_MAX_AGE'] = 0
+    DATABASES['default'].setdefault('OPTIONS', {})['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        'timeout': int(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    }
+
+# Read replica for catalogue browsing, stats and reporting (see core/db_router.py).
+# Any dj_database_url URL works, e.g. sqlite:////tmp/replica.sqlite3 locally.
+if os.environ.get('DATABASE_REPLICA_URL'):
+    DATABASES['replica'] = dj_database_url.parse(
+        os.environ['DATABASE_REPLICA_URL'],
+        conn_max_age=DATABASES['default']['CONN_MAX_AGE'],
+        conn_health_checks=DATABASES['default']['CONN_HEALTH_CHECKS'],
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.db_router.ReplicaRouter']
+REPLICA_DATABASE_ALIAS = 'replica'
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))  # read-your-writes window after a write
+REPLICA_RETRY_SECONDS = 30  # how long an unreachable replica is skipped
+REPLICA_HEALTH_SECONDS = 5  # how long a successful replica health probe is trusted
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -123,6 +171,12 @@ else:
     ]
     CORS_ALLOW_CREDENTIALS = True
 
+CORS_ALLOW_HEADERS = (
+    *default_headers,
+    'idempotency-key',
+)
+CORS_EXPOSE_HEADERS = ['Idempotent-Replayed']
+
 CORS_ALLOW_METHODS = [
     'DELETE',
     'GET',
@@ -169,7 +223,6 @@ else:
 # Static files configuration
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
@@ -194,10 +247,207 @@ if not DEBUG:
     SECURE_HSTS_PRELOAD = True
     SECURE_HSTS_INCLUDE_SUBDOMAINS = True
 
+# Cache: Redis is shared by all gunicorn workers; the local-memory fallback is per process
+REDIS_URL = os.environ.get('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Write-behind cart (see shopping_cart/engine.py). Only safe with a shared cache,
+# so it is enabled by default when Redis is configured. Needs the flush-carts
+# timer from scripts/setup_ec2.sh, and Redis with a volatile-* maxmemory-policy
+# (e.g. volatile-lru) so carts with unflushed changes are never evicted.
+CART_WRITE_BEHIND = os.environ.get('CART_WRITE_BEHIND', str(bool(REDIS_URL))) == 'True'
+CART_FLUSH_OPS = int(os.environ.get('CART_FLUSH_OPS', 20))  # flush after this many mutations
+CART_FLUSH_SECONDS = int(os.environ.get('CART_FLUSH_SECONDS', 60))  # or once the oldest change is this old
+CART_CACHE_TTL = SESSION_COOKIE_AGE
+
+# Idempotency keys (see idempotency/decorators.py)
+IDEMPOTENCY_KEY_TTL = int(os.environ.get('IDEMPOTENCY_KEY_TTL', 86400))  # 24 hours in seconds
+# An in-flight key whose worker died (timeout, OOM, deploy) is taken over by a
+# retry after this long; keep it above GUNICORN_TIMEOUT
+IDEMPOTENCY_IN_FLIGHT_LEASE = int(os.environ.get('IDEMPOTENCY_IN_FLIGHT_LEASE', 150))
+
+# Server-sent events (see realtime/). The stream is served by a separate ASGI
+# service and the in-memory broker only reaches subscribers in the same
+# process, so deployments need Redis for events to reach clients.
+REALTIME_BROKER = 'realtime.broker.RedisBroker' if REDIS_URL else 'realtime.broker.MemoryBroker'
+REALTIME_HEARTBEAT_SECONDS = 15
+REALTIME_RETRY_MS = 3000  # client reconnect delay
+REALTIME_QUEUE_SIZE = 100  # events buffered per subscriber before dropping
+
+# Logging (see core/log.py): records go through a bounded queue to a
+# background thread, so writing them never blocks a request
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+LOG_FORMAT = os.environ.get('LOG_FORMAT', 'text' if DEBUG else 'json')  # 'json' or 'text'
+LOG_QUEUE_SIZE = 10000  # records buffered before new ones are dropped
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'request_id': {'()': 'core.log.RequestIdFilter'},
+    },
+    'handlers': {
+        'queue': {
+            '()': 'core.log.QueuedStreamHandler',
+            'output': LOG_FORMAT,
+            'queue_size': LOG_QUEUE_SIZE,
+            'filters': ['request_id'],
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': LOG_LEVEL,
+    },
+    'loggers': {
+        'django': {'level': 'INFO', 'handlers': ['queue'], 'propagate': False},
+        'django.db.backends': {'level': 'WARNING'},
+    },
+}
+
+# Response compression (see core/compression.py)
+COMPRESSION_ENABLED = os.environ.get('COMPRESSION_ENABLED', 'True') == 'True'
+COMPRESSION_ENCODINGS = ('br', 'zstd', 'gzip')  # server preference
+COMPRESSION_LEVELS = {
+    'br': int(os.environ.get('COMPRESSION_BROTLI_LEVEL', 4)),  # 0-11
+    'zstd': int(os.environ.get('COMPRESSION_ZSTD_LEVEL', 3)),  # 1-22
+    'gzip': int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),  # 1-9
+}
+COMPRESSION_MIN_SIZE = 1024  # bytes; smaller bodies are sent as is
+COMPRESSION_FAST_ABOVE = 1048576  # bytes; larger bodies use the fastest level
+if COMPRESSION_ENABLED:
+    MIDDLEWARE.insert(MIDDLEWARE.index('core.log.RequestIdMiddleware') + 1, 'core.compression.CompressionMiddleware')
+
+# Metrics (see core/metrics.py), scraped from /metrics
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # bearer token for /metrics; without it /metrics only works in DEBUG
+METRICS_DIR = os.environ.get('METRICS_DIR')  # shared directory to merge workers' values
+METRICS_FLUSH_SECONDS = 5
+if METRICS_ENABLED:
+    MIDDLEWARE.insert(0, 'core.metrics.MetricsMiddleware')
+
+# Sampling profiler (see core/profiling.py)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'False') == 'True'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.01))  # share of requests profiled
+PROFILING_INTERVAL_MS = int(os.environ.get('PROFILING_INTERVAL_MS', 5))
+PROFILING_MAX_CONCURRENT = 4  # requests profiled at once per process
+PROFILING_MAX_DEPTH = 64  # frames kept per stack
+PROFILING_MAX_STACKS = 5000  # distinct stacks kept per view
+PROFILING_TOKEN_MAX_AGE = 3600  # seconds an X-Profile-Token stays valid
+PROFILING_DIR = os.environ.get('PROFILING_DIR')  # shared directory to merge workers' samples
+PROFILING_FLUSH_SECONDS = 10
+if PROFILING_ENABLED:
+    MIDDLEWARE.insert(0, 'core.profiling.ProfilingMiddleware')
+
+# Rate limiting (see core/throttling.py). Buckets are "<requests>/<period>"
+# per anonymous IP ('anon') or per user, sized by role ('default' for roles
+# not listed). Route classes: the first THROTTLE_ROUTES prefix that matches,
+# else 'read' for GET/HEAD/OPTIONS and 'write' otherwise.
+THROTTLE_ENABLED = os.environ.get('THROTTLE_ENABLED', 'True') == 'True'
+THROTTLE_PATH_PREFIX = '/api/'
+THROTTLE_ROUTES = [
+    ('auth', ('/api/auth/login/', '/api/auth/register/')),
+    ('batch', ('/api/batch/',)),
+]
+THROTTLE_RATES = {
+    'auth': {'anon': '10/min', 'default': '20/min'},
+    'batch': {'anon': '10/min', 'CUSTOMER': '30/min', 'default': '120/min'},
+    'read': {'anon': '120/min', 'CUSTOMER': '300/min', 'EMPLOYEE': '600/min', 'MANAGER': '1200/min'},
+    'write': {'anon': '30/min', 'CUSTOMER': '60/min', 'EMPLOYEE': '300/min', 'MANAGER': '600/min'},
+}
+THROTTLE_STORE = 'core.throttling.RedisBucketStore' if REDIS_URL else 'core.throttling.LocalBucketStore'
+THROTTLE_CLIENT_IP_HEADER = 'HTTP_X_REAL_IP'  # set by nginx; falls back to REMOTE_ADDR
+THROTTLE_REDIS_RETRY_SECONDS = 30  # per-process buckets for this long after a Redis error
+THROTTLE_LOCAL_MAX_KEYS = 100000  # per-process buckets kept before idle ones are evicted
+if not THROTTLE_ENABLED:
+    MIDDLEWARE.remove('core.throttling.ThrottleMiddleware')
+
+# Batch endpoint (see core/batch.py)
+BATCH_MAX_REQUESTS = 20  # sub-requests per batch
+BATCH_MAX_WORKERS = 4  # threads for parallel read-only batches
+
+# Delta sync (see sync/views.py)
+SYNC_PAGE_SIZE = 500  # maximum rows per collection per sync response
+
+# Bulk accept/reject (see OrderViewSet.bulk_change_status)
+ORDER_BULK_TRANSITION_MAX = int(os.environ.get('ORDER_BULK_TRANSITION_MAX', 1000))  # orders per request
+
+# Order archive (see orders/archive.py). Files go to S3 when a bucket is
+# configured, otherwise to a local directory outside MEDIA_ROOT.
+ORDER_ARCHIVE_AFTER_DAYS = int(os.environ.get('ORDER_ARCHIVE_AFTER_DAYS', 180))
+ORDER_ARCHIVE_BATCH_SIZE = int(os.environ.get('ORDER_ARCHIVE_BATCH_SIZE', 1000))
+ORDER_ARCHIVE_BUCKET = os.environ.get('ORDER_ARCHIVE_BUCKET')
+if ORDER_ARCHIVE_BUCKET:
+    ORDER_ARCHIVE_STORAGE = {
+        'BACKEND': 'storages.backends.s3.S3Storage',
+        'OPTIONS': {
+            'bucket_name': ORDER_ARCHIVE_BUCKET,
+            'location': 'order-archive',
+            'default_acl': 'private',
+            'file_overwrite': False,
+        },
+    }
+else:
+    ORDER_ARCHIVE_STORAGE = {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': os.environ.get('ORDER_ARCHIVE_ROOT', os.path.join(BASE_DIR, 'archive', 'orders')),
+        },
+    }
+
 # Media files (Uploaded files)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Uploads get content-hashed names (see core/media.py)
+STORAGES = {
+    'default': {'BACKEND': 'core.media.HashedFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+}
+
+# S3-compatible media storage. With MEDIA_BUCKET set, uploads live in the
+# bucket (MEDIA_S3_ENDPOINT_URL points at MinIO or another S3 API) and product
+# images are uploaded directly by clients with presigned POSTs (see
+# products/uploads.py), so app servers keep no media on disk. Credentials come
+# from the usual AWS_* environment variables.
+MEDIA_BUCKET = os.environ.get('MEDIA_BUCKET')
+MEDIA_S3_ENDPOINT_URL = os.environ.get('MEDIA_S3_ENDPOINT_URL')
+MEDIA_CUSTOM_DOMAIN = os.environ.get('MEDIA_CUSTOM_DOMAIN')  # CDN host in front of the bucket
+PRODUCT_IMAGE_MAX_SIZE = 5242880  # 5MB
+PRODUCT_IMAGE_UPLOAD_EXPIRES = 600  # seconds a presigned upload stays valid
+if MEDIA_BUCKET:
+    STORAGES['default'] = {
+        'BACKEND': 'core.s3.HashedS3Storage',
+        'OPTIONS': {
+            'bucket_name': MEDIA_BUCKET,
+            'location': 'media',
+            'endpoint_url': MEDIA_S3_ENDPOINT_URL,
+            'addressing_style': 'path' if MEDIA_S3_ENDPOINT_URL else None,
+            'custom_domain': MEDIA_CUSTOM_DOMAIN,
+            'file_overwrite': False,
+            # Objects under media/ are public (see configure_media_bucket);
+            # names are content-hashed or random, so they never change
+            'querystring_auth': False,
+            'object_parameters': {'CacheControl': 'public, max-age=31536000, immutable'},
+        },
+    }
+
+# How media_view hands files off: 'accel' (nginx X-Accel-Redirect),
+# 'sendfile' (X-Sendfile) or 'django' (FileResponse with sendfile and Range)
+MEDIA_DELIVERY = os.environ.get('MEDIA_DELIVERY', 'django')
+MEDIA_ACCEL_PREFIX = '/protected-media/'  # internal nginx location aliasing MEDIA_ROOT
+MEDIA_CACHE_SECONDS = 3600  # max-age for media without a content hash in the name
+
 # Ensure the media directory exists
 MEDIA_ROOT_PATH = Path(MEDIA_ROOT)
 MEDIA_ROOT_PATH.mkdir(exist_ok=True)
@@ -0,0 +1,147 @@
+import shutil
+import tempfile
+from decimal import Decimal
+from unittest import mock
+
+from django.db import DatabaseError, connections
+from django.test import RequestFactory, TestCase, override_settings
+from rest_framework.test import APIClient
+
+from products.models import Product
+from users.models import CustomUser
+from . import db_router, profiling
+from .db_router import PIN_COOKIE, ReplicaRouter, get_replica_alias, read_from_replica
+
+
+# The test run has a single database, so the replica alias points at it: the
+# tests check which alias the router picks (None means the primary), not
+# which database the rows came from.
+@override_settings(REPLICA_DATABASE_ALIAS='default', THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        db_router._replica_down_until.clear()
+        db_router._replica_healthy_until.clear()
+        self.router = ReplicaRouter()
+        self.user = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        self.product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=10)
+
+    def record_reads(self):
+        """Aliases the router returns for reads while the returned list is alive"""
+        reads = []
+        original = ReplicaRouter.db_for_read
+
+        def db_for_read(router, model, **hints):
+            alias = original(router, model, **hints)
+            reads.append(alias)
+            return alias
+
+        patcher = mock.patch.object(ReplicaRouter, 'db_for_read', db_for_read)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return reads
+
+    def test_reads_in_block_go_to_replica(self):
+        self.assertIsNone(self.router.db_for_read(Product))
+        with read_from_replica() as alias:
+            self.assertEqual(alias, 'default')
+            self.assertEqual(self.router.db_for_read(Product), 'default')
+            self.assertEqual(self.router.db_for_write(Product), 'default')
+        self.assertIsNone(self.router.db_for_read(Product))
+
+    def test_pinned_request_reads_from_primary(self):
+        request = RequestFactory().get('/')
+        request.pin_primary = True
+        with read_from_replica(request) as alias:
+            self.assertIsNone(alias)
+            self.assertIsNone(self.router.db_for_read(Product))
+
+    def test_unconfigured_replica_reads_from_primary(self):
+        with override_settings(REPLICA_DATABASE_ALIAS='replica-missing'):
+            self.assertIsNone(get_replica_alias())
+
+    def test_health_probe_is_cached(self):
+        with mock.patch.object(connections['default'], 'ensure_connection') as probe:
+            self.assertEqual(get_replica_alias(), 'default')
+            self.assertEqual(get_replica_alias(), 'default')
+        self.assertEqual(probe.call_count, 1)
+
+    def test_unreachable_replica_is_skipped(self):
+        with mock.patch.object(connections['default'], 'ensure_connection', side_effect=DatabaseError) as probe:
+            self.assertIsNone(get_replica_alias())
+            self.assertIsNone(get_replica_alias())
+        self.assertEqual(probe.call_count, 1)
+
+    def test_viewset_reads_opted_in_actions_from_replica(self):
+        client = APIClient()
+        client.force_login(self.user)
+        reads = self.record_reads()
+        self.assertEqual(client.get('/api/products/').status_code, 200)
+        self.assertIn('default', reads)
+
+    def test_writes_pin_the_client_to_primary(self):
+        client = APIClient()
+        client.force_login(self.user)
+        response = client.patch(f'/api/products/{self.product.pk}/', {'stock': 5}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(PIN_COOKIE, response.cookies)
+
+        reads = self.record_reads()
+        response = client.get('/api/products/')
+        self.assertEqual(response.json()[0]['stock'], 5)
+        self.assertTrue(reads)
+        self.assertEqual(set(reads), {None})
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class ProfilingResetTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        shared_directory = override_settings(PROFILING_DIR=directory)
+        shared_directory.enable()
+        self.addCleanup(shared_directory.disable)
+        patcher = mock.patch.object(profiling, '_sampler', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.client = APIClient()
+        self.client.force_login(CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER'))
+
+    def worker(self, pid, requests):
+        """A sampler standing in for another worker process, with some samples"""
+        sampler = profiling.StackSampler()
+        sampler.pid = pid
+        self.record(sampler, requests)
+        return sampler
+
+    def record(self, sampler, requests):
+        sampler.requests['OrderViewSet.list'] += requests
+        sampler.stacks['OrderViewSet.list']['views:list'] += requests
+        self.flush(sampler)
+
+    def flush(self, sampler):
+        with mock.patch.object(profiling.os, 'getpid', return_value=sampler.pid):
+            sampler.flush()
+
+    def profiled_requests(self):
+        return {view['view']: view['requests'] for view in self.client.get('/api/profiling/').json()['views']}
+
+    def test_reset_reaches_other_workers(self):
+        other = self.worker(pid=999991, requests=3)
+        self.assertEqual(self.profiled_requests(), {'OrderViewSet.list': 3})
+
+        self.assertEqual(self.client.delete('/api/profiling/').status_code, 204)
+        self.assertEqual(self.profiled_requests(), {})
+        # The other worker flushes its old samples after the reset
+        self.flush(other)
+        self.assertEqual(self.profiled_requests(), {})
+
+        self.record(other, requests=1)
+        self.assertEqual(self.profiled_requests(), {'OrderViewSet.list': 1})
+
+    def test_files_from_before_a_reset_are_ignored(self):
+        other = self.worker(pid=999991, requests=3)
+        self.client.delete('/api/profiling/')
+        # Written by a worker that read the old marker just before the reset
+        with mock.patch.object(profiling, 'read_generation', return_value=other.generation):
+            self.flush(other)
+        self.assertEqual(self.profiled_requests(), {})
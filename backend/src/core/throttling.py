@@ -0,0 +1,200 @@
+"""
+Token-bucket rate limiting.
+
+ThrottleMiddleware runs before any view (and, for clients without a session
+cookie, before the session or user is loaded) and answers 429 with
+Retry-After once a bucket is empty. Every request to THROTTLE_PATH_PREFIX is
+assigned a route class (THROTTLE_ROUTES: first matching path prefix, else
+'read' for GET/HEAD/OPTIONS and 'write' for everything else) and a bucket:
+
+- anonymous clients: one bucket per client IP and route class,
+- signed-in users: one bucket per user and route class, sized by role.
+
+THROTTLE_RATES gives the bucket for each route class and scope ('anon', a
+role, or 'default') as "<requests>/<period>": a bucket holds that many
+tokens and refills continuously at requests/period, so short bursts up to
+the full size are allowed.
+
+Every sub-request of /api/batch/ is charged against its own route class as
+well (core/batch.py runs it through this middleware), so a batch of writes
+costs as many write tokens as the same requests sent one by one.
+
+Buckets live in Redis when REDIS_URL is set, updated atomically by a Lua
+script, so all workers and hosts share them. Without Redis, or while Redis
+is unreachable, each process keeps its own buckets behind a lock.
+"""
+import logging
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.http import JsonResponse
+from django.utils.module_loading import import_string
+
+from core.metrics import THROTTLED_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60, 'h': 3600, 'hour': 3600, 'd': 86400, 'day': 86400}
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# KEYS[1] bucket; ARGV capacity, refill per second, cost.
+# Returns {allowed (0/1), milliseconds until `cost` tokens are available}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+
+local allowed = 0
+local wait = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+else
+    wait = math.ceil((cost - tokens) / rate * 1000)
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000))
+return {allowed, wait}
+"""
+
+
+def parse_rate(rate):
+    """'60/min' -> (capacity 60, refill 1.0 token per second)"""
+    count, _, period = rate.partition('/')
+    count = int(count)
+    return count, count / PERIODS[period.strip().lower()]
+
+
+class LocalBucketStore:
+    """Buckets in this process only."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}  # key -> (tokens, monotonic timestamp)
+
+    def take(self, key, capacity, rate, cost=1):
+        """Return (allowed, seconds until `cost` tokens are available)"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is None:
+                if len(self.buckets) >= settings.THROTTLE_LOCAL_MAX_KEYS:
+                    self._evict(now)
+                bucket = (capacity, now)
+            tokens, ts = bucket
+            tokens = min(capacity, tokens + (now - ts) * rate)
+            if tokens >= cost:
+                self.buckets[key] = (tokens - cost, now)
+                return True, 0.0
+            self.buckets[key] = (tokens, now)
+            return False, (cost - tokens) / rate
+
+    def _evict(self, now):
+        # Buckets untouched for an hour are full again anyway; if that is not
+        # enough, drop the least recently used half
+        buckets = {key: value for key, value in self.buckets.items() if now - value[1] < 3600}
+        if len(buckets) >= settings.THROTTLE_LOCAL_MAX_KEYS:
+            recent = sorted(buckets.items(), key=lambda item: item[1][1])[len(buckets) // 2:]
+            buckets = dict(recent)
+        self.buckets = buckets
+
+
+class RedisBucketStore:
+    """Buckets shared through Redis; falls back to local buckets while Redis is down."""
+
+    prefix = 'throttle:'
+
+    def __init__(self):
+        import redis
+
+        self.errors = (redis.RedisError,)
+        self.client = redis.Redis.from_url(settings.REDIS_URL, socket_timeout=0.1, socket_connect_timeout=0.1)
+        self.script = self.client.register_script(TOKEN_BUCKET_SCRIPT)
+        self.fallback = LocalBucketStore()
+        self.down_until = 0.0
+
+    def take(self, key, capacity, rate, cost=1):
+        if self.down_until > time.monotonic():
+            return self.fallback.take(key, capacity, rate, cost)
+        try:
+            allowed, wait_ms = self.script(keys=[self.prefix + key], args=[capacity, rate, cost])
+        except self.errors:
+            retry_after = settings.THROTTLE_REDIS_RETRY_SECONDS
+            logger.warning("Throttle store unreachable, using per-process buckets for %ss", retry_after)
+            self.down_until = time.monotonic() + retry_after
+            return self.fallback.take(key, capacity, rate, cost)
+        return bool(allowed), wait_ms / 1000
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = import_string(settings.THROTTLE_STORE)()
+    return _store
+
+
+def route_class(request):
+    for name, prefixes in settings.THROTTLE_ROUTES:
+        if request.path.startswith(prefixes):
+            return name
+    return 'read' if request.method in SAFE_METHODS else 'write'
+
+
+def client_ip(request):
+    header = settings.THROTTLE_CLIENT_IP_HEADER
+    return (header and request.META.get(header)) or request.META.get('REMOTE_ADDR', '')
+
+
+def identify(request):
+    """(bucket identity, rate scope) for the client making `request`"""
+    # Without a session cookie the client is anonymous; skip loading the user
+    if settings.SESSION_COOKIE_NAME in request.COOKIES and request.user.is_authenticated:
+        return f'user:{request.user.pk}', request.user.role
+    return f'ip:{client_ip(request)}', 'anon'
+
+
+class ThrottleMiddleware:
+    """Reject requests over their token bucket with 429 (see module docstring)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(settings.THROTTLE_PATH_PREFIX):
+            return self.get_response(request)
+
+        name = route_class(request)
+        identity, scope = identify(request)
+        rates = settings.THROTTLE_RATES[name]
+        rate = rates.get(scope) or rates.get('default')
+        if rate is None:
+            return self.get_response(request)
+
+        capacity, refill = parse_rate(rate)
+        allowed, wait = get_store().take(f'{name}:{identity}', capacity, refill)
+        if allowed:
+            return self.get_response(request)
+
+        THROTTLED_REQUESTS.inc(name, scope)
+        retry_after = max(1, math.ceil(wait))
+        response = JsonResponse(
+            {'detail': f'Request was throttled. Expected available in {retry_after} seconds.'},
+            status=429,
+        )
+        response['Retry-After'] = str(retry_after)
+        return response
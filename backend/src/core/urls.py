@@ -19,9 +19,12 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from users.views import UserViewSet, login_view, logout_view, csrf_token, register_view, session_check
 from users.admin_views import UserManagementViewSet
+from realtime.views import events_view
+from core.batch import batch_view
+from core.media import media_view
+from core.metrics import metrics_view
+from core.profiling import profiles_view, profile_stacks_view, profile_token_view
 from django.conf import settings
-from django.conf.urls.static import static
-from django.views.static import serve
 
 # Create a router for admin endpoints
 admin_router = DefaultRouter()
@@ -43,12 +46,17 @@ urlpatterns = [
     path('api/products/', include('products.urls')),
     path('api/orders/', include('orders.urls')),
     path('api/shopping-cart/', include('shopping_cart.urls')),
+    path('api/sync/', include('sync.urls')),
+    path('api/events/', events_view),
+    path('api/batch/', batch_view),
+    path('metrics', metrics_view),
+    path('api/profiling/', profiles_view),
+    path('api/profiling/token/', profile_token_view),
+    path('api/profiling/<str:view>/', profile_stacks_view),
 ]
 
-# Serve media files
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-else:
-    urlpatterns += [
-        path('media/<path:path>/', serve, {'document_root': settings.MEDIA_ROOT}),
-    ]
+# Serve media files. In production nginx answers /media/ itself; requests that
+# still get here are handed back to it (or streamed) by media_view.
+urlpatterns += [
+    path(f"{settings.MEDIA_URL.lstrip('/')}<path:path>", media_view),
+]
@@ -0,0 +1,3 @@
+"""
+Idempotency-Key support for retried mutating requests
+"""
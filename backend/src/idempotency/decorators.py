@@ -0,0 +1,130 @@
+import hashlib
+import json
+import logging
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import QueryDict
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+# Response headers stored with the key and sent again on replay; clients use
+# the ETag as the If-Match of their next change
+STORED_HEADERS = ('ETag', 'Location')
+
+
+def request_fingerprint(request):
+    data = request.data
+    if isinstance(data, QueryDict):
+        data = dict(data.lists())
+    payload = json.dumps(data, sort_keys=True, default=str)
+    raw = f"{request.method}\n{request.get_full_path()}\n{payload}"
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _claim_key(user, key, fingerprint):
+    """
+    Insert the key as "in flight". Returns (record, created); an expired
+    record with the same key is evicted and replaced, and an in-flight claim
+    older than IDEMPOTENCY_IN_FLIGHT_LEASE (its worker died without cleaning
+    up) is taken over by this request.
+    """
+    now = timezone.now()
+    expires_at = now + timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 86400))
+    lease = timedelta(seconds=getattr(settings, 'IDEMPOTENCY_IN_FLIGHT_LEASE', 150))
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return IdempotencyKey.objects.create(
+                    user=user, key=key, fingerprint=fingerprint, claimed_at=now, expires_at=expires_at
+                ), True
+        except IntegrityError:
+            record = IdempotencyKey.objects.filter(user=user, key=key).first()
+            if record is None:
+                continue
+            if record.expires_at <= now:
+                record.delete()
+                continue
+            if record.is_complete or record.fingerprint != fingerprint or record.claimed_at > now - lease:
+                return record, False
+            # Conditional update so only one retry takes over the stale claim
+            taken = IdempotencyKey.objects.filter(
+                pk=record.pk, status_code__isnull=True, claimed_at=record.claimed_at
+            ).update(claimed_at=now, expires_at=expires_at)
+            if taken:
+                logger.warning("Taking over stale in-flight idempotency key %s", key)
+                record.claimed_at = now
+                record.expires_at = expires_at
+                return record, True
+            return IdempotencyKey.objects.filter(pk=record.pk).first(), False
+    return None, False
+
+
+def idempotent(view_method):
+    """
+    Make a viewset method safe to retry with an `Idempotency-Key` header.
+
+    The first request with a key executes normally and its response is stored;
+    retries with the same key and body replay the stored response (body,
+    status and STORED_HEADERS) without running the view again. Requests
+    without the header are unaffected.
+    """
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key or not request.user.is_authenticated:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > 255:
+            return Response(
+                {'detail': f'{HEADER} must be at most 255 characters'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        fingerprint = request_fingerprint(request)
+        record, created = _claim_key(request.user, key, fingerprint)
+        if record is None:
+            return Response(
+                {'detail': 'A request with this idempotency key is already in progress'},
+                status=status.HTTP_409_CONFLICT
+            )
+        if not created:
+            if record.fingerprint != fingerprint:
+                return Response(
+                    {'detail': 'This idempotency key was already used with a different request'},
+                    status=status.HTTP_422_UNPROCESSABLE_ENTITY
+                )
+            if not record.is_complete:
+                return Response(
+                    {'detail': 'A request with this idempotency key is already in progress'},
+                    status=status.HTTP_409_CONFLICT
+                )
+            logger.info("Replaying response for idempotency key %s", key)
+            headers = {**(record.response_headers or {}), REPLAYED_HEADER: 'true'}
+            return Response(record.response_body, status=record.status_code, headers=headers)
+
+        try:
+            response = view_method(self, request, *args, **kwargs)
+        except BaseException:
+            record.delete()
+            raise
+
+        # Server errors are not stored so the client can retry them
+        if response.status_code >= 500 or not hasattr(response, 'data'):
+            record.delete()
+        else:
+            record.status_code = response.status_code
+            record.response_body = response.data
+            record.response_headers = {name: response[name] for name in STORED_HEADERS if response.has_header(name)}
+            record.save(update_fields=['status_code', 'response_body', 'response_headers'])
+        return response
+
+    return wrapper
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('idempotency', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='claimed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
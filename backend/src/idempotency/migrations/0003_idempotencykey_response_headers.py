@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 02:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('idempotency', '0002_idempotencykey_claimed_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='response_headers',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
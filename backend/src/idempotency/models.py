@@ -0,0 +1,25 @@
+from django.db import models
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+from users.models import CustomUser
+
+class IdempotencyKey(models.Model):
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    key = models.CharField(max_length=255)
+    fingerprint = models.CharField(max_length=64)  # sha256 of method, path and body
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True)  # null while the request is in flight
+    response_body = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    response_headers = models.JSONField(null=True, blank=True)  # ETag/Location of the stored response
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(default=timezone.now)  # when the current in-flight attempt started
+    expires_at = models.DateTimeField(db_index=True)
+
+    class Meta:
+        unique_together = ('user', 'key')
+
+    def __str__(self):
+        return f"{self.key} for {self.user_id}"
+
+    @property
+    def is_complete(self):
+        return self.status_code is not None
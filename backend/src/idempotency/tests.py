@@ -0,0 +1,90 @@
+from datetime import timedelta
+
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from orders.models import Order
+from products.models import Product
+from users.models import CustomUser
+from .models import IdempotencyKey
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class IdempotentCreateOrderTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        self.product = Product.objects.create(name='Seeds', price='12.50', stock=100)
+        self.client = APIClient()
+        self.client.force_login(self.user)
+        self.body = {'shipping_address': 'Farm road 1', 'items': [{'product_id': self.product.pk, 'quantity': 2}]}
+
+    def post(self, body=None, key='order-1'):
+        return self.client.post('/api/orders/', body or self.body, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_stored_response(self):
+        first = self.post()
+        second = self.post()
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(second.status_code, 201)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.json()['id'], first.json()['id'])
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_replay_restores_etag(self):
+        first = self.post()
+        self.assertEqual(first['ETag'], '"1"')
+        second = self.post()
+        self.assertEqual(second['ETag'], '"1"')
+        # The replayed ETag is usable as the If-Match of the next change
+        manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        self.client.force_login(manager)
+        response = self.client.post(f"/api/orders/{second.json()['id']}/accept/", HTTP_IF_MATCH=second['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_key_reused_with_different_body_is_rejected(self):
+        self.post()
+        response = self.post({**self.body, 'shipping_address': 'Elsewhere'})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_keys_are_per_user(self):
+        self.post()
+        other = CustomUser.objects.create_user(username='other', password='secret', role='CUSTOMER')
+        self.client.force_login(other)
+        self.assertEqual(self.post().status_code, 201)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_in_flight_key_answers_conflict(self):
+        self.make_in_flight(claimed_at=timezone.now())
+        response = self.post()
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Order.objects.count(), 0)
+
+    @override_settings(IDEMPOTENCY_IN_FLIGHT_LEASE=60)
+    def test_stale_in_flight_key_is_taken_over(self):
+        # The worker handling the first attempt died without releasing the key
+        self.make_in_flight(claimed_at=timezone.now() - timedelta(seconds=120))
+        response = self.post()
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.post()['Idempotent-Replayed'], 'true')
+
+    def test_expired_key_runs_again(self):
+        self.post()
+        IdempotencyKey.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.post()
+        self.assertEqual(response.status_code, 201)
+        self.assertNotIn('Idempotent-Replayed', response)
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_validation_error_releases_key(self):
+        self.assertEqual(self.post({'items': self.body['items']}).status_code, 400)
+        # The corrected request may reuse the key
+        self.assertEqual(self.post().status_code, 201)
+
+    def make_in_flight(self, claimed_at):
+        """Leave the key claimed by a request that has not finished"""
+        self.post()
+        Order.objects.all().delete()
+        IdempotencyKey.objects.update(status_code=None, response_body=None, claimed_at=claimed_at)
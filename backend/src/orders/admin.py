@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Order, OrderItem
+from .models import Order, OrderItem, OrderEvent, ArchivedOrder
 
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
@@ -32,3 +32,27 @@ class OrderItemAdmin(admin.ModelAdmin):
     search_fields = ('order__user__username', 'product__name')
     ordering = ('-order__created_at',)
     readonly_fields = ('price',)
+
+@admin.register(OrderEvent)
+class OrderEventAdmin(admin.ModelAdmin):
+    list_display = ('order', 'event_type', 'actor', 'created_at')
+    list_filter = ('event_type', 'month')
+    ordering = ('-id',)
+    readonly_fields = ('order', 'actor', 'event_type', 'payload', 'month', 'created_at')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    list_display = ('order_id', 'user', 'status', 'total_amount', 'created_at', 'archived_at')
+    list_filter = ('status',)
+    search_fields = ('order_id',)
+    ordering = ('-order_id',)
+    readonly_fields = ('order_id', 'user', 'status', 'total_amount', 'created_at', 'path', 'archived_at')
@@ -0,0 +1,168 @@
+"""
+Cold storage for closed orders.
+
+Accepted and rejected orders that have not changed for
+ORDER_ARCHIVE_AFTER_DAYS are written with their items to gzip-compressed
+JSON Lines files (one file per batch) on ORDER_ARCHIVE_STORAGE, indexed by
+ArchivedOrder and deleted from the hot tables. load_archived_order reads a
+single order back for the API.
+
+Archived orders are still served by the API, so the sync app does not send
+tombstones for orders that have an ArchivedOrder entry. The file is written
+inside the transaction (so the rows are never gone before their archive
+exists) and removed again if the transaction rolls back.
+"""
+import gzip
+import io
+import json
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import ArchivedOrder, Order
+
+logger = logging.getLogger(__name__)
+
+CLOSED_STATUSES = ('accepted', 'rejected')
+
+_storage = None
+
+
+def get_archive_storage():
+    global _storage
+    if _storage is None:
+        config = settings.ORDER_ARCHIVE_STORAGE
+        _storage = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+    return _storage
+
+
+def serialize_order(order):
+    """Snapshot of an order in the shape OrderSerializer returns"""
+    user = order.user
+    return {
+        'id': order.id,
+        'user': user.id,
+        'username': user.username,
+        'user_details': {
+            'id': user.id,
+            'username': user.username,
+            'role': user.role,
+            'phone': user.phone,
+            'address': user.address,
+        },
+        'status': order.status,
+        'total_amount': order.total_amount,
+        'shipping_address': order.shipping_address,
+        'created_at': order.created_at,
+        'updated_at': order.updated_at,
+        'payment_deadline': order.payment_deadline,
+        'days_remaining': 0,
+        'created_by_role': order.created_by_role,
+        'location_state': order.location_state,
+        'location_display_name': order.location_display_name,
+        'location_latitude': order.location_latitude,
+        'location_longitude': order.location_longitude,
+        'version': order.version,
+        'items': [
+            {
+                'id': item.id,
+                'product_detail': {
+                    'id': item.product_id,
+                    'name': item.product.name,
+                    'price': item.product.price,
+                },
+                'quantity': item.quantity,
+                'price': item.price,
+            }
+            for item in order.items.all()
+        ],
+    }
+
+
+def write_archive_file(orders, now):
+    buffer = io.BytesIO()
+    with gzip.GzipFile(fileobj=buffer, mode='wb') as archive:
+        for order in orders:
+            archive.write(json.dumps(serialize_order(order), cls=DjangoJSONEncoder).encode() + b'\n')
+    name = f"{now:%Y/%m}/orders-{orders[0].id}-{orders[-1].id}-{now:%Y%m%dT%H%M%S}.jsonl.gz"
+    return get_archive_storage().save(name, ContentFile(buffer.getvalue()))
+
+
+def archive_batch(cutoff, batch_size):
+    """Archive and delete up to batch_size closed orders. Returns the number archived."""
+    path = None
+    try:
+        with transaction.atomic():
+            orders = list(
+                Order.objects.select_for_update(of=('self',))
+                .filter(status__in=CLOSED_STATUSES, updated_at__lt=cutoff)
+                .select_related('user')
+                .prefetch_related('items__product')
+                .order_by('id')[:batch_size]
+            )
+            if not orders:
+                return 0
+
+            now = timezone.now()
+            path = write_archive_file(orders, now)
+            ArchivedOrder.objects.bulk_create([
+                ArchivedOrder(
+                    order_id=order.id,
+                    user_id=order.user_id,
+                    status=order.status,
+                    total_amount=order.total_amount,
+                    created_at=order.created_at,
+                    path=path,
+                )
+                for order in orders
+            ])
+            ids = [order.id for order in orders]
+            # Cascades to the items; the ArchivedOrder rows above keep sync
+            # from sending tombstones for these orders
+            Order.objects.filter(id__in=ids).delete()
+    except BaseException:
+        # Rolled back, so the orders are still in the hot tables and the
+        # file would be an orphan
+        if path is not None:
+            get_archive_storage().delete(path)
+        raise
+    logger.info("Archived %d orders (%d-%d) to %s", len(orders), ids[0], ids[-1], path)
+    return len(orders)
+
+
+def archive_orders(older_than_days=None, batch_size=None, max_batches=None):
+    if older_than_days is None:
+        older_than_days = settings.ORDER_ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        count = archive_batch(cutoff, batch_size)
+        if not count:
+            break
+        archived += count
+        batches += 1
+    return archived
+
+
+def load_archived_order(entry):
+    """Read one order back from its archive file, or None if it is missing"""
+    prefix = f'{{"id": {entry.order_id},'.encode()
+    try:
+        with get_archive_storage().open(entry.path, 'rb') as stored:
+            with gzip.GzipFile(fileobj=stored) as archive:
+                for line in archive:
+                    if line.startswith(prefix):
+                        return json.loads(line)
+    except (OSError, EOFError):
+        logger.exception("Cannot read archive %s for order %s", entry.path, entry.order_id)
+        return None
+    logger.error("Order %s not found in archive %s", entry.order_id, entry.path)
+    return None
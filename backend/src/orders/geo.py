@@ -0,0 +1,117 @@
+"""
+Geohash helpers for spatial queries over order locations without PostGIS.
+
+Orders store a geohash of their coordinates in an indexed column. Bounding
+box and radius queries first narrow rows with geohash prefix lookups (index
+range scans), then apply exact latitude/longitude or great-circle filters.
+"""
+import math
+
+from django.db.models import F, FloatField, Q, Value
+from django.db.models.functions import ASin, Cast, Cos, Power, Radians, Sin, Sqrt
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+EARTH_RADIUS_KM = 6371.0088
+GEOHASH_PRECISION = 9  # ~5m cells
+MAX_COVER_CELLS = 32
+
+
+def encode(latitude, longitude, precision=GEOHASH_PRECISION):
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    latitude, longitude = float(latitude), float(longitude)
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True
+    while len(geohash) < precision:
+        rng, value = (lon_range, longitude) if even else (lat_range, latitude)
+        mid = (rng[0] + rng[1]) / 2
+        bits <<= 1
+        if value >= mid:
+            bits |= 1
+            rng[0] = mid
+        else:
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+    return ''.join(geohash)
+
+
+def cell_size(precision):
+    """Return (height in degrees latitude, width in degrees longitude) of a cell."""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lon_bits)
+
+
+def covering_cells(min_lat, min_lon, max_lat, max_lon):
+    """
+    Return the geohash prefixes of the finest precision that covers the box
+    with at most MAX_COVER_CELLS cells, or an empty list if even one-character
+    cells would need more.
+    """
+    best = []
+    for precision in range(1, GEOHASH_PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = math.floor(max_lat / height) - math.floor(min_lat / height) + 1
+        cols = math.floor(max_lon / width) - math.floor(min_lon / width) + 1
+        if rows * cols > MAX_COVER_CELLS:
+            break
+        cells = set()
+        for row in range(rows):
+            lat = min(min_lat + row * height, max_lat)
+            for col in range(cols):
+                lon = min(min_lon + col * width, max_lon)
+                cells.add(encode(lat, lon, precision))
+        best = sorted(cells)
+    return best
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """Return (min_lat, min_lon, max_lat, max_lon) enclosing a circle."""
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(latitude)), 1e-6)
+    dlon = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return (
+        max(-90.0, latitude - dlat), max(-180.0, longitude - dlon),
+        min(90.0, latitude + dlat), min(180.0, longitude + dlon),
+    )
+
+
+def bbox_filter(min_lat, min_lon, max_lat, max_lon):
+    """Q object selecting orders inside the box, using the geohash index where possible."""
+    query = Q(
+        location_latitude__gte=min_lat, location_latitude__lte=max_lat,
+        location_longitude__gte=min_lon, location_longitude__lte=max_lon,
+    )
+    cells = covering_cells(min_lat, min_lon, max_lat, max_lon)
+    if cells:
+        prefix_query = Q()
+        for cell in cells:
+            prefix_query |= Q(location_geohash__startswith=cell)
+        query &= prefix_query
+    return query
+
+
+def distance_km_expression(latitude, longitude):
+    """Great-circle (haversine) distance from a point, as a database expression."""
+    lat = Radians(Cast(F('location_latitude'), FloatField()))
+    lon = Radians(Cast(F('location_longitude'), FloatField()))
+    lat0 = Value(math.radians(latitude), output_field=FloatField())
+    lon0 = Value(math.radians(longitude), output_field=FloatField())
+    a = (
+        Power(Sin((lat - lat0) / 2), 2)
+        + Cos(lat0) * Cos(lat) * Power(Sin((lon - lon0) / 2), 2)
+    )
+    return Value(2 * EARTH_RADIUS_KM, output_field=FloatField()) * ASin(Sqrt(a))
+
+
+def zoom_to_precision(zoom):
+    """Map a web-map zoom level (0-20) to a clustering geohash precision."""
+    return max(1, min(GEOHASH_PRECISION, (int(zoom) + 1) // 3 + 1))
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from orders.archive import archive_orders
+
+class Command(BaseCommand):
+    help = 'Moves closed orders older than ORDER_ARCHIVE_AFTER_DAYS to compressed archive files (run nightly from cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.ORDER_ARCHIVE_AFTER_DAYS)
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None)
+
+    def handle(self, *args, **options):
+        archived = archive_orders(options['days'], options['batch_size'], options['max_batches'])
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} orders'))
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:56
+
+from django.db import migrations, models
+
+from orders.geo import encode
+
+
+def backfill_geohash(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    orders = Order.objects.filter(location_latitude__isnull=False, location_longitude__isnull=False)
+    batch = []
+    for order in orders.only('id', 'location_latitude', 'location_longitude').iterator(chunk_size=2000):
+        order.location_geohash = encode(order.location_latitude, order.location_longitude)
+        batch.append(order)
+        if len(batch) >= 2000:
+            Order.objects.bulk_update(batch, ['location_geohash'])
+            batch = []
+    if batch:
+        Order.objects.bulk_update(batch, ['location_geohash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_alter_order_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='location_geohash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=12),
+        ),
+        migrations.RunPython(backfill_geohash, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_order_location_geohash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='version',
+            field=models.PositiveIntegerField(default=1),
+        ),
+    ]
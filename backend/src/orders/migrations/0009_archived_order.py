@@ -0,0 +1,31 @@
+# Generated by Django 5.1.15 on 2026-10-19 00:06
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_event'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedOrder',
+            fields=[
+                ('order_id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected')], max_length=20)),
+                ('total_amount', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('created_at', models.DateTimeField()),
+                ('path', models.CharField(max_length=255)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'created_at'], name='orders_arch_user_id_101d40_idx')],
+            },
+        ),
+    ]
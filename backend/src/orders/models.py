@@ -1,9 +1,27 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import F
 from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
 from products.models import Product
 from django.utils import timezone
 from datetime import datetime
 from users.models import CustomUser
+from .geo import encode as geohash_encode
+from .signals import orders_transitioned
+from core.metrics import ORDER_TRANSITIONS
+
+class OrderConflict(Exception):
+    """The order was changed by someone else since the client read it."""
+    def __init__(self, status, version):
+        self.status = status
+        self.version = version
+        super().__init__("Order was modified by another user. Reload it and try again.")
+
+class IllegalTransition(Exception):
+    def __init__(self, status, version, new_status):
+        self.status = status
+        self.version = version
+        super().__init__(f"Cannot change order status from {status} to {new_status}")
 
 class Order(models.Model):
     STATUS_CHOICES = [
@@ -12,6 +30,11 @@ class Order(models.Model):
         ('rejected', 'Rejected')
     ]
 
+    # Allowed status transitions: current status -> reachable statuses
+    TRANSITIONS = {
+        'pending': ('accepted', 'rejected'),
+    }
+
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     total_amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -25,7 +48,9 @@ class Order(models.Model):
     location_display_name = models.TextField(blank=True, default='')
     location_latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     location_longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    location_geohash = models.CharField(max_length=12, blank=True, default='', db_index=True)  # Maintained on save for spatial queries
     created_by_role = models.CharField(max_length=20, default='CUSTOMER')  # To track which role created the order
+    version = models.PositiveIntegerField(default=1)  # Incremented on every transition/edit for optimistic locking
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
@@ -35,7 +60,14 @@ class Order(models.Model):
         self.total_amount = total
         return total
 
+    def update_geohash(self):
+        if self.location_latitude is not None and self.location_longitude is not None:
+            self.location_geohash = geohash_encode(self.location_latitude, self.location_longitude)
+        else:
+            self.location_geohash = ''
+
     def save(self, *args, **kwargs):
+        self.update_geohash()
         if self.pk:  # If order already exists
             self.calculate_total()
         super().save(*args, **kwargs)
@@ -43,6 +75,26 @@ class Order(models.Model):
             self.calculate_total()
             super().save(*args, **kwargs)
 
+    @classmethod
+    def create_with_items(cls, lines, products, **fields):
+        """
+        Create an order from (product_id, quantity) lines in two INSERTs: the
+        order with its total computed once, then all items in one batch, each
+        with the current product price as its price snapshot. Both run in one
+        transaction (a savepoint inside the caller's), so an order never
+        exists without its items.
+        """
+        items = [
+            OrderItem(product=products[product_id], quantity=quantity, price=products[product_id].price)
+            for product_id, quantity in lines
+        ]
+        with transaction.atomic():
+            order = cls.objects.create(total_amount=sum(item.price * item.quantity for item in items), **fields)
+            for item in items:
+                item.order = order
+            OrderItem.objects.bulk_create(items)
+        return order
+
     def get_days_remaining(self):
         if self.status != 'pending':
             return 0
@@ -51,13 +103,114 @@ class Order(models.Model):
         days = remaining.days
         return days  # Can be negative for overdue payments
 
-    def accept_order(self):
-        self.status = 'accepted'
-        self.save()
+    @classmethod
+    def sources_for(cls, new_status):
+        return [status for status, targets in cls.TRANSITIONS.items() if new_status in targets]
+
+    def _raise_for_failed_update(self, expected_version, new_status=None):
+        current = Order.objects.filter(pk=self.pk).values('status', 'version').first()
+        if current is None:
+            raise Order.DoesNotExist
+        if expected_version is not None and current['version'] != expected_version:
+            raise OrderConflict(current['status'], current['version'])
+        raise IllegalTransition(current['status'], current['version'], new_status)
+
+    def transition(self, new_status, expected_version=None, actor=None):
+        """
+        Move the order to new_status with a single conditional UPDATE. The
+        WHERE clause enforces the state machine and, when expected_version is
+        given, that nobody changed the order since it was read. The change is
+        logged as an OrderEvent in the same transaction.
+        """
+        filters = {'pk': self.pk, 'status__in': self.sources_for(new_status)}
+        if expected_version is not None:
+            filters['version'] = expected_version
+        now = timezone.now()
+        with transaction.atomic():
+            updated = Order.objects.filter(**filters).update(
+                status=new_status, version=F('version') + 1, updated_at=now
+            )
+            if not updated:
+                self._raise_for_failed_update(expected_version, new_status)
+
+            old_status = self.status
+            self.status = new_status
+            self.updated_at = now
+            if expected_version is not None:
+                self.version = expected_version + 1
+            else:
+                self.version = Order.objects.values_list('version', flat=True).get(pk=self.pk)
+            OrderEvent.record(self, 'status', actor, {'from': old_status, 'to': new_status, 'version': self.version})
+        ORDER_TRANSITIONS.inc(new_status)
+        orders_transitioned.send(sender=Order, orders=[self])
 
-    def reject_order(self):
-        self.status = 'rejected'
-        self.save()
+    @classmethod
+    def bulk_transition(cls, queryset, new_status, actor=None, limit=None):
+        """
+        Move every order of queryset that may reach new_status there with one
+        conditional UPDATE. The candidate rows are locked first so the
+        returned orders, their events (one batched INSERT) and the published
+        changes are exactly the rows this call moved; at most `limit` orders
+        move, lowest ids first. Returns those orders with only id, user_id,
+        status, version and updated_at set.
+        """
+        now = timezone.now()
+        sources = cls.sources_for(new_status)
+        with transaction.atomic():
+            candidates = (
+                queryset.filter(status__in=sources).select_for_update()
+                .order_by('pk').values_list('pk', 'user_id', 'status', 'version')
+            )
+            candidates = list(candidates[:limit] if limit else candidates)
+            if not candidates:
+                return []
+            ids = [pk for pk, *_ in candidates]
+            updated = Order.objects.filter(pk__in=ids, status__in=sources).update(
+                status=new_status, version=F('version') + 1, updated_at=now
+            )
+            if updated != len(ids):
+                # Rows changed between the SELECT and the UPDATE (no row locks on SQLite)
+                moved = set(Order.objects.filter(pk__in=ids, status=new_status, updated_at=now).values_list('pk', flat=True))
+                candidates = [row for row in candidates if row[0] in moved]
+
+            orders = [
+                cls(id=pk, user_id=user_id, status=new_status, version=version + 1, updated_at=now)
+                for pk, user_id, _, version in candidates
+            ]
+            OrderEvent.objects.bulk_create([
+                OrderEvent.build(order, 'status', actor, {'from': old_status, 'to': new_status, 'version': order.version})
+                for order, (_, _, old_status, _) in zip(orders, candidates)
+            ])
+        ORDER_TRANSITIONS.inc(new_status, amount=len(orders))
+        orders_transitioned.send(sender=Order, orders=orders)
+        return orders
+
+    def save_if_version(self, expected_version, fields):
+        """
+        Compare-and-swap write of the given fields that bumps the version.
+        Raises OrderConflict if the stored version no longer matches.
+        """
+        filters = {'pk': self.pk}
+        if expected_version is not None:
+            filters['version'] = expected_version
+        self.updated_at = timezone.now()
+        updated = Order.objects.filter(**filters).update(
+            version=F('version') + 1,
+            updated_at=self.updated_at,
+            **{field: getattr(self, field) for field in fields}
+        )
+        if not updated:
+            self._raise_for_failed_update(expected_version)
+        if expected_version is not None:
+            self.version = expected_version + 1
+        else:
+            self.version = Order.objects.values_list('version', flat=True).get(pk=self.pk)
+
+    def accept_order(self, expected_version=None, actor=None):
+        self.transition('accepted', expected_version, actor)
+
+    def reject_order(self, expected_version=None, actor=None):
+        self.transition('rejected', expected_version, actor)
 
 class OrderItem(models.Model):
     order = models.ForeignKey(Order, related_name='items', on_delete=models.CASCADE)
@@ -72,3 +225,90 @@ class OrderItem(models.Model):
         if not self.price:
             self.price = self.product.price
         super().save(*args, **kwargs)
+
+def month_bucket(value):
+    return value.date().replace(day=1)
+
+class OrderEvent(models.Model):
+    """
+    Append-only history of order changes. Rows are only ever inserted, are
+    bucketed by month so history queries and retention work on whole months,
+    and do not reference orders with a database constraint so the log
+    outlives archived or deleted orders.
+    """
+    EVENT_TYPES = [
+        ('created', 'Created'),
+        ('status', 'Status changed'),
+        ('edited', 'Edited')
+    ]
+
+    order = models.ForeignKey(Order, on_delete=models.DO_NOTHING, db_constraint=False, related_name='events')
+    actor = models.ForeignKey(
+        CustomUser, on_delete=models.DO_NOTHING, db_constraint=False, null=True, blank=True, related_name='+'
+    )
+    event_type = models.CharField(max_length=20, choices=EVENT_TYPES)
+    payload = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    month = models.DateField(editable=False)  # First day of the month of created_at
+    created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+    class Meta:
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['order', 'id']),
+            models.Index(fields=['month', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Order #{self.order_id} {self.event_type} at {self.created_at}"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Order events are append-only")
+        self.month = month_bucket(self.created_at)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def build(cls, order, event_type, actor=None, payload=None):
+        now = timezone.now()
+        return cls(
+            order_id=order.pk,
+            actor_id=getattr(actor, 'pk', None),
+            event_type=event_type,
+            payload=payload or {},
+            month=month_bucket(now),
+            created_at=now
+        )
+
+    @classmethod
+    def record(cls, order, event_type, actor=None, payload=None):
+        event = cls.build(order, event_type, actor, payload)
+        event.save()
+        return event
+
+    @classmethod
+    def in_range(cls, since=None, until=None):
+        """Events created in [since, until), pruned to the matching month buckets first"""
+        queryset = cls.objects.all()
+        if since is not None:
+            queryset = queryset.filter(month__gte=month_bucket(since), created_at__gte=since)
+        if until is not None:
+            queryset = queryset.filter(month__lte=month_bucket(until), created_at__lt=until)
+        return queryset
+
+class ArchivedOrder(models.Model):
+    """Index of closed orders moved to cold storage (see orders/archive.py)"""
+    order_id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.DO_NOTHING, db_constraint=False, related_name='+')
+    status = models.CharField(max_length=20, choices=Order.STATUS_CHOICES)
+    total_amount = models.DecimalField(max_digits=10, decimal_places=2)
+    created_at = models.DateTimeField()
+    path = models.CharField(max_length=255)  # Archive file in ORDER_ARCHIVE_STORAGE
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.order_id} in {self.path}"
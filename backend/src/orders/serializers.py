@@ -1,11 +1,14 @@
 from rest_framework import serializers
-from .models import Order, OrderItem
+from .models import Order, OrderItem, OrderEvent
 from products.serializers import ProductSerializer
 from users.models import CustomUser
 from products.models import Product
 from django.db import transaction
+from django.conf import settings
+from django.db.models import prefetch_related_objects
 import logging
 from shopping_cart.models import Cart
+from core.metrics import ORDERS_CREATED
 
 logger = logging.getLogger(__name__)
 
@@ -35,9 +38,10 @@ class OrderSerializer(serializers.ModelSerializer):
             'id', 'user', 'user_details', 'username', 'status', 'total_amount', 
             'shipping_address', 'created_at', 'updated_at', 'items', 'payment_deadline', 
             'days_remaining', 'created_by_role', 'location_state', 'location_display_name',
-            'location_latitude', 'location_longitude'
+            'location_latitude', 'location_longitude', 'version'
         ]
-        read_only_fields = ['user', 'total_amount', 'created_at', 'updated_at']
+        # Status changes go through Order.transition so the state machine applies
+        read_only_fields = ['user', 'status', 'total_amount', 'created_at', 'updated_at', 'version']
     
     def get_user_details(self, obj):
         if self.context['request'].user.role in ['MANAGER', 'EMPLOYEE']:
@@ -53,6 +57,12 @@ class OrderSerializer(serializers.ModelSerializer):
     def get_days_remaining(self, obj):
         return obj.get_days_remaining()
 
+class OrderEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = OrderEvent
+        fields = ['id', 'order', 'actor', 'event_type', 'payload', 'created_at']
+        read_only_fields = fields
+
 class CreateOrderItemSerializer(serializers.ModelSerializer):
     product_id = serializers.IntegerField()
     quantity = serializers.IntegerField(min_value=1)
@@ -134,12 +144,14 @@ class CreateOrderSerializer(serializers.ModelSerializer):
         # Add created_by_role
         validated_data['created_by_role'] = request.user.role
         
-        # Create order
-        order = Order.objects.create(user=user, **validated_data)
-        
-        # Create order items
-        for item_data in items_data:
-            OrderItem.objects.create(order=order, **item_data)
+        # Create the order and its items with the total computed once, and
+        # its 'created' event in the same transaction
+        products = Product.objects.in_bulk({item['product_id'] for item in items_data})
+        lines = [(item['product_id'], item['quantity']) for item in items_data]
+        with transaction.atomic():
+            order = Order.create_with_items(lines, products, user=user, **validated_data)
+            OrderEvent.record(order, 'created', request.user, {'items': len(items_data), 'version': order.version})
+        ORDERS_CREATED.inc(request.user.role)
         
         return order 
 
@@ -152,24 +164,128 @@ class UpdateOrderSerializer(serializers.ModelSerializer):
 
     def update(self, instance, validated_data):
         items_data = validated_data.pop('items', None)
+        expected_version = validated_data.pop('expected_version', None)
         
-        # Update order fields
-        instance.shipping_address = validated_data.get('shipping_address', instance.shipping_address)
-        instance.payment_deadline = validated_data.get('payment_deadline', instance.payment_deadline)
-        instance.save()
-
-        if items_data is not None:
-            # Remove existing items
-            instance.items.all().delete()
-            
-            # Create new items
-            for item_data in items_data:
-                product = Product.objects.get(id=item_data['product_id'])
-                OrderItem.objects.create(
-                    order=instance,
-                    product=product,
-                    quantity=item_data['quantity'],
-                    price=product.price
-                )
+        with transaction.atomic():
+            # Update order fields; the conditional UPDATE also locks the row
+            # until the items below are written
+            instance.shipping_address = validated_data.get('shipping_address', instance.shipping_address)
+            instance.payment_deadline = validated_data.get('payment_deadline', instance.payment_deadline)
+            instance.save_if_version(expected_version, ['shipping_address', 'payment_deadline'])
+            payload = {'fields': validated_data, 'version': instance.version}
+
+            if items_data is not None:
+                total, payload['items'] = self.sync_items(instance, items_data)
+                Order.objects.filter(pk=instance.pk).update(total_amount=total)
+                instance.total_amount = total
+                # Refresh the items prefetched by the view for the response
+                instance._prefetched_objects_cache = {}
+                prefetch_related_objects([instance], 'items__product')
+
+            OrderEvent.record(instance, 'edited', self.context['request'].user, payload)
         
-        return instance 
\ No newline at end of file
+        return instance
+
+    def sync_items(self, instance, items_data):
+        """
+        Apply the submitted lines as a diff against the existing ones: changed
+        quantities are updated in place (keeping their original price), new
+        products are inserted at the current price and missing ones deleted.
+        Unchanged lines keep their price too, so editing an order never
+        re-prices what the customer already agreed to. New lines must be for
+        active products. Returns the new order total and a summary of the
+        changes by product id.
+        """
+        quantities = {}
+        for item_data in items_data:
+            product_id = item_data['product_id']
+            quantities[product_id] = quantities.get(product_id, 0) + item_data['quantity']
+
+        existing = {}
+        to_delete = []
+        for item in OrderItem.objects.filter(order=instance):
+            if item.product_id in quantities and item.product_id not in existing:
+                existing[item.product_id] = item
+            else:
+                to_delete.append(item.id)
+
+        new_ids = [product_id for product_id in quantities if product_id not in existing]
+        products = {
+            product_id: (name, price, is_active)
+            for product_id, name, price, is_active in Product.objects.filter(id__in=new_ids).values_list(
+                'id', 'name', 'price', 'is_active'
+            )
+        }
+        missing = [product_id for product_id in new_ids if product_id not in products]
+        if missing:
+            raise serializers.ValidationError({'items': [f"Product with id {product_id} does not exist" for product_id in missing]})
+        inactive = [name for name, _, is_active in products.values() if not is_active]
+        if inactive:
+            raise serializers.ValidationError({'items': [f"Product {name} is not active" for name in inactive]})
+        prices = {product_id: price for product_id, (_, price, _) in products.items()}
+
+        to_update = []
+        for product_id, item in existing.items():
+            if item.quantity != quantities[product_id]:
+                item.quantity = quantities[product_id]
+                to_update.append(item)
+        to_create = [
+            OrderItem(order=instance, product_id=product_id, quantity=quantities[product_id], price=prices[product_id])
+            for product_id in new_ids
+        ]
+
+        if to_delete:
+            OrderItem.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            OrderItem.objects.bulk_update(to_update, ['quantity'])
+        if to_create:
+            OrderItem.objects.bulk_create(to_create)
+
+        total = sum(item.quantity * item.price for item in [*existing.values(), *to_create])
+        changes = {
+            'added': {item.product_id: item.quantity for item in to_create},
+            'updated': {item.product_id: item.quantity for item in to_update},
+            'removed': len(to_delete),
+        }
+        return total, changes
+
+class BulkTransitionSerializer(serializers.Serializer):
+    """
+    Orders to move in one bulk transition: either explicit `ids`, or the
+    filters (status, location_state, created_after, created_before) applied
+    to all orders. Only orders whose status allows the transition move.
+    """
+    ids = serializers.ListField(child=serializers.IntegerField(min_value=1), required=False, allow_empty=False)
+    status = serializers.ChoiceField(choices=Order.STATUS_CHOICES, required=False)
+    location_state = serializers.CharField(required=False)
+    created_after = serializers.DateTimeField(required=False)
+    created_before = serializers.DateTimeField(required=False)
+
+    FILTERS = {
+        'status': 'status',
+        'location_state': 'location_state__iexact',
+        'created_after': 'created_at__gte',
+        'created_before': 'created_at__lt',
+    }
+
+    def validate_ids(self, value):
+        value = list(dict.fromkeys(value))
+        if len(value) > settings.ORDER_BULK_TRANSITION_MAX:
+            raise serializers.ValidationError(f"At most {settings.ORDER_BULK_TRANSITION_MAX} orders per request")
+        return value
+
+    def validate(self, data):
+        has_filters = any(name in data for name in self.FILTERS)
+        if 'ids' in data and has_filters:
+            raise serializers.ValidationError("Pass either ids or filters, not both")
+        if 'ids' not in data and not has_filters:
+            raise serializers.ValidationError("Pass ids or at least one filter")
+        return data
+
+    def filter_queryset(self, queryset):
+        data = self.validated_data
+        if 'ids' in data:
+            return queryset.filter(pk__in=data['ids'])
+        return queryset.filter(**{
+            lookup: data[name] for name, lookup in self.FILTERS.items() if name in data
+        })
@@ -0,0 +1,5 @@
+from django.dispatch import Signal
+
+# Sent after orders change status through Order.transition (a queryset
+# update, so post_save does not fire). Receives `orders`, a list of Order.
+orders_transitioned = Signal()
@@ -1,3 +1,404 @@
-from django.test import TestCase
+import shutil
+import tempfile
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.core.files.storage import FileSystemStorage
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from products.models import Product
+from sync.models import Tombstone
+from users.models import CustomUser, EmployeeCustomerAssignment
+from . import archive, geo
+from .models import ArchivedOrder, Order, OrderEvent, OrderItem
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class OrderVersioningTests(TestCase):
+    def setUp(self):
+        self.manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        self.customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        self.product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=100)
+        self.order = Order.create_with_items(
+            [(self.product.pk, 3)], {self.product.pk: self.product},
+            user=self.customer, shipping_address='Farm road 1'
+        )
+        self.client = APIClient()
+        self.client.force_login(self.manager)
+
+    def url(self, suffix=''):
+        return f'/api/orders/{self.order.pk}/{suffix}'
+
+    def test_retrieve_sends_version_etag(self):
+        response = self.client.get(self.url())
+        self.assertEqual(response['ETag'], '"1"')
+        self.assertEqual(response.json()['total_amount'], '30.00')
+
+    def test_accept_with_current_version(self):
+        response = self.client.post(self.url('accept/'), HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ('accepted', 2))
+        event = OrderEvent.objects.get(order=self.order, event_type='status')
+        self.assertEqual(event.payload, {'from': 'pending', 'to': 'accepted', 'version': 2})
+        self.assertEqual(event.actor_id, self.manager.pk)
+
+    def test_accept_with_stale_version_conflicts(self):
+        self.client.patch(self.url(), {'shipping_address': 'New road 2'}, format='json', HTTP_IF_MATCH='"1"')
+        response = self.client.post(self.url('accept/'), HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['version'], 2)
+        self.assertEqual(response['ETag'], '"2"')
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.status, 'pending')
+
+    def test_illegal_transition_conflicts(self):
+        self.client.post(self.url('reject/'))
+        response = self.client.post(self.url('accept/'))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['status'], 'rejected')
+        self.assertEqual(OrderEvent.objects.filter(order=self.order, event_type='status').count(), 1)
+
+    def test_only_one_of_two_concurrent_transitions_wins(self):
+        # Both clients read version 1 before either writes
+        first = self.client.post(self.url('accept/'), HTTP_IF_MATCH='"1"')
+        second = self.client.post(self.url('reject/'), HTTP_IF_MATCH='"1"')
+        self.assertEqual((first.status_code, second.status_code), (200, 409))
+        self.order.refresh_from_db()
+        self.assertEqual((self.order.status, self.order.version), ('accepted', 2))
+
+    def test_update_with_stale_version_conflicts(self):
+        response = self.client.patch(self.url(), {'shipping_address': 'New road 2'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], '"2"')
+        response = self.client.patch(self.url(), {'shipping_address': 'Other road 3'}, format='json', HTTP_IF_MATCH='"1"')
+        self.assertEqual(response.status_code, 409)
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.shipping_address, 'New road 2')
+
+    def test_update_order_items_with_stale_version_conflicts(self):
+        self.client.post(self.url('accept/'))
+        response = self.client.patch(
+            self.url('update_order/'), {'items': [{'product_id': self.product.pk, 'quantity': 1}]},
+            format='json', HTTP_IF_MATCH='"1"'
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.order.items.get().quantity, 3)
+
+    def test_invalid_if_match_is_rejected(self):
+        response = self.client.post(self.url('accept/'), HTTP_IF_MATCH='"latest"')
+        self.assertEqual(response.status_code, 400)
+
+    def test_customers_cannot_transition(self):
+        self.client.force_login(self.customer)
+        self.assertEqual(self.client.post(self.url('accept/')).status_code, 403)
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class CreateOrderTests(TestCase):
+    def setUp(self):
+        self.customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        self.product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=100)
+        self.client = APIClient()
+        self.client.force_login(self.customer)
+        self.body = {'shipping_address': 'Farm road 1', 'items': [{'product_id': self.product.pk, 'quantity': 2}]}
+
+    def test_order_items_and_event_are_created_together(self):
+        response = self.client.post('/api/orders/', self.body, format='json')
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.items.get().quantity, 2)
+        self.assertEqual(OrderEvent.objects.get(order=order).event_type, 'created')
+
+    def test_failed_event_rolls_back_the_order(self):
+        with mock.patch.object(OrderEvent, 'record', side_effect=RuntimeError('database unavailable')):
+            with self.assertRaises(RuntimeError):
+                self.client.post('/api/orders/', self.body, format='json')
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+
+    def test_failed_items_roll_back_the_order(self):
+        with mock.patch.object(OrderItem.objects, 'bulk_create', side_effect=RuntimeError('database unavailable')):
+            with self.assertRaises(RuntimeError):
+                Order.create_with_items(
+                    [(self.product.pk, 1)], {self.product.pk: self.product},
+                    user=self.customer, shipping_address='Farm road 1'
+                )
+        self.assertFalse(Order.objects.exists())
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class UpdateOrderItemsTests(TestCase):
+    def setUp(self):
+        self.manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        self.seeds = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=100)
+        self.tools = Product.objects.create(name='Tools', price=Decimal('50.00'), stock=100)
+        self.soil = Product.objects.create(name='Soil', price=Decimal('5.00'), stock=100)
+        self.order = Order.create_with_items(
+            [(self.seeds.pk, 2), (self.tools.pk, 1)], {self.seeds.pk: self.seeds, self.tools.pk: self.tools},
+            user=customer, shipping_address='Farm road 1'
+        )
+        # Prices changed after the order was placed
+        Product.objects.update(price=Decimal('99.00'))
+        self.client = APIClient()
+        self.client.force_login(self.manager)
+
+    def update_items(self, lines):
+        return self.client.patch(
+            f'/api/orders/{self.order.pk}/update_order/',
+            {'items': [{'product_id': product.pk, 'quantity': quantity} for product, quantity in lines]},
+            format='json'
+        )
+
+    def lines(self):
+        return {
+            product_id: (quantity, price)
+            for product_id, quantity, price in self.order.items.values_list('product_id', 'quantity', 'price')
+        }
+
+    def test_unchanged_line_keeps_its_price(self):
+        item_ids = set(self.order.items.values_list('id', flat=True))
+        response = self.update_items([(self.seeds, 2), (self.tools, 1)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['total_amount'], '70.00')
+        self.assertEqual(set(self.order.items.values_list('id', flat=True)), item_ids)
+        self.assertEqual(self.lines(), {self.seeds.pk: (2, Decimal('10.00')), self.tools.pk: (1, Decimal('50.00'))})
+
+    def test_changed_quantity_keeps_its_price(self):
+        response = self.update_items([(self.seeds, 5), (self.tools, 1)])
+        self.assertEqual(response.json()['total_amount'], '100.00')
+        self.assertEqual(self.lines()[self.seeds.pk], (5, Decimal('10.00')))
+
+    def test_added_line_uses_current_price_and_missing_line_is_removed(self):
+        response = self.update_items([(self.seeds, 2), (self.soil, 1)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines(), {self.seeds.pk: (2, Decimal('10.00')), self.soil.pk: (1, Decimal('99.00'))})
+        self.order.refresh_from_db()
+        self.assertEqual(self.order.total_amount, Decimal('119.00'))
+        event = OrderEvent.objects.get(order=self.order, event_type='edited')
+        self.assertEqual(event.payload['items'], {'added': {str(self.soil.pk): 1}, 'updated': {}, 'removed': 1})
+
+    def test_new_line_for_inactive_product_is_rejected(self):
+        Product.objects.filter(pk=self.soil.pk).update(is_active=False)
+        response = self.update_items([(self.seeds, 2), (self.tools, 1), (self.soil, 1)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'items': ['Product Soil is not active']})
+        self.assertNotIn(self.soil.pk, self.lines())
+
+    def test_existing_line_for_deactivated_product_can_stay(self):
+        Product.objects.filter(pk=self.tools.pk).update(is_active=False)
+        response = self.update_items([(self.seeds, 3), (self.tools, 1)])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.lines()[self.tools.pk], (1, Decimal('50.00')))
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class BulkTransitionTests(TestCase):
+    def setUp(self):
+        self.manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        self.customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=100)
+        self.orders = [
+            Order.create_with_items(
+                [(product.pk, 1)], {product.pk: product},
+                user=self.customer, shipping_address='Farm road 1', location_state=state
+            )
+            for state in ('Punjab', 'Punjab', 'Kerala')
+        ]
+        self.client = APIClient()
+        self.client.force_login(self.manager)
+
+    def test_ids_get_an_outcome_each(self):
+        accepted, rejected, pending = self.orders
+        self.client.post(f'/api/orders/{rejected.pk}/reject/')
+        response = self.client.post(
+            '/api/orders/bulk_accept/', {'ids': [accepted.pk, rejected.pk, 999999, pending.pk]}, format='json'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['transitioned'], 2)
+        self.assertEqual(response.json()['results'], [
+            {'id': accepted.pk, 'outcome': 'accepted', 'version': 2},
+            {'id': rejected.pk, 'outcome': 'conflict', 'status': 'rejected', 'version': 2},
+            {'id': 999999, 'outcome': 'not_found'},
+            {'id': pending.pk, 'outcome': 'accepted', 'version': 2},
+        ])
+        self.assertEqual(
+            sorted(Order.objects.values_list('status', flat=True)), ['accepted', 'accepted', 'rejected']
+        )
+
+    def test_events_are_recorded_for_moved_orders_only(self):
+        self.client.post(f'/api/orders/{self.orders[0].pk}/accept/')
+        self.client.post('/api/orders/bulk_reject/', {'ids': [order.pk for order in self.orders]}, format='json')
+        events = OrderEvent.objects.filter(event_type='status', payload__to='rejected')
+        self.assertEqual(sorted(events.values_list('order_id', flat=True)), [self.orders[1].pk, self.orders[2].pk])
+        self.assertTrue(all(event.actor_id == self.manager.pk for event in events))
+
+    def test_filters_select_pending_orders(self):
+        response = self.client.post('/api/orders/bulk_reject/', {'location_state': 'punjab'}, format='json')
+        self.assertEqual(response.json()['transitioned'], 2)
+        self.assertFalse(response.json()['has_more'])
+        self.assertEqual(Order.objects.get(location_state='Kerala').status, 'pending')
+
+    @override_settings(ORDER_BULK_TRANSITION_MAX=2)
+    def test_filters_move_at_most_the_limit(self):
+        response = self.client.post('/api/orders/bulk_accept/', {'status': 'pending'}, format='json')
+        self.assertEqual((response.json()['transitioned'], response.json()['has_more']), (2, True))
+        response = self.client.post('/api/orders/bulk_accept/', {'status': 'pending'}, format='json')
+        self.assertEqual((response.json()['transitioned'], response.json()['has_more']), (1, False))
+
+    def test_ids_and_filters_are_exclusive(self):
+        response = self.client.post('/api/orders/bulk_accept/', {'ids': [1], 'status': 'pending'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post('/api/orders/bulk_accept/', {}, format='json').status_code, 400)
+
+    def test_customers_cannot_bulk_transition(self):
+        self.client.force_login(self.customer)
+        response = self.client.post('/api/orders/bulk_accept/', {'ids': [self.orders[0].pk]}, format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class ArchiveTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        patcher = mock.patch.object(archive, '_storage', FileSystemStorage(location=directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=100)
+        self.order = Order.create_with_items(
+            [(product.pk, 2)], {product.pk: product}, user=self.customer, shipping_address='Farm road 1'
+        )
+        self.order.transition('accepted')
+        self.client = APIClient()
+
+    def retrieve_as(self, user):
+        self.client.force_login(user)
+        return self.client.get(f'/api/orders/{self.order.pk}/')
+
+    def test_archived_order_is_served_from_its_file(self):
+        self.assertEqual(archive.archive_orders(older_than_days=0), 1)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertFalse(Tombstone.objects.filter(collection='orders').exists())
+
+        response = self.retrieve_as(self.customer)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertTrue(data['archived'])
+        self.assertEqual((data['status'], data['total_amount'], data['items'][0]['quantity']), ('accepted', '20.00', 2))
+        self.assertIsNone(data['user_details'])
+
+    def test_open_orders_are_not_archived(self):
+        Order.objects.filter(pk=self.order.pk).update(status='pending')
+        self.assertEqual(archive.archive_orders(older_than_days=0), 0)
+        self.assertFalse(ArchivedOrder.objects.exists())
+
+    def test_visibility_follows_live_orders(self):
+        archive.archive_orders(older_than_days=0)
+        manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        assigned = CustomUser.objects.create_user(username='assigned', password='secret', role='EMPLOYEE')
+        unassigned = CustomUser.objects.create_user(username='unassigned', password='secret', role='EMPLOYEE')
+        other = CustomUser.objects.create_user(username='other', password='secret', role='CUSTOMER')
+        EmployeeCustomerAssignment.objects.create(employee=assigned, customer=self.customer)
+
+        self.assertEqual(self.retrieve_as(manager).json()['user_details']['username'], 'customer')
+        self.assertEqual(self.retrieve_as(assigned).status_code, 200)
+        self.assertEqual(self.retrieve_as(unassigned).status_code, 404)
+        self.assertEqual(self.retrieve_as(other).status_code, 404)
+
+    def test_missing_archive_file_is_not_found(self):
+        archive.archive_orders(older_than_days=0)
+        archive.get_archive_storage().delete(ArchivedOrder.objects.get().path)
+        self.assertEqual(self.retrieve_as(self.customer).status_code, 404)
+
+    def test_failed_batch_removes_its_file(self):
+        with mock.patch.object(ArchivedOrder.objects, 'bulk_create', side_effect=RuntimeError('database unavailable')):
+            with self.assertRaises(RuntimeError):
+                archive.archive_orders(older_than_days=0)
+        self.assertTrue(Order.objects.filter(pk=self.order.pk).exists())
+        self.assertEqual([path for path in Path(archive.get_archive_storage().location).rglob('*') if path.is_file()], [])
+
+
+class GeohashTests(TestCase):
+    def test_encode_known_vectors(self):
+        self.assertEqual(geo.encode(57.64911, 10.40744, 11), 'u4pruydqqvj')
+        self.assertEqual(geo.encode(42.6, -5.6, 5), 'ezs42')
+        self.assertEqual(geo.encode(Decimal('-25.382708'), Decimal('-49.265506'), 8), '6gkzwgjz')
+
+    def test_covering_cells_contain_every_point_of_the_box(self):
+        box = (12.9, 77.5, 13.1, 77.7)
+        cells = geo.covering_cells(*box)
+        self.assertTrue(0 < len(cells) <= geo.MAX_COVER_CELLS)
+        steps = [index / 10 for index in range(11)]
+        for lat_step in steps:
+            for lon_step in steps:
+                point = geo.encode(12.9 + 0.2 * lat_step, 77.5 + 0.2 * lon_step)
+                self.assertTrue(any(point.startswith(cell) for cell in cells), point)
+
+    def test_boxes_needing_too_many_cells_fall_back_to_coordinates(self):
+        self.assertEqual(geo.covering_cells(-90, -180, 90, 180), [])
+        self.assertNotIn('location_geohash__startswith', str(geo.bbox_filter(-90, -180, 90, 180)))
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class OrderMapTests(TestCase):
+    def setUp(self):
+        self.manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        self.customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        self.product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=100)
+        self.client = APIClient()
+        self.client.force_login(self.manager)
+
+    def order_at(self, latitude, longitude):
+        return Order.create_with_items(
+            [(self.product.pk, 1)], {self.product.pk: self.product},
+            user=self.customer, shipping_address='Farm road 1',
+            location_latitude=Decimal(latitude), location_longitude=Decimal(longitude),
+        )
+
+    def ids(self, response):
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        return sorted(order['id'] for order in (data['results'] if isinstance(data, dict) else data))
+
+    def test_bbox_includes_its_edges_only(self):
+        inside = [
+            self.order_at('12.900000', '77.500000'),  # south-west corner
+            self.order_at('13.100000', '77.700000'),  # north-east corner
+            self.order_at('13.000000', '77.600000'),
+        ]
+        self.order_at('13.100001', '77.600000')
+        self.order_at('13.000000', '77.499999')
+        self.order_at('28.613900', '77.209000')
+        response = self.client.get('/api/orders/', {'bbox': '12.9,77.5,13.1,77.7'})
+        self.assertEqual(self.ids(response), [order.pk for order in inside])
+
+    def test_invalid_bbox_is_rejected(self):
+        self.assertEqual(self.client.get('/api/orders/', {'bbox': '12.9,77.5'}).status_code, 400)
+
+    def test_clusters_aggregate_orders_per_cell(self):
+        bangalore = self.order_at('12.970000', '77.590000')
+        self.order_at('12.990000', '77.610000')
+        delhi = self.order_at('28.613900', '77.209000')
+        Order.create_with_items(
+            [(self.product.pk, 1)], {self.product.pk: self.product}, user=self.customer, shipping_address='No location'
+        )
+
+        response = self.client.get('/api/orders/clusters/', {'zoom': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['precision'], 3)
+        markers = {marker['geohash']: marker for marker in response.json()['markers']}
+        self.assertEqual(set(markers), {bangalore.location_geohash[:3], delhi.location_geohash[:3]})
+        cluster = markers[bangalore.location_geohash[:3]]
+        self.assertEqual((cluster['count'], cluster['order_id']), (2, None))
+        self.assertAlmostEqual(cluster['latitude'], 12.98)
+        self.assertAlmostEqual(cluster['longitude'], 77.6)
+        single = markers[delhi.location_geohash[:3]]
+        self.assertEqual((single['count'], single['order_id']), (1, delhi.pk))
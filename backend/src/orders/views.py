@@ -2,17 +2,68 @@ from django.shortcuts import render, get_object_or_404
 from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from django.db.models import Q
-from .models import Order, OrderItem
-from .serializers import OrderSerializer, CreateOrderSerializer, UpdateOrderSerializer
+from django.db import transaction
+from django.db.models import Q, Count, Avg, Min
+from django.db.models.functions import Substr
+from django.utils.dateparse import parse_datetime
+from django.http import Http404
+from django.conf import settings
+from .models import Order, OrderItem, OrderEvent, ArchivedOrder, OrderConflict, IllegalTransition
+from .archive import load_archived_order
+from .serializers import (
+    OrderSerializer, OrderEventSerializer, CreateOrderSerializer, UpdateOrderSerializer, BulkTransitionSerializer
+)
 from products.models import Product
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
 from users.admin_views import IsManagerPermission
 from users.models import EmployeeCustomerAssignment
+from idempotency.decorators import idempotent
+from . import geo
 
 User = get_user_model()
 
+def parse_coordinates(value, name, count):
+    """Parse a comma-separated list of floats from a query parameter"""
+    try:
+        numbers = [float(part) for part in value.split(',')]
+    except ValueError:
+        numbers = []
+    if len(numbers) != count:
+        raise serializers.ValidationError({name: [f"Expected {count} comma-separated numbers"]})
+    return numbers
+
+def parse_if_match(request):
+    """Return the order version from an If-Match header (the ETag we send), or None"""
+    value = request.headers.get('If-Match', '').strip()
+    if not value or value == '*':
+        return None
+    if value.startswith('W/'):
+        value = value[2:]
+    try:
+        return int(value.strip('"'))
+    except ValueError:
+        raise serializers.ValidationError({'If-Match': ["Expected an order ETag such as \"3\""]})
+
+def order_etag(order):
+    return f'"{order.version}"'
+
+def conflict_response(exc):
+    return Response(
+        {'detail': str(exc), 'status': exc.status, 'version': exc.version},
+        status=status.HTTP_409_CONFLICT,
+        headers={'ETag': f'"{exc.version}"'}
+    )
+
+def parse_datetime_param(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise serializers.ValidationError({name: ['Expected an ISO 8601 datetime']})
+    return parsed
+
 # Create your views here.
 
 class OrderViewSet(viewsets.ModelViewSet):
@@ -34,6 +85,8 @@ class OrderViewSet(viewsets.ModelViewSet):
         if status:
             queryset = queryset.filter(status__iexact=status)
 
+        queryset = self.filter_location(queryset)
+
         # Apply user_id filter if provided (for managers and employees)
         if user_id and user.role in ['MANAGER', 'EMPLOYEE']:
             try:
@@ -64,6 +117,34 @@ class OrderViewSet(viewsets.ModelViewSet):
             # Customers can only see their own orders
             return queryset.filter(user=user)
     
+    def filter_location(self, queryset):
+        """
+        Spatial filters:
+        ?bbox=min_lat,min_lon,max_lat,max_lon
+        ?near=lat,lon&radius_km=25
+        """
+        params = self.request.query_params
+        bbox = params.get('bbox')
+        near = params.get('near')
+
+        if bbox:
+            min_lat, min_lon, max_lat, max_lon = parse_coordinates(bbox, 'bbox', 4)
+            queryset = queryset.filter(geo.bbox_filter(min_lat, min_lon, max_lat, max_lon))
+
+        if near:
+            latitude, longitude = parse_coordinates(near, 'near', 2)
+            try:
+                radius_km = float(params.get('radius_km', 25))
+            except ValueError:
+                raise serializers.ValidationError({'radius_km': ["A valid number is required"]})
+            queryset = queryset.filter(
+                geo.bbox_filter(*geo.bounding_box(latitude, longitude, radius_km))
+            ).annotate(
+                distance_km=geo.distance_km_expression(latitude, longitude)
+            ).filter(distance_km__lte=radius_km)
+
+        return queryset
+
     def get_serializer_class(self):
         if self.action == 'create':
             return CreateOrderSerializer
@@ -82,6 +163,7 @@ class OrderViewSet(viewsets.ModelViewSet):
             created_by_role=self.request.user.role
         )
     
+    @idempotent
     def create(self, request, *args, **kwargs):
         # Get the target user for the order
         user_id = request.data.get('user_id')
@@ -129,8 +211,35 @@ class OrderViewSet(viewsets.ModelViewSet):
         
         # Use OrderSerializer to return full order details with context
         response_serializer = OrderSerializer(order, context={'request': request})
-        return Response(response_serializer.data, status=status.HTTP_201_CREATED)
+        return Response(response_serializer.data, status=status.HTTP_201_CREATED, headers={'ETag': order_etag(order)})
         
+    def retrieve(self, request, *args, **kwargs):
+        try:
+            order = self.get_object()
+        except Http404:
+            return self.retrieve_archived(request, kwargs['pk'])
+        serializer = self.get_serializer(order)
+        return Response(serializer.data, headers={'ETag': order_etag(order)})
+
+    def retrieve_archived(self, request, pk):
+        """Serve an order moved to cold storage, with the same visibility rules"""
+        user = request.user
+        entries = ArchivedOrder.objects.filter(order_id=pk) if str(pk).isdigit() else ArchivedOrder.objects.none()
+        if user.role == 'EMPLOYEE':
+            entries = entries.filter(user_id__in=EmployeeCustomerAssignment.objects.filter(
+                employee=user
+            ).values('customer_id'))
+        elif user.role != 'MANAGER':
+            entries = entries.filter(user=user)
+        entry = entries.first()
+        data = load_archived_order(entry) if entry else None
+        if data is None:
+            raise Http404
+        if user.role not in ['MANAGER', 'EMPLOYEE']:
+            data['user_details'] = None
+        data['archived'] = True
+        return Response(data)
+
     def update(self, request, *args, **kwargs):
         # Only managers can update orders
         if request.user.role != 'MANAGER':
@@ -138,7 +247,31 @@ class OrderViewSet(viewsets.ModelViewSet):
                 {"detail": "You do not have permission to perform this action."},
                 status=status.HTTP_403_FORBIDDEN
             )
-        return super().update(request, *args, **kwargs)
+        order = self.get_object()
+        expected_version = parse_if_match(request)
+        new_status = request.data.get('status')
+        if new_status is not None and new_status not in dict(Order.STATUS_CHOICES):
+            return Response({'status': [f'"{new_status}" is not a valid choice.']}, status=status.HTTP_400_BAD_REQUEST)
+
+        serializer = self.get_serializer(order, data=request.data, partial=kwargs.pop('partial', False))
+        serializer.is_valid(raise_exception=True)
+        try:
+            with transaction.atomic():
+                if serializer.validated_data:
+                    for attr, value in serializer.validated_data.items():
+                        setattr(order, attr, value)
+                    order.update_geohash()
+                    order.save_if_version(expected_version, [*serializer.validated_data, 'location_geohash'])
+                    OrderEvent.record(order, 'edited', request.user, {
+                        'fields': serializer.validated_data, 'version': order.version
+                    })
+                    if expected_version is not None:
+                        expected_version = order.version
+                if new_status is not None and new_status != order.status:
+                    order.transition(new_status, expected_version, request.user)
+        except (OrderConflict, IllegalTransition) as exc:
+            return conflict_response(exc)
+        return Response(self.get_serializer(order).data, headers={'ETag': order_etag(order)})
         
     def destroy(self, request, *args, **kwargs):
         # Only managers can delete orders
@@ -149,24 +282,148 @@ class OrderViewSet(viewsets.ModelViewSet):
             )
         return super().destroy(request, *args, **kwargs)
 
+    def change_status(self, request, new_status, message):
+        order = self.get_object()
+        try:
+            order.transition(new_status, parse_if_match(request), request.user)
+        except (OrderConflict, IllegalTransition) as exc:
+            return conflict_response(exc)
+        return Response({'status': message, 'version': order.version}, headers={'ETag': order_etag(order)})
+
     @action(detail=True, methods=['post'], permission_classes=[IsManagerPermission])
     def accept(self, request, pk=None):
-        order = self.get_object()
-        order.accept_order()
-        return Response({'status': 'order accepted'})
+        return self.change_status(request, 'accepted', 'order accepted')
 
     @action(detail=True, methods=['post'], permission_classes=[IsManagerPermission])
     def reject(self, request, pk=None):
-        order = self.get_object()
-        order.reject_order()
-        return Response({'status': 'order rejected'})
+        return self.change_status(request, 'rejected', 'order rejected')
+
+    def bulk_change_status(self, request, new_status):
+        """
+        Transition many orders in one request (see BulkTransitionSerializer)
+        with a single conditional UPDATE. With ids, every id gets an outcome:
+        the new version, a conflict with its current status, or not_found.
+        With filters, up to ORDER_BULK_TRANSITION_MAX matching orders move
+        per request and has_more tells the client to repeat.
+        """
+        serializer = BulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        limit = settings.ORDER_BULK_TRANSITION_MAX
+        orders = Order.bulk_transition(
+            serializer.filter_queryset(Order.objects.all()), new_status, request.user, limit=limit
+        )
+        results = [{'id': order.id, 'outcome': new_status, 'version': order.version} for order in orders]
+        response = {'status': new_status, 'transitioned': len(orders), 'results': results}
+
+        ids = serializer.validated_data.get('ids')
+        if ids is None:
+            response['has_more'] = len(orders) == limit and serializer.filter_queryset(
+                Order.objects.filter(status__in=Order.sources_for(new_status))
+            ).exists()
+            return Response(response)
+
+        moved = {order.id for order in orders}
+        current = {
+            row['id']: row
+            for row in Order.objects.filter(pk__in=[pk for pk in ids if pk not in moved]).values('id', 'status', 'version')
+        }
+        by_id = {result['id']: result for result in results}
+        for pk in ids:
+            if pk in by_id:
+                continue
+            if pk in current:
+                by_id[pk] = {'id': pk, 'outcome': 'conflict', 'status': current[pk]['status'], 'version': current[pk]['version']}
+            else:
+                by_id[pk] = {'id': pk, 'outcome': 'not_found'}
+        response['results'] = [by_id[pk] for pk in ids]
+        return Response(response)
+
+    @action(detail=False, methods=['post'], permission_classes=[IsManagerPermission])
+    def bulk_accept(self, request):
+        return self.bulk_change_status(request, 'accepted')
+
+    @action(detail=False, methods=['post'], permission_classes=[IsManagerPermission])
+    def bulk_reject(self, request):
+        return self.bulk_change_status(request, 'rejected')
 
     @action(detail=True, methods=['patch'], permission_classes=[IsManagerPermission])
     def update_order(self, request, pk=None):
         order = self.get_object()
         serializer = self.get_serializer(order, data=request.data, partial=True)
         if serializer.is_valid():
-            updated_order = serializer.save()
+            try:
+                updated_order = serializer.save(expected_version=parse_if_match(request))
+            except OrderConflict as exc:
+                return conflict_response(exc)
             response_serializer = OrderSerializer(updated_order, context={'request': request})
-            return Response(response_serializer.data)
+            return Response(response_serializer.data, headers={'ETag': order_etag(updated_order)})
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['get'])
+    def events(self, request, pk=None):
+        """Full change history of one order, oldest first"""
+        order = self.get_object()
+        events = OrderEvent.objects.filter(order_id=order.id)
+        return Response(OrderEventSerializer(events, many=True).data)
+
+    @action(detail=False, methods=['get'], url_path='events', url_name='event-log', permission_classes=[IsManagerPermission])
+    def event_log(self, request):
+        """
+        Order events across all orders in a time range (?since=&until= ISO
+        datetimes). Page with ?after=<last id seen>, up to ?limit= rows.
+        """
+        events = OrderEvent.in_range(
+            parse_datetime_param(request, 'since'),
+            parse_datetime_param(request, 'until')
+        )
+        try:
+            after = int(request.query_params.get('after', 0))
+            limit = max(1, min(int(request.query_params.get('limit', 500)), 500))
+        except ValueError:
+            return Response({'detail': 'after and limit must be integers'}, status=status.HTTP_400_BAD_REQUEST)
+        if after:
+            events = events.filter(id__gt=after)
+        if request.query_params.get('event_type'):
+            events = events.filter(event_type=request.query_params['event_type'])
+
+        rows = list(events.order_by('id')[:limit + 1])
+        return Response({
+            'results': OrderEventSerializer(rows[:limit], many=True).data,
+            'has_more': len(rows) > limit,
+        })
+
+    @action(detail=False, methods=['get'])
+    def clusters(self, request):
+        """
+        Aggregate orders into map markers by geohash cell for the given zoom
+        level (?zoom=0-20, combine with bbox/near and the usual filters)
+        """
+        try:
+            precision = geo.zoom_to_precision(request.query_params.get('zoom', 10))
+        except ValueError:
+            return Response({'zoom': ['A valid integer is required']}, status=status.HTTP_400_BAD_REQUEST)
+
+        cells = (
+            self.get_queryset()
+            .exclude(location_geohash='')
+            .annotate(cell=Substr('location_geohash', 1, precision))
+            .values('cell')
+            .annotate(
+                count=Count('id'),
+                latitude=Avg('location_latitude'),
+                longitude=Avg('location_longitude'),
+                order_id=Min('id'),
+            )
+            .order_by('cell')
+        )
+        markers = [
+            {
+                'geohash': cell['cell'],
+                'count': cell['count'],
+                'latitude': round(float(cell['latitude']), 6),
+                'longitude': round(float(cell['longitude']), 6),
+                'order_id': cell['order_id'] if cell['count'] == 1 else None,
+            }
+            for cell in cells
+        ]
+        return Response({'precision': precision, 'markers': markers})
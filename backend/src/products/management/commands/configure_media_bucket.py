@@ -0,0 +1,45 @@
+import json
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = ('Creates the MEDIA_BUCKET if needed, makes its media/ prefix publicly readable and allows '
+            'browser uploads (presigned POST) from the frontend origins')
+
+    def handle(self, *args, **options):
+        from botocore.exceptions import ClientError
+
+        if not settings.MEDIA_BUCKET:
+            raise CommandError('MEDIA_BUCKET is not set')
+        client = default_storage.client
+        bucket = settings.MEDIA_BUCKET
+
+        try:
+            client.head_bucket(Bucket=bucket)
+        except ClientError:
+            client.create_bucket(Bucket=bucket)
+            self.stdout.write(f'Created bucket {bucket}')
+
+        prefix = default_storage.key_for('')
+        client.put_bucket_policy(Bucket=bucket, Policy=json.dumps({
+            'Version': '2012-10-17',
+            'Statement': [{
+                'Effect': 'Allow',
+                'Principal': '*',
+                'Action': ['s3:GetObject'],
+                'Resource': [f'arn:aws:s3:::{bucket}/{prefix.rstrip("/")}/*'],
+            }],
+        }))
+        origins = ['*'] if settings.CORS_ALLOW_ALL_ORIGINS else list(settings.CORS_ALLOWED_ORIGINS)
+        client.put_bucket_cors(Bucket=bucket, CORSConfiguration={
+            'CORSRules': [{
+                'AllowedOrigins': origins,
+                'AllowedMethods': ['POST'],
+                'AllowedHeaders': ['*'],
+                'MaxAgeSeconds': 3600,
+            }],
+        })
+        self.stdout.write(self.style.SUCCESS(f'Bucket {bucket} configured for media'))
@@ -0,0 +1,239 @@
+import random
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from orders.geo import encode as geohash_encode
+from orders.models import Order, OrderItem, OrderEvent, month_bucket
+from products.models import Product
+from shopping_cart.models import Cart, CartItem
+from users.models import CustomUser, EmployeeCustomerAssignment
+
+STATES = [
+    # (state, min_lat, min_lon, max_lat, max_lon)
+    ('Andhra Pradesh', 12.6, 76.7, 19.9, 84.8),
+    ('Telangana', 15.8, 77.2, 19.9, 81.3),
+    ('Karnataka', 11.5, 74.0, 18.5, 78.6),
+    ('Tamil Nadu', 8.1, 76.2, 13.6, 80.3),
+    ('Maharashtra', 15.6, 72.6, 22.0, 80.9),
+    ('Punjab', 29.5, 73.9, 32.5, 76.9),
+]
+PRODUCT_KINDS = ['Herbicide', 'Insecticide', 'Fungicide', 'Bio-pesticide', 'Fertilizer', 'Growth Regulator']
+ORDER_STATUSES = ['pending', 'accepted', 'rejected']
+ORDER_STATUS_WEIGHTS = [3, 5, 2]
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create write historical created_at/updated_at values instead of now()"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class Command(BaseCommand):
+    help = 'Generates a deterministic, production-sized data set (users, assignments, products, carts, orders) for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--prefix', default='load', help='Username/product name prefix for generated rows')
+        parser.add_argument('--managers', type=int, default=2)
+        parser.add_argument('--employees', type=int, default=50)
+        parser.add_argument('--customers', type=int, default=5000)
+        parser.add_argument('--products', type=int, default=500)
+        parser.add_argument('--orders', type=int, default=50000)
+        parser.add_argument('--max-items', type=int, default=8, help='Maximum lines per order')
+        parser.add_argument('--cart-ratio', type=float, default=0.3, help='Share of customers with a non-empty cart')
+        parser.add_argument('--days', type=int, default=365, help='Spread order dates over this many past days')
+        parser.add_argument('--password', default='loadtest123', help='Password for every generated user')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.started = time.monotonic()
+
+        if CustomUser.objects.filter(username__startswith=f"{self.prefix}_").exists():
+            raise CommandError(f'Users with prefix "{self.prefix}_" already exist; use another --prefix')
+
+        with explicit_timestamps(CustomUser, EmployeeCustomerAssignment, Product, Cart, CartItem, Order):
+            managers = self.create_users('MANAGER', options['managers'], options['password'])
+            employees = self.create_users('EMPLOYEE', options['employees'], options['password'])
+            customers = self.create_users('CUSTOMER', options['customers'], options['password'])
+            self.create_assignments(managers, employees, customers)
+            products = self.create_products(options['products'])
+            self.create_carts(customers, products, options['cart_ratio'])
+            self.create_orders(customers, products, options)
+
+        self.stdout.write(self.style.SUCCESS(f'Done in {time.monotonic() - self.started:.1f}s'))
+
+    def log(self, message):
+        self.stdout.write(f'[{time.monotonic() - self.started:7.1f}s] {message}')
+
+    def past(self, days):
+        return self.now - timedelta(seconds=self.rng.uniform(0, days * 86400))
+
+    def create_users(self, role, count, password):
+        # Hashing is deliberately slow, so every generated user shares one hash
+        hashed = make_password(password)
+        users = []
+        for i in range(count):
+            joined = self.past(730)
+            users.append(CustomUser(
+                username=f"{self.prefix}_{role.lower()}_{i:07d}",
+                email=f"{self.prefix}_{role.lower()}_{i:07d}@example.com",
+                password=hashed,
+                plain_password=password,
+                role=role,
+                status='ACTIVE',
+                is_approved=True,
+                phone=f"9{self.rng.randrange(10 ** 9):09d}",
+                address=f"{self.rng.randrange(1, 999)} Main Road, {self.rng.choice(STATES)[0]}",
+                date_joined=joined,
+                created_at=joined,
+                updated_at=joined,
+            ))
+        with transaction.atomic():
+            CustomUser.objects.bulk_create(users, batch_size=self.batch_size)
+        self.log(f'{count} {role.lower()}s')
+        return users
+
+    def create_assignments(self, managers, employees, customers):
+        if not employees:
+            return
+        manager = managers[0] if managers else None
+        assignments = [
+            EmployeeCustomerAssignment(
+                employee=employees[i % len(employees)],
+                customer=customer,
+                assigned_by=manager,
+                assigned_at=customer.created_at,
+            )
+            for i, customer in enumerate(customers)
+        ]
+        with transaction.atomic():
+            EmployeeCustomerAssignment.objects.bulk_create(assignments, batch_size=self.batch_size)
+        self.log(f'{len(assignments)} assignments')
+
+    def create_products(self, count):
+        products = []
+        for i in range(count):
+            created = self.past(730)
+            kind = self.rng.choice(PRODUCT_KINDS)
+            products.append(Product(
+                name=f"{self.prefix.title()} {kind} {i:05d}",
+                description=f"Synthetic {kind.lower()} for load testing.",
+                price=Decimal(self.rng.randrange(5000, 500000)) / 100,
+                stock=self.rng.randrange(0, 1000),
+                is_active=self.rng.random() > 0.05,
+                created_at=created,
+                updated_at=created,
+            ))
+        with transaction.atomic():
+            Product.objects.bulk_create(products, batch_size=self.batch_size)
+        self.log(f'{count} products')
+        return products
+
+    def create_carts(self, customers, products, ratio):
+        active = [product for product in products if product.is_active]
+        if not active:
+            return
+        owners = [customer for customer in customers if self.rng.random() < ratio]
+        carts = [Cart(user=customer, created_at=self.past(30), updated_at=self.now) for customer in owners]
+        with transaction.atomic():
+            Cart.objects.bulk_create(carts, batch_size=self.batch_size)
+            items = []
+            for cart in carts:
+                for product in self.rng.sample(active, min(len(active), self.rng.randint(1, 5))):
+                    items.append(CartItem(
+                        cart=cart, product=product, quantity=self.rng.randint(1, 10),
+                        created_at=cart.created_at, updated_at=cart.created_at,
+                    ))
+            CartItem.objects.bulk_create(items, batch_size=self.batch_size)
+        self.log(f'{len(carts)} carts with {len(items)} items')
+
+    def random_location(self):
+        state, min_lat, min_lon, max_lat, max_lon = self.rng.choice(STATES)
+        latitude = Decimal(f"{self.rng.uniform(min_lat, max_lat):.6f}")
+        longitude = Decimal(f"{self.rng.uniform(min_lon, max_lon):.6f}")
+        return state, latitude, longitude
+
+    def create_orders(self, customers, products, options):
+        if not customers or not products:
+            return
+        total_orders, max_items, days = options['orders'], options['max_items'], options['days']
+        created_orders = created_items = 0
+
+        while created_orders < total_orders:
+            orders, lines = [], []
+            for _ in range(min(self.batch_size, total_orders - created_orders)):
+                created = self.past(days)
+                status = self.rng.choices(ORDER_STATUSES, ORDER_STATUS_WEIGHTS)[0]
+                updated = created if status == 'pending' else min(
+                    self.now, created + timedelta(hours=self.rng.uniform(1, 96))
+                )
+                state, latitude, longitude = self.random_location()
+                customer = self.rng.choice(customers)
+                order_lines = [
+                    (product, self.rng.randint(1, 20))
+                    for product in self.rng.sample(products, min(len(products), self.rng.randint(1, max_items)))
+                ]
+                orders.append(Order(
+                    user=customer,
+                    status=status,
+                    total_amount=sum(product.price * quantity for product, quantity in order_lines),
+                    shipping_address=customer.address,
+                    payment_deadline=self.rng.choice([7, 15, 30]),
+                    location_state=state,
+                    location_display_name=f"{state}, India",
+                    location_latitude=latitude,
+                    location_longitude=longitude,
+                    location_geohash=geohash_encode(latitude, longitude),
+                    created_by_role=self.rng.choices(['CUSTOMER', 'EMPLOYEE', 'MANAGER'], [6, 3, 1])[0],
+                    version=1 if status == 'pending' else 2,
+                    created_at=created,
+                    updated_at=updated,
+                ))
+                lines.append(order_lines)
+
+            with transaction.atomic():
+                Order.objects.bulk_create(orders, batch_size=self.batch_size)
+                items, events = [], []
+                for order, order_lines in zip(orders, lines):
+                    items.extend(
+                        OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                        for product, quantity in order_lines
+                    )
+                    events.append(OrderEvent(
+                        order=order, event_type='created', payload={'items': len(order_lines), 'version': 1},
+                        month=month_bucket(order.created_at), created_at=order.created_at,
+                    ))
+                    if order.status != 'pending':
+                        events.append(OrderEvent(
+                            order=order, event_type='status',
+                            payload={'from': 'pending', 'to': order.status, 'version': 2},
+                            month=month_bucket(order.updated_at), created_at=order.updated_at,
+                        ))
+                OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+                OrderEvent.objects.bulk_create(events, batch_size=self.batch_size)
+
+            created_orders += len(orders)
+            created_items += len(items)
+            self.log(f'{created_orders}/{total_orders} orders, {created_items} items')
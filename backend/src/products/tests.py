@@ -1,3 +1,124 @@
-from django.test import TestCase
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.test import TestCase, override_settings
+from rest_framework import serializers
+from rest_framework.test import APIClient
+
+from users.models import CustomUser
+from . import uploads
+from .models import Product
+
+PNG = b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR'
+
+
+class ClientError(Exception):
+    pass
+
+
+class FakeS3Storage:
+    """The parts of core.s3.HashedS3Storage the upload flow uses, with a mocked S3 client"""
+    bucket_name = 'media-bucket'
+    location = 'media'
+    object_parameters = {'CacheControl': 'public, max-age=31536000, immutable'}
+
+    def __init__(self):
+        self.client = mock.Mock()
+        self.client.exceptions.ClientError = ClientError
+        self.client.generate_presigned_post.side_effect = lambda **kwargs: {
+            'url': 'https://s3.example.com/media-bucket', 'fields': {**kwargs['Fields'], 'key': kwargs['Key']},
+        }
+        self.uploaded(PNG, 'image/png')
+
+    def key_for(self, name):
+        return f'{self.location}/{name}'
+
+    def uploaded(self, data, content_type, size=None):
+        self.client.head_object.return_value = {'ContentLength': size or len(data), 'ContentType': content_type}
+        self.client.get_object.return_value = {'Body': mock.Mock(read=mock.Mock(return_value=data[:16]))}
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class DirectImageUploadTests(TestCase):
+    def setUp(self):
+        self.storage = FakeS3Storage()
+        patcher = mock.patch.object(uploads, 'default_storage', self.storage)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        self.product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=10)
+
+    def presign(self, user=None, filename='seeds.png', content_type='image/png'):
+        return uploads.presign_image_upload(user or self.manager, filename, content_type)
+
+    def test_presigned_post_restricts_type_and_size(self):
+        upload = self.presign()
+        call = self.storage.client.generate_presigned_post.call_args.kwargs
+        self.assertEqual(call['Bucket'], 'media-bucket')
+        self.assertEqual(call['Key'], f"media/{upload['name']}")
+        self.assertRegex(upload['name'], r'^products/[0-9a-f]{16}\.[0-9a-f]{12}\.png$')
+        self.assertIn({'Content-Type': 'image/png'}, call['Conditions'])
+        self.assertIn(['content-length-range', 1, 5242880], call['Conditions'])
+        self.assertIn({'Cache-Control': 'public, max-age=31536000, immutable'}, call['Conditions'])
+        self.assertEqual(call['ExpiresIn'], 600)
+        self.assertEqual(upload['fields']['Content-Type'], 'image/png')
+
+    def test_presign_rejects_mismatched_extension(self):
+        with self.assertRaises(serializers.ValidationError):
+            self.presign(filename='seeds.exe', content_type='image/png')
+        with self.assertRaises(serializers.ValidationError):
+            self.presign(filename='seeds.png', content_type='image/jpeg')
+        self.storage.client.generate_presigned_post.assert_not_called()
+
+    def test_verified_upload_returns_its_name(self):
+        upload = self.presign()
+        self.assertEqual(uploads.verify_image_upload(self.manager, upload['upload_token']), upload['name'])
+        self.assertEqual(self.storage.client.get_object.call_args.kwargs['Range'], 'bytes=0-15')
+
+    def test_bad_or_foreign_token_is_rejected(self):
+        upload = self.presign()
+        other = CustomUser.objects.create_user(username='other', password='secret', role='MANAGER')
+        with self.assertRaisesMessage(serializers.ValidationError, 'Invalid or expired upload token'):
+            uploads.verify_image_upload(self.manager, upload['upload_token'] + 'x')
+        with self.assertRaisesMessage(serializers.ValidationError, 'Upload token was issued to another user'):
+            uploads.verify_image_upload(other, upload['upload_token'])
+        self.storage.client.head_object.assert_not_called()
+
+    def test_missing_object_is_rejected(self):
+        upload = self.presign()
+        self.storage.client.head_object.side_effect = ClientError('404')
+        with self.assertRaisesMessage(serializers.ValidationError, 'Upload not found'):
+            uploads.verify_image_upload(self.manager, upload['upload_token'])
+
+    def test_oversized_object_is_rejected(self):
+        upload = self.presign()
+        self.storage.uploaded(PNG, 'image/png', size=5242881)
+        with self.assertRaisesMessage(serializers.ValidationError, 'maximum file size'):
+            uploads.verify_image_upload(self.manager, upload['upload_token'])
+
+    def test_content_type_or_signature_mismatch_is_rejected(self):
+        upload = self.presign()
+        self.storage.uploaded(PNG, 'text/html')
+        with self.assertRaisesMessage(serializers.ValidationError, 'not the declared image type'):
+            uploads.verify_image_upload(self.manager, upload['upload_token'])
+        self.storage.uploaded(b'<html><script>', 'image/png')
+        with self.assertRaisesMessage(serializers.ValidationError, 'not the declared image type'):
+            uploads.verify_image_upload(self.manager, upload['upload_token'])
+
+    def test_attach_image_points_product_at_upload(self):
+        client = APIClient()
+        client.force_login(self.manager)
+        response = client.post('/api/products/image_upload/', {'filename': 'seeds.png', 'content_type': 'image/png'})
+        self.assertEqual(response.status_code, 201)
+        name = response.json()['name']
+        response = client.post(
+            f'/api/products/{self.product.pk}/attach_image/', {'upload_token': response.json()['upload_token']}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.image.name, name)
+
+    def test_direct_uploads_need_s3_storage(self):
+        with mock.patch.object(uploads, 'default_storage', object()):
+            with self.assertRaisesMessage(serializers.ValidationError, 'MEDIA_BUCKET'):
+                self.presign()
@@ -0,0 +1,109 @@
+"""
+Direct product image uploads.
+
+With S3-compatible media storage the browser uploads image bytes straight to
+the bucket:
+
+1. POST /api/products/image_upload/ {filename, content_type} returns a
+   presigned POST (url + form fields) for a fresh key and a signed
+   upload_token. The POST policy restricts the content type and size, so S3
+   rejects anything else.
+2. The client posts the file to `url` with `fields`.
+3. POST /api/products/{id}/attach_image/ {upload_token} checks the object
+   (size, content type, image signature) and points Product.image at it.
+
+No image bytes pass through the app servers.
+"""
+import os
+import secrets
+
+from django.conf import settings
+from django.core import signing
+from django.core.files.storage import default_storage
+from rest_framework import serializers
+
+TOKEN_SALT = 'products.image-upload'
+CONTENT_TYPES = {
+    'image/jpeg': ('.jpg', '.jpeg'),
+    'image/png': ('.png',),
+    'image/webp': ('.webp',),
+}
+
+
+def direct_uploads_enabled():
+    return hasattr(default_storage, 'bucket_name')
+
+
+def image_matches(content_type, head):
+    if content_type == 'image/jpeg':
+        return head.startswith(b'\xff\xd8\xff')
+    if content_type == 'image/png':
+        return head.startswith(b'\x89PNG\r\n\x1a\n')
+    if content_type == 'image/webp':
+        return head[:4] == b'RIFF' and head[8:12] == b'WEBP'
+    return False
+
+
+def presign_image_upload(user, filename, content_type):
+    if not direct_uploads_enabled():
+        raise serializers.ValidationError('Direct uploads need S3 media storage (MEDIA_BUCKET)')
+    ext = os.path.splitext(filename or '')[1].lower()
+    if ext not in CONTENT_TYPES.get(content_type, ()):
+        raise serializers.ValidationError('Upload a jpg, jpeg, png or webp image with a matching content type')
+
+    # A random component in the hashed-name format keeps the key unique and
+    # immutable, so it is cached like content-hashed uploads
+    name = f'products/{secrets.token_hex(8)}.{secrets.token_hex(6)}{ext}'
+    storage = default_storage
+    cache_control = storage.object_parameters.get('CacheControl')
+    fields = {'Content-Type': content_type}
+    conditions = [
+        {'Content-Type': content_type},
+        ['content-length-range', 1, settings.PRODUCT_IMAGE_MAX_SIZE],
+    ]
+    if cache_control:
+        fields['Cache-Control'] = cache_control
+        conditions.append({'Cache-Control': cache_control})
+    post = storage.client.generate_presigned_post(
+        Bucket=storage.bucket_name,
+        Key=storage.key_for(name),
+        Fields=fields,
+        Conditions=conditions,
+        ExpiresIn=settings.PRODUCT_IMAGE_UPLOAD_EXPIRES,
+    )
+    token = signing.dumps({'name': name, 'user': user.pk, 'content_type': content_type}, salt=TOKEN_SALT)
+    return {
+        'url': post['url'],
+        'fields': post['fields'],
+        'name': name,
+        'upload_token': token,
+        'expires_in': settings.PRODUCT_IMAGE_UPLOAD_EXPIRES,
+    }
+
+
+def verify_image_upload(user, token):
+    """Return the storage name of a completed upload, or raise ValidationError"""
+    if not direct_uploads_enabled():
+        raise serializers.ValidationError('Direct uploads need S3 media storage (MEDIA_BUCKET)')
+
+    try:
+        upload = signing.loads(token or '', salt=TOKEN_SALT, max_age=settings.PRODUCT_IMAGE_UPLOAD_EXPIRES * 2)
+    except signing.BadSignature:
+        raise serializers.ValidationError('Invalid or expired upload token')
+    if upload['user'] != user.pk:
+        raise serializers.ValidationError('Upload token was issued to another user')
+
+    storage = default_storage
+    key = storage.key_for(upload['name'])
+    try:
+        head = storage.client.head_object(Bucket=storage.bucket_name, Key=key)
+        first_bytes = storage.client.get_object(
+            Bucket=storage.bucket_name, Key=key, Range='bytes=0-15'
+        )['Body'].read()
+    except storage.client.exceptions.ClientError:
+        raise serializers.ValidationError('Upload not found; post the file before attaching it')
+    if head['ContentLength'] > settings.PRODUCT_IMAGE_MAX_SIZE:
+        raise serializers.ValidationError('The maximum file size that can be uploaded is 5MB')
+    if head.get('ContentType') != upload['content_type'] or not image_matches(upload['content_type'], first_bytes):
+        raise serializers.ValidationError('Uploaded file is not the declared image type')
+    return upload['name']
@@ -4,11 +4,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from .models import Product
 from .serializers import ProductSerializer
+from .uploads import presign_image_upload, verify_image_upload
+from core.db_router import ReplicaReadMixin
 
 # Create your views here.
 
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
+    replica_actions = ('list', 'retrieve', 'low_stock', 'stats')
     serializer_class = ProductSerializer
     filter_backends = [filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['name', 'description']
@@ -16,7 +19,7 @@ class ProductViewSet(viewsets.ModelViewSet):
     ordering = ['-created_at']
 
     def get_permissions(self):
-        if self.action in ['create', 'update', 'partial_update', 'destroy', 'update_stock']:
+        if self.action in ['create', 'update', 'partial_update', 'destroy', 'update_stock', 'image_upload', 'attach_image']:
             # Only managers can modify products
             if self.request.user.is_authenticated and self.request.user.role == 'MANAGER':
                 return [permissions.IsAuthenticated()]
@@ -77,6 +80,21 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+    @action(detail=False, methods=['post'])
+    def image_upload(self, request):
+        """Presigned POST for uploading a product image straight to media storage"""
+        upload = presign_image_upload(request.user, request.data.get('filename'), request.data.get('content_type'))
+        return Response(upload, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def attach_image(self, request, pk=None):
+        """Use a completed direct upload (see image_upload) as the product image"""
+        product = self.get_object()
+        product.image.name = verify_image_upload(request.user, request.data.get('upload_token'))
+        product.save(update_fields=['image', 'updated_at'])
+        serializer = self.get_serializer(product)
+        return Response(serializer.data)
+
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
         """Get products with stock below 10 units"""
@@ -0,0 +1,3 @@
+"""
+Server-sent events for order status and cart stock changes
+"""
@@ -0,0 +1,165 @@
+"""
+Pub/sub fan-out for server-sent events.
+
+MemoryBroker delivers within one process (e.g. a single uvicorn worker
+serving both the API and the stream). RedisBroker uses Redis pub/sub so
+events published by any gunicorn/uvicorn worker reach every subscriber:
+each process holds one pub/sub connection, subscribed to the union of its
+subscribers' channels, and fans incoming messages out to their queues.
+"""
+import asyncio
+import json
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class MemorySubscription:
+    def __init__(self, broker, channels):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.REALTIME_QUEUE_SIZE)
+
+    def deliver(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            logger.warning("Dropping realtime event for slow subscriber on %s", self.channels)
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+    async def close(self):
+        await self.broker.unsubscribe(self)
+
+
+class MemoryBroker:
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channels, event):
+        self._deliver(channels, json.dumps(event, cls=DjangoJSONEncoder))
+
+    def _deliver(self, channels, message):
+        with self._lock:
+            targets = {sub for channel in channels for sub in self._subscribers.get(channel, ())}
+        for sub in targets:
+            sub.loop.call_soon_threadsafe(sub.deliver, message)
+
+    async def subscribe(self, channels):
+        subscription = MemorySubscription(self, channels)
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscription)
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        self._remove(subscription)
+
+    def _remove(self, subscription):
+        """Drop a subscription; returns the channels left without subscribers."""
+        emptied = []
+        with self._lock:
+            for channel in subscription.channels:
+                self._subscribers[channel].discard(subscription)
+                if not self._subscribers[channel]:
+                    del self._subscribers[channel]
+                    emptied.append(channel)
+        return emptied
+
+
+class RedisBroker(MemoryBroker):
+    prefix = 'realtime:'
+
+    def __init__(self):
+        import redis
+
+        super().__init__()
+        self.url = settings.REDIS_URL
+        self.client = redis.Redis.from_url(self.url)
+        self._pubsub = None
+        self._listener = None
+        self._redis_channels = set()
+        self._redis_lock = asyncio.Lock()
+
+    def publish(self, channels, event):
+        message = json.dumps(event, cls=DjangoJSONEncoder)
+        pipe = self.client.pipeline(transaction=False)
+        for channel in channels:
+            pipe.publish(self.prefix + channel, message)
+        pipe.execute()
+
+    async def subscribe(self, channels):
+        # Registered locally first, so a concurrent unsubscribe sees the channel in use
+        subscription = await super().subscribe(channels)
+        async with self._redis_lock:
+            new = [channel for channel in channels if channel not in self._redis_channels]
+            if new:
+                pubsub = self._connect()
+                await pubsub.subscribe(*[self.prefix + channel for channel in new])
+                self._redis_channels.update(new)
+            if self._listener is None or self._listener.done():
+                self._listener = asyncio.create_task(self._listen())
+        return subscription
+
+    async def unsubscribe(self, subscription):
+        emptied = self._remove(subscription)
+        if not emptied:
+            return
+        async with self._redis_lock:
+            with self._lock:
+                unused = [channel for channel in emptied if channel not in self._subscribers]
+            unused = [channel for channel in unused if channel in self._redis_channels]
+            if unused:
+                self._redis_channels.difference_update(unused)
+                await self._pubsub.unsubscribe(*[self.prefix + channel for channel in unused])
+
+    def _connect(self):
+        if self._pubsub is None:
+            import redis.asyncio
+
+            self._pubsub = redis.asyncio.Redis.from_url(self.url).pubsub()
+        return self._pubsub
+
+    async def _listen(self):
+        """Fan messages from the shared connection out to this process' subscribers."""
+        while True:
+            try:
+                message = await self._pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # redis-py reconnects and resubscribes on the next read
+                logger.exception("Realtime pub/sub connection failed, retrying")
+                await asyncio.sleep(1)
+                continue
+            if message is None or message['type'] != 'message':
+                continue
+            channel, data = message['channel'], message['data']
+            channel = channel.decode() if isinstance(channel, bytes) else channel
+            data = data.decode() if isinstance(data, bytes) else data
+            self._deliver([channel[len(self.prefix):]], data)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.REALTIME_BROKER)()
+    return _broker
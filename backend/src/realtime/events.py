@@ -0,0 +1,71 @@
+"""
+Event publishing. Channels mirror the role rules used by the order and cart
+views: a user's own channel, plus a shared channel for managers.
+"""
+import logging
+
+from django.db import transaction
+
+from shopping_cart.engine import users_holding
+from users.models import EmployeeCustomerAssignment
+from .broker import get_broker
+
+logger = logging.getLogger(__name__)
+
+MANAGERS_CHANNEL = 'role:MANAGER'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def channels_for_user(user):
+    """Channels a user subscribes to."""
+    channels = [user_channel(user.id)]
+    if user.role == 'MANAGER':
+        channels.append(MANAGERS_CHANNEL)
+    return channels
+
+
+def publish(channels, event):
+    """Publish once the current transaction commits, so subscribers never see rolled-back state."""
+    def send():
+        try:
+            get_broker().publish(channels, event)
+        except Exception:
+            logger.exception("Failed to publish realtime event %s", event.get('type'))
+    transaction.on_commit(send)
+
+
+def publish_order_status(orders):
+    """Publish status events for a batch of orders with one recipient query."""
+    orders = list(orders)
+    if not orders:
+        return
+    employees = {}
+    for employee_id, customer_id in EmployeeCustomerAssignment.objects.filter(
+        customer_id__in={order.user_id for order in orders}
+    ).values_list('employee_id', 'customer_id'):
+        employees.setdefault(customer_id, []).append(employee_id)
+
+    for order in orders:
+        recipients = [order.user_id] + employees.get(order.user_id, [])
+        publish([MANAGERS_CHANNEL] + [user_channel(user_id) for user_id in recipients], {
+            'type': 'order.status',
+            'order_id': order.id,
+            'user_id': order.user_id,
+            'status': order.status,
+            'updated_at': order.updated_at,
+        })
+
+
+def publish_product_stock(product):
+    """Tell users holding the product in their cart about a stock or availability change."""
+    channels = [user_channel(user_id) for user_id in sorted(users_holding(product.id))]
+    if channels:
+        publish(channels, {
+            'type': 'product.stock',
+            'product_id': product.id,
+            'stock': product.stock,
+            'is_active': product.is_active,
+        })
@@ -0,0 +1,34 @@
+from django.db.models.signals import post_init, post_save
+from django.dispatch import receiver
+from orders.models import Order
+from orders.signals import orders_transitioned
+from products.models import Product
+from .events import publish_order_status, publish_product_stock
+
+@receiver(post_init, sender=Order)
+def remember_order_status(sender, instance, **kwargs):
+    instance._published_status = instance.__dict__.get('status')
+
+@receiver(post_save, sender=Order)
+def order_saved(sender, instance, created, **kwargs):
+    if created or instance.status != instance._published_status:
+        publish_order_status([instance])
+        instance._published_status = instance.status
+
+@receiver(orders_transitioned, sender=Order)
+def orders_transitioned_handler(sender, orders, **kwargs):
+    # Transitions are conditional queryset updates, so post_save does not fire
+    publish_order_status(orders)
+    for order in orders:
+        order._published_status = order.status
+
+@receiver(post_init, sender=Product)
+def remember_product_stock(sender, instance, **kwargs):
+    instance._published_stock = (instance.__dict__.get('stock'), instance.__dict__.get('is_active'))
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, **kwargs):
+    state = (instance.stock, instance.is_active)
+    if not created and state != instance._published_stock:
+        publish_product_stock(instance)
+        instance._published_stock = state
@@ -0,0 +1,72 @@
+import json
+from decimal import Decimal
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from products.models import Product
+from shopping_cart.engine import CartEngine
+from shopping_cart.models import Cart
+from users.models import CustomUser
+from . import events
+from .broker import MemoryBroker
+
+
+@override_settings(CART_WRITE_BEHIND=True, CART_FLUSH_OPS=20, CART_FLUSH_SECONDS=60)
+class ProductStockEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.product = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=50)
+        self.carts = [
+            Cart.objects.create(user=CustomUser.objects.create_user(username=f'customer{number}', password='secret'))
+            for number in range(3)
+        ]
+        patcher = mock.patch.object(events, 'get_broker')
+        self.broker = patcher.start().return_value
+        self.addCleanup(patcher.stop)
+
+    def published_channels(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.stock = 7
+            self.product.save()
+        return [call.args[0] for call in self.broker.publish.call_args_list]
+
+    def test_unflushed_and_flushed_lines_are_notified(self):
+        flushed, unflushed, _ = self.carts
+        engine = CartEngine(flushed)
+        engine.apply([(self.product.pk, 1, 'add')])
+        engine.flush()
+        CartEngine(unflushed).apply([(self.product.pk, 2, 'add')])
+
+        channels = self.published_channels()
+        self.assertEqual(channels, [[events.user_channel(flushed.user_id), events.user_channel(unflushed.user_id)]])
+        self.assertEqual(self.broker.publish.call_args.args[1]['stock'], 7)
+
+    def test_line_removed_but_not_flushed_is_not_notified(self):
+        cart = self.carts[0]
+        engine = CartEngine(cart)
+        engine.apply([(self.product.pk, 1, 'add')])
+        engine.flush()
+        engine.apply([(self.product.pk, 0, 'put')])
+        self.assertEqual(self.published_channels(), [])
+
+    def test_product_in_no_cart_publishes_nothing(self):
+        self.assertEqual(self.published_channels(), [])
+
+
+class MemoryBrokerTests(TestCase):
+    async def test_events_reach_subscribers_of_their_channels(self):
+        broker = MemoryBroker()
+        customer = await broker.subscribe(['user:1'])
+        manager = await broker.subscribe(['user:2', 'role:MANAGER'])
+
+        broker.publish(['user:1', 'role:MANAGER'], {'type': 'order.status', 'order_id': 5})
+        self.assertEqual(json.loads(await customer.get(timeout=1))['order_id'], 5)
+        self.assertEqual(json.loads(await manager.get(timeout=1))['order_id'], 5)
+        self.assertIsNone(await manager.get(timeout=0.01))
+
+        await customer.close()
+        broker.publish(['user:1'], {'type': 'order.status', 'order_id': 6})
+        self.assertIsNone(await customer.get(timeout=0.01))
+        self.assertEqual(dict(broker._subscribers).keys(), {'user:2', 'role:MANAGER'})
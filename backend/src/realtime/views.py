@@ -0,0 +1,48 @@
+import logging
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+
+from .broker import get_broker
+from .events import channels_for_user
+
+logger = logging.getLogger(__name__)
+
+
+async def event_stream(subscription):
+    yield f"retry: {settings.REALTIME_RETRY_MS}\n\n"
+    try:
+        while True:
+            message = await subscription.get(timeout=settings.REALTIME_HEARTBEAT_SECONDS)
+            if message is None:
+                # Comment line keeps proxies and load balancers from closing the connection
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {message}\n\n"
+    finally:
+        await subscription.close()
+
+
+async def events_view(request):
+    """
+    Server-Sent Events stream of order status changes (own orders for
+    customers, assigned customers' orders for employees, all orders for
+    managers) and stock changes for products in the user's cart.
+
+    Must be served by an ASGI server (the gunicorn-events service with
+    GUNICORN_PROFILE=uvicorn). Under WSGI Django would buffer the endless
+    stream in memory and pin a worker per client, so it is refused there.
+    """
+    if not isinstance(request, ASGIRequest):
+        return JsonResponse({'detail': 'The event stream is only served by the ASGI events service.'}, status=501)
+
+    user = await request.auser()
+    if not user.is_authenticated:
+        return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+
+    subscription = await get_broker().subscribe(channels_for_user(user))
+    response = StreamingHttpResponse(event_stream(subscription), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # disable nginx buffering for this response
+    return response
@@ -0,0 +1,387 @@
+"""
+Write-behind cart engine.
+
+The working cart (product id -> quantity) lives in the cache keyed by user.
+Mutations are validated against a single product query, applied to the
+cached state and only written to shopping_cart_cartitem when enough changes
+have accumulated, when the oldest unflushed change is too old, or when the
+cart is cleared / checked out. With CART_WRITE_BEHIND disabled the same
+engine writes through to the database on every mutation.
+
+Carts that are not mutated again are written by `manage.py flush_carts`,
+which the flush-carts systemd timer runs every minute (see
+scripts/setup_ec2.sh). Until then their cached state is stored without an
+expiry, so it can neither time out nor be evicted under Redis'
+volatile-* policies before it reaches the database.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import serializers
+
+from core.metrics import CACHE_REQUESTS, CART_MUTATIONS, ORDERS_CREATED
+from orders.models import Order, OrderEvent
+from products.models import Product
+from products.serializers import ProductSerializer
+from .models import Cart, CartItem
+
+logger = logging.getLogger(__name__)
+
+DIRTY_INDEX_KEY = 'cart:dirty'
+
+
+def cart_key(user_id):
+    return f'cart:{user_id}'
+
+
+class DirtyIndex:
+    """
+    Ids of carts with unflushed changes. With the Redis cache this is a Redis
+    set, so marking a cart is one SADD and never contends with other carts.
+    Other caches (per-process, development only) keep a locked list.
+    """
+
+    def _client(self):
+        backend = getattr(cache, '_cache', None)
+        return backend.get_client(write=True) if hasattr(backend, 'get_client') else None
+
+    def add(self, cart_id):
+        client = self._client()
+        if client is not None:
+            client.sadd(cache.make_key(DIRTY_INDEX_KEY), cart_id)
+            return
+        with cache_lock(DIRTY_INDEX_KEY):
+            dirty = cache.get(DIRTY_INDEX_KEY) or []
+            if cart_id not in dirty:
+                dirty.append(cart_id)
+                cache.set(DIRTY_INDEX_KEY, dirty, None)
+
+    def discard(self, cart_id):
+        client = self._client()
+        if client is not None:
+            client.srem(cache.make_key(DIRTY_INDEX_KEY), cart_id)
+            return
+        with cache_lock(DIRTY_INDEX_KEY):
+            dirty = cache.get(DIRTY_INDEX_KEY) or []
+            if cart_id in dirty:
+                dirty.remove(cart_id)
+                cache.set(DIRTY_INDEX_KEY, dirty, None)
+
+    def members(self):
+        client = self._client()
+        if client is not None:
+            return [int(cart_id) for cart_id in client.smembers(cache.make_key(DIRTY_INDEX_KEY))]
+        return list(cache.get(DIRTY_INDEX_KEY) or [])
+
+
+dirty_index = DirtyIndex()
+
+
+class CartError(Exception):
+    pass
+
+
+class CartItemNotFound(CartError):
+    pass
+
+
+@contextmanager
+def cache_lock(name, timeout=5, wait=2.0):
+    """Best-effort mutual exclusion across workers using cache.add()."""
+    key = f'lock:{name}'
+    deadline = time.monotonic() + wait
+    while not cache.add(key, 1, timeout):
+        if time.monotonic() > deadline:
+            raise CartError('Cart is busy, please retry')
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        cache.delete(key)
+
+
+class CartEngine:
+    def __init__(self, cart):
+        self.cart = cart
+        self.write_behind = getattr(settings, 'CART_WRITE_BEHIND', False)
+        self.key = cart_key(cart.user_id)
+
+    # State handling
+
+    def _load_from_db(self):
+        lines = {}
+        for item in CartItem.objects.filter(cart=self.cart).values('id', 'product_id', 'quantity', 'created_at', 'updated_at'):
+            lines[str(item['product_id'])] = {
+                'id': item['id'],
+                'quantity': item['quantity'],
+                'created_at': item['created_at'].isoformat(),
+                'updated_at': item['updated_at'].isoformat(),
+            }
+        return {'lines': lines, 'ops': 0, 'since': None}
+
+    def _load(self):
+        if not self.write_behind:
+            self._state = self._load_from_db()
+            return self._state
+        state = cache.get(self.key)
+        CACHE_REQUESTS.inc('cart', 'miss' if state is None else 'hit')
+        if state is None:
+            state = self._load_from_db()
+            cache.set(self.key, state, settings.CART_CACHE_TTL)
+        self._state = state
+        return state
+
+    def _store(self, state):
+        self._state = state
+        if self.write_behind:
+            # Unflushed changes must outlive the cache TTL until flush_carts runs
+            cache.set(self.key, state, None if state['ops'] else settings.CART_CACHE_TTL)
+
+    def lines(self):
+        state = getattr(self, '_state', None) or self._load()
+        return state['lines']
+
+    # Mutations
+
+    def apply(self, changes):
+        """
+        Apply a list of (product_id, quantity, mode) changes atomically. Modes:
+        'add' increments, 'set' overwrites an existing line, 'put' overwrites
+        or creates a line and 'remove' deletes one. A quantity of 0 or less
+        with 'set' or 'put' removes the line.
+        """
+        with cache_lock(self.key):
+            state = self._load()
+            lines = state['lines']
+            product_ids = {product_id for product_id, _, mode in changes if mode != 'remove'}
+            products = Product.objects.in_bulk(product_ids) if product_ids else {}
+            now = timezone.now().isoformat()
+
+            for product_id, quantity, mode in changes:
+                key = str(product_id)
+                if mode in ('set', 'remove') and key not in lines:
+                    raise CartItemNotFound('Item not found in cart')
+                if mode == 'remove' or quantity <= 0:
+                    lines.pop(key, None)
+                    continue
+
+                product = products.get(product_id)
+                if product is None:
+                    raise CartError('Product not found')
+                if not product.is_active:
+                    raise CartError('This product is not available')
+                new_quantity = quantity + (lines[key]['quantity'] if mode == 'add' and key in lines else 0)
+                if product.stock < new_quantity:
+                    raise CartError(f'Not enough stock. Available: {product.stock}')
+
+                line = lines.setdefault(key, {'id': None, 'created_at': now})
+                line['quantity'] = new_quantity
+                line['updated_at'] = now
+
+            state['ops'] += 1
+            state['since'] = state['since'] or time.time()
+            CART_MUTATIONS.inc('write_behind' if self.write_behind else 'write_through')
+            if self._should_flush(state):
+                self._flush(state)
+            else:
+                self._store(state)
+                self._mark_dirty()
+            self._products = products
+            return state['lines']
+
+    def clear(self):
+        with cache_lock(self.key):
+            CartItem.objects.filter(cart=self.cart).delete()
+            state = {'lines': {}, 'ops': 0, 'since': None}
+            self._store(state)
+            return state['lines']
+
+    def checkout(self, actor, **order_fields):
+        """
+        Turn the cart into an order in one transaction: lock the cart and its
+        products, validate every line with one query, create the order and
+        its items set-based and empty the cart. Raises CartError if the cart
+        is empty or any line is no longer available.
+        """
+        with cache_lock(self.key):
+            lines = self._load()['lines']
+            if not lines:
+                raise CartError('Your cart is empty')
+            quantities = {int(key): line['quantity'] for key, line in lines.items()}
+
+            with transaction.atomic():
+                # Serialises concurrent checkouts and edits of this cart
+                Cart.objects.select_for_update().filter(pk=self.cart.pk).first()
+                products = {
+                    product.pk: product
+                    for product in Product.objects.select_for_update().filter(pk__in=quantities).order_by('pk')
+                }
+                problems = []
+                for product_id, quantity in quantities.items():
+                    product = products.get(product_id)
+                    if product is None or not product.is_active:
+                        problems.append(f'Product {product_id} is not available')
+                    elif product.stock < quantity:
+                        problems.append(f'Not enough stock for {product.name}. Available: {product.stock}')
+                if problems:
+                    raise CartError('; '.join(problems))
+
+                order = Order.create_with_items(
+                    sorted(quantities.items()), products,
+                    user=self.cart.user, created_by_role=actor.role, **order_fields
+                )
+                OrderEvent.record(order, 'created', actor, {
+                    'items': len(quantities), 'version': order.version, 'source': 'checkout',
+                })
+                CartItem.objects.filter(cart=self.cart).delete()
+
+            self._store({'lines': {}, 'ops': 0, 'since': None})
+        ORDERS_CREATED.inc(actor.role)
+        return order
+
+    # Persistence
+
+    def _should_flush(self, state):
+        if not self.write_behind:
+            return True
+        return (state['ops'] >= settings.CART_FLUSH_OPS
+                or time.time() - state['since'] >= settings.CART_FLUSH_SECONDS)
+
+    def flush(self):
+        with cache_lock(self.key):
+            state = self._load()
+            if state['ops']:
+                self._flush(state)
+            # Under the cart lock, so no mutation can mark the cart in between
+            dirty_index.discard(self.cart.id)
+            return state['lines']
+
+    def _flush(self, state):
+        """Write the difference between the cached lines and the table in one batch."""
+        lines = state['lines']
+        existing = {item.product_id: item for item in CartItem.objects.filter(cart=self.cart)}
+        to_create, to_update = [], []
+        for key, line in lines.items():
+            product_id = int(key)
+            item = existing.pop(product_id, None)
+            if item is None:
+                to_create.append(CartItem(cart=self.cart, product_id=product_id, quantity=line['quantity']))
+            elif item.quantity != line['quantity']:
+                item.quantity = line['quantity']
+                item.updated_at = parse_datetime(line['updated_at'])
+                to_update.append(item)
+
+        with transaction.atomic():
+            if existing:
+                CartItem.objects.filter(id__in=[item.id for item in existing.values()]).delete()
+            if to_update:
+                CartItem.objects.bulk_update(to_update, ['quantity', 'updated_at'])
+            if to_create:
+                CartItem.objects.bulk_create(to_create)
+
+        if to_create:
+            created = CartItem.objects.filter(
+                cart=self.cart, product_id__in=[item.product_id for item in to_create]
+            ).values_list('product_id', 'id', 'created_at')
+            for product_id, item_id, created_at in created:
+                lines[str(product_id)].update(id=item_id, created_at=created_at.isoformat())
+
+        logger.debug("Flushed cart %s after %s ops", self.cart.id, state['ops'])
+        state['ops'] = 0
+        state['since'] = None
+        self._store(state)
+
+    def _mark_dirty(self):
+        dirty_index.add(self.cart.id)
+
+    # Representation
+
+    def to_representation(self, request=None):
+        """Render the cached cart in the same shape as CartSerializer."""
+        lines = self.lines()
+        products = getattr(self, '_products', {})
+        missing = {int(key) for key in lines} - set(products)
+        if missing:
+            products = {**products, **Product.objects.in_bulk(missing)}
+        deleted = [product_id for product_id in missing if product_id not in products]
+        if deleted:
+            # Products deleted since they were added; drop their lines
+            self.apply([(product_id, 0, 'put') for product_id in deleted])
+            lines = self.lines()
+
+        decimal = serializers.DecimalField(max_digits=10, decimal_places=2)
+        datetime = serializers.DateTimeField()
+        product_serializer = ProductSerializer(context={'request': request})
+        items = []
+        total = 0
+        for key, line in sorted(lines.items(), key=lambda entry: entry[1]['created_at'], reverse=True):
+            product = products[int(key)]
+            line_total = product.price * line['quantity']
+            total += line_total
+            items.append({
+                'id': line['id'],
+                'product': product_serializer.to_representation(product),
+                'quantity': line['quantity'],
+                'total': decimal.to_representation(line_total),
+                'created_at': datetime.to_representation(parse_datetime(line['created_at'])),
+                'updated_at': datetime.to_representation(parse_datetime(line['updated_at'])),
+            })
+
+        return {
+            'id': self.cart.id,
+            'username': self.cart.user.username,
+            'items': items,
+            'total': decimal.to_representation(total),
+            'created_at': datetime.to_representation(self.cart.created_at),
+            'updated_at': datetime.to_representation(self.cart.updated_at),
+        }
+
+
+def flush_dirty_carts():
+    """
+    Flush every cart with unwritten changes. Returns the number flushed. A
+    cart is only removed from the dirty index once its flush succeeded, so a
+    failing cart is logged and retried on the next run.
+    """
+    dirty = dirty_index.members()
+    carts = Cart.objects.filter(id__in=dirty).select_related('user')
+    flushed = 0
+    for cart in carts:
+        try:
+            CartEngine(cart).flush()
+        except Exception:
+            logger.exception("Failed to flush cart %s", cart.id)
+        else:
+            flushed += 1
+    for cart_id in set(dirty) - {cart.id for cart in carts}:
+        dirty_index.discard(cart_id)  # cart deleted since it was marked
+    return flushed
+
+
+def users_holding(product_id):
+    """
+    Ids of users with the product in their cart, including lines not yet
+    flushed. Dirty carts are answered from their cached state, which is
+    newer than their rows; every other cart from shopping_cart_cartitem.
+    """
+    dirty = dict(Cart.objects.filter(id__in=dirty_index.members()).values_list('user_id', 'id'))
+    states = cache.get_many([cart_key(user_id) for user_id in dirty]) if dirty else {}
+    user_ids = set()
+    cached_carts = []
+    for user_id, cart_id in dirty.items():
+        state = states.get(cart_key(user_id))
+        if state is not None:
+            cached_carts.append(cart_id)
+            if str(product_id) in state['lines']:
+                user_ids.add(user_id)
+    user_ids.update(
+        CartItem.objects.filter(product_id=product_id).exclude(cart_id__in=cached_carts)
+        .values_list('cart__user_id', flat=True)
+    )
+    return user_ids
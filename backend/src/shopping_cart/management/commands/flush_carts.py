@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from shopping_cart.engine import flush_dirty_carts
+
+class Command(BaseCommand):
+    help = 'Writes cached cart changes to the database (run every minute by the flush-carts timer when CART_WRITE_BEHIND is on)'
+
+    def handle(self, *args, **kwargs):
+        flushed = flush_dirty_carts()
+        self.stdout.write(self.style.SUCCESS(f'Flushed {flushed} carts'))
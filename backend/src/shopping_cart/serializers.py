@@ -43,4 +43,46 @@ class CartSerializer(serializers.ModelSerializer):
     class Meta:
         model = Cart
         fields = ['id', 'username', 'items', 'total', 'created_at', 'updated_at']
-        read_only_fields = ['created_at', 'updated_at'] 
\ No newline at end of file
+        read_only_fields = ['created_at', 'updated_at']
+
+class CartLineChangeSerializer(serializers.Serializer):
+    """A single cart line change; a quantity of 0 or less removes the line."""
+    product_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(default=1)
+
+class AddCartItemSerializer(CartLineChangeSerializer):
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+class BulkCartUpdateSerializer(serializers.Serializer):
+    items = CartLineChangeSerializer(many=True, allow_empty=False)
+
+class CheckoutSerializer(serializers.Serializer):
+    """Order details for turning the cart into an order; the lines come from the cart."""
+    shipping_address = serializers.CharField(required=False, allow_blank=True)
+    payment_deadline = serializers.IntegerField(min_value=1, max_value=30, default=7)
+    location_state = serializers.CharField(required=False, allow_blank=True)
+    location_display_name = serializers.CharField(required=False, allow_blank=True)
+    location_latitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+    location_longitude = serializers.DecimalField(max_digits=9, decimal_places=6, required=False, allow_null=True)
+
+    def validate(self, data):
+        request = self.context['request']
+        cart_user = self.context['cart_user']
+
+        # Same rule as creating an order directly: staff record where they are
+        if request.user.role in ['MANAGER', 'EMPLOYEE']:
+            location_fields = [
+                'location_state', 'location_display_name',
+                'location_latitude', 'location_longitude'
+            ]
+            missing_fields = [field for field in location_fields if not data.get(field)]
+            if missing_fields:
+                raise serializers.ValidationError({
+                    field: ["This field is required for employees and managers."]
+                    for field in missing_fields
+                })
+
+        data['shipping_address'] = data.get('shipping_address') or cart_user.address or ''
+        if not data['shipping_address']:
+            raise serializers.ValidationError({'shipping_address': ["This field is required."]})
+        return data
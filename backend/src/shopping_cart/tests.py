@@ -1,3 +1,192 @@
-from django.test import TestCase
+import time
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from orders.models import Order, OrderEvent
+from products.models import Product
+from users.models import CustomUser
+from .engine import CartEngine, CartError, dirty_index, flush_dirty_carts
+from .models import Cart, CartItem
+
+
+class CartEngineTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        self.cart = Cart.objects.create(user=self.user)
+        self.seeds = Product.objects.create(name='Seeds', price=Decimal('10.00'), stock=50)
+        self.tools = Product.objects.create(name='Tools', price=Decimal('99.00'), stock=5)
+
+    def stored(self, cart=None):
+        return dict(CartItem.objects.filter(cart=cart or self.cart).values_list('product_id', 'quantity'))
+
+
+@override_settings(CART_WRITE_BEHIND=False)
+class WriteThroughTests(CartEngineTestCase):
+    def test_every_mutation_is_written(self):
+        engine = CartEngine(self.cart)
+        engine.apply([(self.seeds.pk, 2, 'add')])
+        engine.apply([(self.seeds.pk, 3, 'add'), (self.tools.pk, 1, 'put')])
+        self.assertEqual(self.stored(), {self.seeds.pk: 5, self.tools.pk: 1})
+        self.assertIsNone(cache.get(engine.key))
+        self.assertEqual(dirty_index.members(), [])
+
+    def test_invalid_change_writes_nothing(self):
+        engine = CartEngine(self.cart)
+        with self.assertRaisesMessage(CartError, 'Not enough stock. Available: 5'):
+            engine.apply([(self.seeds.pk, 1, 'add'), (self.tools.pk, 6, 'add')])
+        self.assertEqual(self.stored(), {})
+
+
+@override_settings(CART_WRITE_BEHIND=True, CART_FLUSH_OPS=3, CART_FLUSH_SECONDS=60)
+class WriteBehindTests(CartEngineTestCase):
+    def test_changes_stay_in_cache_until_ops_threshold(self):
+        engine = CartEngine(self.cart)
+        engine.apply([(self.seeds.pk, 1, 'add')])
+        engine.apply([(self.seeds.pk, 1, 'add')])
+        self.assertEqual(self.stored(), {})
+        self.assertEqual(CartEngine(self.cart).lines()[str(self.seeds.pk)]['quantity'], 2)
+        self.assertEqual(dirty_index.members(), [self.cart.pk])
+
+        engine.apply([(self.tools.pk, 1, 'put')])
+        self.assertEqual(self.stored(), {self.seeds.pk: 2, self.tools.pk: 1})
+        self.assertEqual(cache.get(engine.key)['ops'], 0)
+
+    def test_old_changes_flush_on_next_mutation(self):
+        engine = CartEngine(self.cart)
+        engine.apply([(self.seeds.pk, 1, 'add')])
+        state = cache.get(engine.key)
+        state['since'] = time.time() - 61
+        cache.set(engine.key, state)
+        CartEngine(self.cart).apply([(self.tools.pk, 1, 'add')])
+        self.assertEqual(self.stored(), {self.seeds.pk: 1, self.tools.pk: 1})
+
+    def test_unflushed_state_does_not_expire(self):
+        engine = CartEngine(self.cart)
+        with mock.patch.object(cache, 'set', wraps=cache.set) as cache_set:
+            engine.apply([(self.seeds.pk, 1, 'add')])
+            engine.flush()
+        timeouts = [call.args[2] for call in cache_set.call_args_list if call.args[0] == engine.key]
+        self.assertEqual(timeouts[-2:], [None, settings.CART_CACHE_TTL])
+
+    def test_flush_writes_diff_and_clears_index(self):
+        CartItem.objects.create(cart=self.cart, product=self.tools, quantity=2)
+        engine = CartEngine(self.cart)
+        engine.apply([(self.tools.pk, 0, 'set'), (self.seeds.pk, 4, 'put')])
+        self.assertEqual(self.stored(), {self.tools.pk: 2})
+        engine.flush()
+        self.assertEqual(self.stored(), {self.seeds.pk: 4})
+        self.assertEqual(dirty_index.members(), [])
+
+    def test_flush_dirty_carts_retries_failed_carts(self):
+        other = Cart.objects.create(user=CustomUser.objects.create_user(username='other', password='secret'))
+        CartEngine(self.cart).apply([(self.seeds.pk, 1, 'add')])
+        CartEngine(other).apply([(self.seeds.pk, 2, 'add')])
+        original = CartEngine._flush
+
+        def fail_for_first_cart(engine, state):
+            if engine.cart.pk == self.cart.pk:
+                raise RuntimeError('database unavailable')
+            return original(engine, state)
+
+        with mock.patch.object(CartEngine, '_flush', fail_for_first_cart):
+            self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(self.stored(other), {self.seeds.pk: 2})
+        self.assertEqual(dirty_index.members(), [self.cart.pk])
+
+        self.assertEqual(flush_dirty_carts(), 1)
+        self.assertEqual(self.stored(), {self.seeds.pk: 1})
+        self.assertEqual(dirty_index.members(), [])
+
+    def test_flush_dirty_carts_forgets_deleted_carts(self):
+        CartEngine(self.cart).apply([(self.seeds.pk, 1, 'add')])
+        self.cart.delete()
+        self.assertEqual(flush_dirty_carts(), 0)
+        self.assertEqual(dirty_index.members(), [])
+
+    def test_deleted_product_lines_are_dropped(self):
+        engine = CartEngine(self.cart)
+        engine.apply([(self.seeds.pk, 1, 'add'), (self.tools.pk, 1, 'add')])
+        self.tools.delete()
+        representation = CartEngine(self.cart).to_representation()
+        self.assertEqual([item['product']['id'] for item in representation['items']], [self.seeds.pk])
+        self.assertEqual(representation['total'], '10.00')
+
+
+@override_settings(
+    CART_WRITE_BEHIND=True, CART_FLUSH_OPS=20,
+    THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}},
+)
+class CheckoutTests(CartEngineTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.force_login(self.user)
+
+    def checkout(self, **body):
+        return self.client.post('/api/shopping-cart/checkout/', {'shipping_address': 'Farm road 1', **body}, format='json')
+
+    def test_empty_cart_is_rejected(self):
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'Your cart is empty')
+        self.assertFalse(Order.objects.exists())
+
+    def test_inactive_product_is_rejected(self):
+        CartEngine(self.cart).apply([(self.seeds.pk, 2, 'add')])
+        Product.objects.filter(pk=self.seeds.pk).update(is_active=False)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], f'Product {self.seeds.pk} is not available')
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(list(CartEngine(self.cart).lines()), [str(self.seeds.pk)])
+
+    def test_insufficient_stock_is_rejected(self):
+        CartEngine(self.cart).apply([(self.tools.pk, 5, 'add')])
+        Product.objects.filter(pk=self.tools.pk).update(stock=3)
+        response = self.checkout()
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['detail'], 'Not enough stock for Tools. Available: 3')
+        self.assertFalse(Order.objects.exists())
+
+    def test_checkout_places_order_and_empties_cart(self):
+        engine = CartEngine(self.cart)
+        engine.apply([(self.seeds.pk, 2, 'add')])
+        engine.flush()
+        engine.apply([(self.tools.pk, 1, 'add')])  # still only in the cache
+
+        response = self.checkout()
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(response.json()['id'], order.pk)
+        self.assertEqual(response['ETag'], '"1"')
+        self.assertEqual(order.total_amount, Decimal('119.00'))
+        self.assertEqual(
+            dict(order.items.values_list('product_id', 'quantity')), {self.seeds.pk: 2, self.tools.pk: 1}
+        )
+        self.assertEqual(OrderEvent.objects.filter(order=order, event_type='created').count(), 1)
+        self.assertEqual(self.stored(), {})
+        self.assertEqual(cache.get(engine.key)['lines'], {})
+        self.assertEqual(CartEngine(self.cart).lines(), {})
+
+    def test_staff_must_record_location(self):
+        manager = CustomUser.objects.create_user(username='manager', password='secret', role='MANAGER')
+        CartEngine(self.cart).apply([(self.seeds.pk, 1, 'add')])
+        self.client.force_login(manager)
+        response = self.client.post(
+            f'/api/shopping-cart/checkout/?user_id={self.user.pk}', {'shipping_address': 'Farm road 1'}, format='json'
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('location_state', response.json())
+
+    def test_unassigned_employee_cannot_check_out(self):
+        employee = CustomUser.objects.create_user(username='employee', password='secret', role='EMPLOYEE')
+        CartEngine(self.cart).apply([(self.seeds.pk, 1, 'add')])
+        self.client.force_login(employee)
+        response = self.client.post(f'/api/shopping-cart/checkout/?user_id={self.user.pk}', {}, format='json')
+        self.assertEqual(response.status_code, 403)
@@ -3,10 +3,14 @@ from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework import serializers
-from users.models import CustomUser
+from users.models import CustomUser, EmployeeCustomerAssignment
 from .models import Cart, CartItem
-from .serializers import CartSerializer, CartItemSerializer
+from .serializers import CartSerializer, CartLineChangeSerializer, AddCartItemSerializer, BulkCartUpdateSerializer, CheckoutSerializer
+from .engine import CartEngine, CartError, CartItemNotFound
 from products.models import Product
+from idempotency.decorators import idempotent
+from orders.serializers import OrderSerializer
+from orders.views import order_etag
 
 class CartViewSet(viewsets.GenericViewSet):
     permission_classes = [permissions.IsAuthenticated]
@@ -55,6 +59,7 @@ class CartViewSet(viewsets.GenericViewSet):
             
             # Use get_or_create to handle race conditions
             cart, created = Cart.objects.get_or_create(user=user)
+            cart.user = user
             return cart
             
         except serializers.ValidationError as e:
@@ -76,8 +81,7 @@ class CartViewSet(viewsets.GenericViewSet):
                 )
             
             cart = self.get_or_create_cart()
-            serializer = self.get_serializer(cart)
-            return Response(serializer.data)
+            return Response(CartEngine(cart).to_representation(request))
         except serializers.ValidationError as e:
             return Response(
                 {'detail': str(e)},
@@ -89,105 +93,100 @@ class CartViewSet(viewsets.GenericViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-    @action(detail=False, methods=['post'])
-    def add_item(self, request):
+    def apply_changes(self, changes, error_message):
+        """Apply line changes through the cart engine and return the updated cart."""
         try:
-            cart = self.get_or_create_cart()
-            serializer = CartItemSerializer(data=request.data)
-            
-            if serializer.is_valid():
-                product_id = serializer.validated_data['product_id']
-                quantity = serializer.validated_data.get('quantity', 1)
-                
-                # Use get_or_create to handle race conditions
-                cart_item, created = CartItem.objects.get_or_create(
-                    cart=cart,
-                    product_id=product_id,
-                    defaults={'quantity': quantity}
-                )
-                
-                if not created:
-                    # If item exists, update quantity
-                    cart_item.quantity += quantity
-                    cart_item.save()
-                
-                # Return updated cart data
-                cart_serializer = self.get_serializer(cart)
-                return Response(cart_serializer.data)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            engine = CartEngine(self.get_or_create_cart())
+            engine.apply(changes)
+            return Response(engine.to_representation(self.request))
+        except CartItemNotFound as e:
+            return Response({'detail': str(e)}, status=status.HTTP_404_NOT_FOUND)
+        except CartError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except serializers.ValidationError as e:
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
-                {'detail': f'Error processing cart item: {str(e)}'},
+                {'detail': f'{error_message}: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
     @action(detail=False, methods=['post'])
+    @idempotent
+    def add_item(self, request):
+        serializer = AddCartItemSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        return self.apply_changes([(data['product_id'], data['quantity'], 'add')], 'Error processing cart item')
+
+    @action(detail=False, methods=['post'])
+    @idempotent
     def update_item(self, request):
-        try:
-            cart = self.get_or_create_cart()
-            product_id = request.data.get('product_id')
-            quantity = request.data.get('quantity', 1)
-            
-            try:
-                cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-                if quantity <= 0:
-                    cart_item.delete()
-                else:
-                    cart_item.quantity = quantity
-                    cart_item.save()
-                
-                cart_serializer = self.get_serializer(cart)
-                return Response(cart_serializer.data)
-            except CartItem.DoesNotExist:
-                return Response(
-                    {'detail': 'Item not found in cart'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
-        except serializers.ValidationError as e:
-            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            return Response(
-                {'detail': f'Error updating cart item: {str(e)}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        serializer = CartLineChangeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        return self.apply_changes([(data['product_id'], data['quantity'], 'set')], 'Error updating cart item')
 
     @action(detail=False, methods=['post'])
+    @idempotent
     def remove_item(self, request):
+        serializer = CartLineChangeSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return self.apply_changes([(serializer.validated_data['product_id'], 0, 'remove')], 'Error removing cart item')
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def update_cart(self, request):
+        """Apply a list of {product_id, quantity} line changes at once (quantity 0 removes the line)"""
+        serializer = BulkCartUpdateSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        changes = [(line['product_id'], line['quantity'], 'put') for line in serializer.validated_data['items']]
+        return self.apply_changes(changes, 'Error updating cart')
+
+    @action(detail=False, methods=['post'])
+    @idempotent
+    def clear(self, request):
         try:
-            cart = self.get_or_create_cart()
-            product_id = request.data.get('product_id')
-            
-            try:
-                cart_item = CartItem.objects.get(cart=cart, product_id=product_id)
-                cart_item.delete()
-                cart_serializer = self.get_serializer(cart)
-                return Response(cart_serializer.data)
-            except CartItem.DoesNotExist:
-                return Response(
-                    {'detail': 'Item not found in cart'},
-                    status=status.HTTP_404_NOT_FOUND
-                )
+            engine = CartEngine(self.get_or_create_cart())
+            engine.clear()
+            return Response(engine.to_representation(request))
         except serializers.ValidationError as e:
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
-                {'detail': f'Error removing cart item: {str(e)}'},
+                {'detail': f'Error clearing cart: {str(e)}'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
     @action(detail=False, methods=['post'])
-    def clear(self, request):
+    @idempotent
+    def checkout(self, request):
+        """Place an order for the cart contents and empty the cart, in one transaction"""
         try:
             cart = self.get_or_create_cart()
-            cart.items.all().delete()
-            cart_serializer = self.get_serializer(cart)
-            return Response(cart_serializer.data)
         except serializers.ValidationError as e:
             return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
-        except Exception as e:
-            return Response(
-                {'detail': f'Error clearing cart: {str(e)}'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+
+        if cart.user != request.user:
+            if cart.user.role != 'CUSTOMER':
+                return Response({'detail': 'Can only check out carts of customers'}, status=status.HTTP_400_BAD_REQUEST)
+            if request.user.role == 'EMPLOYEE' and not EmployeeCustomerAssignment.objects.filter(
+                employee=request.user, customer=cart.user
+            ).exists():
+                return Response({'detail': 'You are not assigned to this customer'}, status=status.HTTP_403_FORBIDDEN)
+
+        serializer = CheckoutSerializer(data=request.data, context={'request': request, 'cart_user': cart.user})
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            order = CartEngine(cart).checkout(request.user, **serializer.validated_data)
+        except CartError as e:
+            return Response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(
+            OrderSerializer(order, context={'request': request}).data,
+            status=status.HTTP_201_CREATED, headers={'ETag': order_etag(order)}
+        )
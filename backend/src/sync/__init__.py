@@ -0,0 +1,3 @@
+"""
+Delta sync API for offline-first clients
+"""
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.15 on 2026-10-18 23:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('collection', models.CharField(choices=[('products', 'Products'), ('customers', 'Customers'), ('orders', 'Orders')], max_length=20)),
+                ('object_id', models.BigIntegerField()),
+                ('scope_user_id', models.BigIntegerField(blank=True, null=True)),
+                ('deleted_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['collection', 'id'], name='sync_tombst_collect_0d9f1f_idx')],
+            },
+        ),
+    ]
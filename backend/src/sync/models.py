@@ -0,0 +1,26 @@
+from django.db import models
+
+class Tombstone(models.Model):
+    """
+    Records a row that left a sync collection, so clients holding it can drop it.
+    scope_user_id limits the tombstone to one user (e.g. an employee whose
+    customer was unassigned); null means it applies to everyone.
+    """
+    COLLECTIONS = [
+        ('products', 'Products'),
+        ('customers', 'Customers'),
+        ('orders', 'Orders'),
+    ]
+
+    collection = models.CharField(max_length=20, choices=COLLECTIONS)
+    object_id = models.BigIntegerField()
+    scope_user_id = models.BigIntegerField(null=True, blank=True)
+    deleted_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['collection', 'id']),
+        ]
+
+    def __str__(self):
+        return f"{self.collection} {self.object_id} deleted at {self.deleted_at}"
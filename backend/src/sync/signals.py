@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+from orders.models import ArchivedOrder, Order
+from products.models import Product
+from users.models import CustomUser, EmployeeCustomerAssignment
+from .models import Tombstone
+
+@receiver(post_delete, sender=EmployeeCustomerAssignment)
+def customer_unassigned(sender, instance, **kwargs):
+    # The employee loses the customer and every order of that customer
+    Tombstone.objects.create(collection='customers', object_id=instance.customer_id, scope_user_id=instance.employee_id)
+    Tombstone.objects.bulk_create([
+        Tombstone(collection='orders', object_id=order_id, scope_user_id=instance.employee_id)
+        for order_id in Order.objects.filter(user_id=instance.customer_id).values_list('id', flat=True).iterator()
+    ])
+
+@receiver(post_delete, sender=CustomUser)
+def customer_deleted(sender, instance, **kwargs):
+    if instance.role == 'CUSTOMER':
+        Tombstone.objects.create(collection='customers', object_id=instance.id)
+
+@receiver(post_delete, sender=Order)
+def order_deleted(sender, instance, **kwargs):
+    # Archived orders moved to cold storage; clients keep them
+    if not ArchivedOrder.objects.filter(order_id=instance.id).exists():
+        Tombstone.objects.create(collection='orders', object_id=instance.id)
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    Tombstone.objects.create(collection='products', object_id=instance.id)
@@ -0,0 +1,89 @@
+from decimal import Decimal
+
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from orders.models import Order
+from products.models import Product
+from users.models import CustomUser, EmployeeCustomerAssignment
+
+
+@override_settings(THROTTLE_RATES={'auth': {}, 'batch': {}, 'read': {}, 'write': {}})
+class SyncTests(TestCase):
+    def setUp(self):
+        self.products = [
+            Product.objects.create(name=f'Product {number}', price=Decimal('10.00'), stock=10)
+            for number in range(3)
+        ]
+        self.client = APIClient()
+
+    def sync(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['collections']
+
+    def test_pages_through_changes_with_cursor(self):
+        customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        first = self.sync(customer, collections='products', limit=2)['products']
+        self.assertEqual([row['id'] for row in first['changed']], [product.pk for product in self.products[:2]])
+        self.assertTrue(first['has_more'])
+
+        second = self.sync(customer, collections='products', limit=2, products_since=first['next_since'])['products']
+        self.assertEqual([row['id'] for row in second['changed']], [self.products[2].pk])
+        self.assertFalse(second['has_more'])
+
+        unchanged = self.sync(customer, collections='products', products_since=second['next_since'])['products']
+        self.assertEqual((unchanged['changed'], unchanged['deleted']), ([], []))
+        self.assertEqual(unchanged['next_since'], second['next_since'])
+
+    def test_deleted_and_deactivated_rows_are_reported(self):
+        customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        cursor = self.sync(customer, collections='products')['products']['next_since']
+        deleted, deactivated = self.products[0].pk, self.products[1]
+        self.products[0].delete()
+        deactivated.is_active = False
+        deactivated.save()
+
+        page = self.sync(customer, collections='products', products_since=cursor)['products']
+        self.assertEqual(page['changed'], [])
+        self.assertEqual(sorted(page['deleted']), sorted([deleted, deactivated.pk]))
+
+    def test_invalid_cursor_is_rejected(self):
+        customer = CustomUser.objects.create_user(username='customer', password='secret', role='CUSTOMER')
+        self.client.force_login(customer)
+        response = self.client.get('/api/sync/', {'products_since': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_unassigned_customer_and_orders_are_removed_for_that_employee_only(self):
+        employee = CustomUser.objects.create_user(username='employee', password='secret', role='EMPLOYEE')
+        colleague = CustomUser.objects.create_user(username='colleague', password='secret', role='EMPLOYEE')
+        customer = CustomUser.objects.create_user(
+            username='customer', password='secret', role='CUSTOMER', is_approved=True
+        )
+        product = self.products[0]
+        order = Order.create_with_items([(product.pk, 1)], {product.pk: product}, user=customer, shipping_address='Farm')
+        assignment = EmployeeCustomerAssignment.objects.create(employee=employee, customer=customer)
+        EmployeeCustomerAssignment.objects.create(employee=colleague, customer=customer)
+
+        initial = self.sync(employee, collections='customers,orders')
+        self.assertEqual([row['id'] for row in initial['orders']['changed']], [order.pk])
+        cursors = {f'{name}_since': initial[name]['next_since'] for name in ('customers', 'orders')}
+        colleague_cursors = {
+            f'{name}_since': page['next_since']
+            for name, page in self.sync(colleague, collections='customers,orders').items()
+        }
+
+        assignment.delete()
+        page = self.sync(employee, collections='customers,orders', **cursors)
+        self.assertEqual(page['customers']['deleted'], [customer.pk])
+        self.assertEqual(page['orders']['deleted'], [order.pk])
+        colleague_page = self.sync(colleague, collections='customers,orders', **colleague_cursors)
+        self.assertEqual((colleague_page['customers']['deleted'], colleague_page['orders']['deleted']), ([], []))
+
+        # Assigned again: the orders come back as changes after the tombstones
+        cursors = {f'{name}_since': page[name]['next_since'] for name in ('customers', 'orders')}
+        EmployeeCustomerAssignment.objects.create(employee=employee, customer=customer)
+        page = self.sync(employee, collections='customers,orders', **cursors)
+        self.assertEqual([row['id'] for row in page['orders']['changed']], [order.pk])
+        self.assertEqual(page['orders']['deleted'], [])
@@ -0,0 +1,6 @@
+from django.urls import path
+from .views import sync_view
+
+urlpatterns = [
+    path('', sync_view, name='sync'),
+]
@@ -0,0 +1,195 @@
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.db.models import F, Max, OuterRef, Q, Subquery
+from django.db.models.functions import Greatest
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from orders.models import Order
+from orders.serializers import OrderSerializer
+from products.models import Product
+from products.serializers import ProductSerializer
+from users.models import CustomUser, EmployeeCustomerAssignment
+from users.serializers import UserUpdateSerializer
+from .models import Tombstone
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class Cursor:
+    """
+    High-water mark for one collection: the (sync_at, id) of the last row
+    sent plus the id of the last tombstone sent, serialized as
+    "<iso timestamp>|<id>|<tombstone id>".
+    """
+
+    def __init__(self, timestamp=None, object_id=0, tombstone_id=0):
+        self.timestamp = timestamp
+        self.object_id = object_id
+        self.tombstone_id = tombstone_id
+
+    @classmethod
+    def parse(cls, value):
+        try:
+            timestamp, object_id, tombstone_id = value.split('|')
+            parsed = parse_datetime(timestamp) if timestamp else None
+            if timestamp and parsed is None:
+                raise ValueError
+            return cls(parsed, int(object_id), int(tombstone_id))
+        except ValueError:
+            raise InvalidCursor(value)
+
+    def __str__(self):
+        # UTC with a "Z" suffix keeps the cursor safe to pass unescaped in a URL
+        timestamp = self.timestamp.astimezone(dt_timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ') if self.timestamp else ''
+        return f"{timestamp}|{self.object_id}|{self.tombstone_id}"
+
+
+def keyset_page(queryset, cursor, limit):
+    """Rows changed after the cursor, ordered by (sync_at, sync_id)."""
+    if cursor.timestamp is not None:
+        queryset = queryset.filter(
+            Q(sync_at__gt=cursor.timestamp) | Q(sync_at=cursor.timestamp, sync_id__gt=cursor.object_id)
+        )
+    rows = list(queryset.order_by('sync_at', 'sync_id')[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def tombstone_page(name, user, cursor, limit):
+    tombstones = Tombstone.objects.filter(collection=name, id__gt=cursor.tombstone_id).filter(
+        Q(scope_user_id__isnull=True) | Q(scope_user_id=user.id)
+    ).order_by('id').values_list('id', 'object_id')
+    rows = list(tombstones[:limit + 1])
+    return rows[:limit], len(rows) > limit
+
+
+def products_source(user, initial):
+    queryset = Product.objects.annotate(sync_at=F('updated_at'), sync_id=F('id'))
+    if user.role == 'MANAGER':
+        return queryset, lambda product: product, lambda product: True
+    if initial:
+        queryset = queryset.filter(is_active=True)
+    return queryset, lambda product: product, lambda product: product.is_active
+
+
+def customers_source(user, initial):
+    def is_live(customer):
+        return customer.is_active and customer.is_approved
+
+    if user.role == 'EMPLOYEE':
+        queryset = EmployeeCustomerAssignment.objects.filter(employee=user).select_related('customer').annotate(
+            sync_at=Greatest('assigned_at', 'customer__updated_at'), sync_id=F('customer_id')
+        )
+        if initial:
+            queryset = queryset.filter(customer__is_active=True, customer__is_approved=True)
+        return queryset, lambda assignment: assignment.customer, is_live
+
+    queryset = CustomUser.objects.filter(role='CUSTOMER').annotate(sync_at=F('updated_at'), sync_id=F('id'))
+    if initial:
+        queryset = queryset.filter(is_active=True, is_approved=True)
+    return queryset, lambda customer: customer, is_live
+
+
+def orders_source(user, initial):
+    queryset = Order.objects.select_related('user').prefetch_related('items', 'items__product')
+    if user.role == 'EMPLOYEE':
+        # An order becomes visible when its customer is assigned, so the
+        # assignment time counts as a change too
+        assignments = EmployeeCustomerAssignment.objects.filter(employee=user)
+        queryset = queryset.filter(user_id__in=assignments.values('customer_id')).annotate(
+            assigned_at=Subquery(assignments.filter(customer=OuterRef('user_id')).values('assigned_at')[:1])
+        ).annotate(sync_at=Greatest('updated_at', 'assigned_at'), sync_id=F('id'))
+    else:
+        if user.role != 'MANAGER':
+            queryset = queryset.filter(user=user)
+        queryset = queryset.annotate(sync_at=F('updated_at'), sync_id=F('id'))
+    return queryset, lambda order: order, lambda order: True
+
+
+COLLECTIONS = {
+    'products': (products_source, ProductSerializer, ['CUSTOMER', 'EMPLOYEE', 'MANAGER']),
+    'customers': (customers_source, UserUpdateSerializer, ['EMPLOYEE', 'MANAGER']),
+    'orders': (orders_source, OrderSerializer, ['CUSTOMER', 'EMPLOYEE', 'MANAGER']),
+}
+
+
+def sync_collection(request, name, cursor, limit):
+    source, serializer_class, _ = COLLECTIONS[name]
+    initial = cursor is None
+    queryset, to_object, is_live = source(request.user, initial)
+
+    if initial:
+        # A first sync only needs live rows; later tombstones start from here
+        last_tombstone = Tombstone.objects.filter(collection=name).aggregate(last=Max('id'))['last'] or 0
+        cursor = Cursor(tombstone_id=last_tombstone)
+        tombstones, more_tombstones = [], False
+    else:
+        tombstones, more_tombstones = tombstone_page(name, request.user, cursor, limit)
+
+    rows, more_rows = keyset_page(queryset, cursor, limit)
+    changed, deleted = [], [object_id for _, object_id in tombstones]
+    for row in rows:
+        obj = to_object(row)
+        if is_live(obj):
+            changed.append(obj)
+        else:
+            deleted.append(obj.id)
+
+    next_cursor = Cursor(
+        rows[-1].sync_at if rows else cursor.timestamp,
+        rows[-1].sync_id if rows else cursor.object_id,
+        tombstones[-1][0] if tombstones else cursor.tombstone_id,
+    )
+    return {
+        'changed': serializer_class(changed, many=True, context={'request': request}).data,
+        'deleted': deleted,
+        'next_since': str(next_cursor),
+        'has_more': more_rows or more_tombstones,
+    }
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_view(request):
+    """
+    Return rows changed since each collection's high-water mark, plus ids of
+    rows deleted or no longer visible, in one response (compressed by
+    core.compression.CompressionMiddleware).
+
+    Query params: `collections` (comma-separated, defaults to all allowed for
+    the role), `<collection>_since` (the `next_since` of the previous sync,
+    omit for a full download) and `limit` (rows per collection).
+    Clients should apply `deleted` before `changed`, and repeat the call
+    while any collection reports `has_more`.
+    """
+    allowed = [name for name, (_, _, roles) in COLLECTIONS.items() if request.user.role in roles]
+    requested = request.query_params.get('collections')
+    names = [name for name in requested.split(',') if name in allowed] if requested else allowed
+
+    default_limit = getattr(settings, 'SYNC_PAGE_SIZE', 500)
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', default_limit)), default_limit))
+    except ValueError:
+        return Response({'limit': ['A valid integer is required']}, status=status.HTTP_400_BAD_REQUEST)
+
+    server_time = timezone.now()
+    collections = {}
+    for name in names:
+        since = request.query_params.get(f'{name}_since')
+        try:
+            cursor = Cursor.parse(since) if since else None
+        except InvalidCursor:
+            return Response({f'{name}_since': ['Invalid sync cursor']}, status=status.HTTP_400_BAD_REQUEST)
+        collections[name] = sync_collection(request, name, cursor, limit)
+
+    return Response({
+        'server_time': server_time,
+        'collections': collections,
+    })
@@ -13,6 +13,8 @@ import logging
 from django.db.models import Count, Sum
 from orders.models import Order
 from products.models import Product
+from core.db_router import ReplicaReadMixin, read_from_replica
+from core.log import log_event
 
 logger = logging.getLogger(__name__)
 
@@ -107,8 +109,9 @@ def logout_view(request):
     return Response({'detail': 'Successfully logged out'})
 
 @method_decorator(ensure_csrf_cookie, name='dispatch')
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ReplicaReadMixin, viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
+    replica_actions = ('stats',)
     
     def get_serializer_class(self):
         if self.action in ['create']:
@@ -166,13 +169,9 @@ class UserViewSet(viewsets.ModelViewSet):
         return Response(serializer.data)
 
     def list(self, request, *args, **kwargs):
-        logger.debug(f"List method called by user: {request.user.username}")
-        logger.debug(f"Request headers: {request.headers}")
-        logger.debug(f"Query params: {request.query_params}")
-        
         # Allow managers and employees to list customers
         if request.user.role not in ['MANAGER', 'EMPLOYEE']:
-            logger.debug(f"Permission denied: user role is {request.user.role}")
+            logger.debug("User list denied for %s (role %s)", request.user.username, request.user.role)
             return Response(
                 {"detail": "You do not have permission to perform this action."},
                 status=status.HTTP_403_FORBIDDEN
@@ -180,28 +179,22 @@ class UserViewSet(viewsets.ModelViewSet):
         
         # Get base queryset
         queryset = CustomUser.objects.filter(is_active=True)
-        logger.debug(f"Base queryset count: {queryset.count()}")
         
         # Filter by role if specified
         role = request.query_params.get('role')
         if role:
-            logger.debug(f"Filtering by role: {role}")
             if role.upper() == 'CUSTOMER':
                 # For customers, ensure they are approved
                 queryset = queryset.filter(
                     role__in=['CUSTOMER', 'Customer', 'customer'],
                     is_approved=True
                 )
-                logger.debug(f"Approved customers count: {queryset.count()}")
-                logger.debug(f"SQL Query: {queryset.query}")
             else:
                 # For other roles, just filter by role
                 queryset = queryset.filter(role__iexact=role)
-                logger.debug(f"Users with role {role} count: {queryset.count()}")
         
-        # Log the results
-        logger.debug(f"Final queryset count: {queryset.count()}")
-        logger.debug(f"Found users: {[f'{user.username} ({user.role})' for user in queryset]}")
+        # The count is only queried when DEBUG logging is enabled
+        log_event(logger, logging.DEBUG, 'users.listed', user=request.user.username, role=role, count=queryset.count)
         
         serializer = self.get_serializer(queryset, many=True)
         return Response(serializer.data)
@@ -235,15 +228,16 @@ def get_user_stats(request):
     """Get statistics for the authenticated user."""
     user = request.user
     
-    # Get order stats
-    orders = Order.objects.filter(user=user)
-    total_orders = orders.count()
-    total_spent = orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
-    
-    # Get product stats if user is staff
-    total_products = 0
-    if user.is_staff:
-        total_products = Product.objects.count()
+    with read_from_replica(request):
+        # Get order stats
+        orders = Order.objects.filter(user=user)
+        total_orders = orders.count()
+        total_spent = orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0
+        
+        # Get product stats if user is staff
+        total_products = 0
+        if user.is_staff:
+            total_products = Product.objects.count()
     
     return Response({
         'total_orders': total_orders,
@@ -15,7 +15,7 @@ python manage.py migrate
 python manage.py collectstatic --noinput
 
 # Restart gunicorn
-sudo systemctl restart gunicorn
+sudo systemctl restart gunicorn gunicorn-events
 
 # Update frontend
 cd ../../frontend
@@ -70,6 +70,51 @@ ExecStart=/home/ubuntu/app/backend/venv/bin/gunicorn --config /home/ubuntu/app/b
 WantedBy=multi-user.target
 EOF
 
+# ASGI service for the /api/events/ stream (nginx proxies it to port 8081).
+# Needs REDIS_URL so events published by the WSGI workers reach it.
+sudo tee /etc/systemd/system/gunicorn-events.service << EOF
+[Unit]
+Description=Gunicorn ASGI daemon for the Django event stream
+After=network.target
+
+[Service]
+User=ubuntu
+Group=www-data
+WorkingDirectory=/home/ubuntu/app/backend/src
+Environment=GUNICORN_PROFILE=uvicorn
+Environment=GUNICORN_BIND=127.0.0.1:8081
+Environment=GUNICORN_WORKERS=2
+ExecStart=/home/ubuntu/app/backend/venv/bin/gunicorn --config /home/ubuntu/app/backend/gunicorn_config.py core.asgi:application
+
+[Install]
+WantedBy=multi-user.target
+EOF
+
+# Write cached cart changes to the database every minute (CART_WRITE_BEHIND)
+sudo tee /etc/systemd/system/flush-carts.service << EOF
+[Unit]
+Description=Flush write-behind carts to the database
+
+[Service]
+Type=oneshot
+User=ubuntu
+Group=www-data
+WorkingDirectory=/home/ubuntu/app/backend/src
+ExecStart=/home/ubuntu/app/backend/venv/bin/python manage.py flush_carts
+EOF
+
+sudo tee /etc/systemd/system/flush-carts.timer << EOF
+[Unit]
+Description=Run flush-carts every minute
+
+[Timer]
+OnBootSec=1min
+OnUnitActiveSec=1min
+
+[Install]
+WantedBy=timers.target
+EOF
+
 # Setup frontend
 cd ../frontend
 # Clear npm cache and install dependencies
@@ -88,5 +133,6 @@ sudo chmod -R 755 /home/ubuntu/app
 
 # Start services
 sudo systemctl daemon-reload
-sudo systemctl start gunicorn
-sudo systemctl enable gunicorn 
\ No newline at end of file
+sudo systemctl start gunicorn gunicorn-events
+sudo systemctl enable gunicorn gunicorn-events
+sudo systemctl enable --now flush-carts.timer 
\ No newline at end of file